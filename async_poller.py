@@ -0,0 +1,235 @@
+"""Асинхронный движок опроса нескольких COM-портов и Unit ID одновременно.
+
+На каждый порт запускается своя независимая задача опроса со своей очередью,
+поэтому медленная линия не задерживает остальные. На одной шине может быть
+несколько приборов (unit_id).
+
+Конфиг может описывать несколько портов:
+
+    "ports": [
+        {"com_port": "COM3", "baudrate": 9600,
+         "units": [{"unit_id": 1, "address": {...}}, {"unit_id": 2, "address": {...}}]},
+        {"com_port": "COM4", "baudrate": 19200, "unit_ids": [1, 2, 3], "address": {...}}
+    ]
+
+Если ключа "ports" нет, используется один порт из com_port/baudrate/unit_id/address.
+Точки из "points"/"points_file" (см. point_table.py) раскладываются по своим
+портам и unit автоматически; настройки таких портов (baudrate, transport,
+max_gap) берутся из записей "ports" без точек:
+
+    "ports": [{"com_port": "COM4", "baudrate": 19200}, {"com_port": "GW1", "transport": {...}}]
+
+Порт, который не удалось открыть, переоткрывается с растущей паузой
+(RECONNECT_DELAY..RECONNECT_MAX), ошибка обработчика значений
+записывается в журнал и не останавливает опрос.
+"""
+
+import asyncio
+import logging
+
+from point_table import compile_points, load_config
+from read_planner import plan_reads, read_plan_async
+from transport import make_client
+from log_pipeline import setup_logging, shutdown_logging
+
+log = logging.getLogger(__name__)
+
+# Пауза перед повторным открытием порта: удваивается до RECONNECT_MAX, с
+RECONNECT_DELAY = 1.0
+RECONNECT_MAX = 30.0
+
+
+def port_configs(cfg):
+    """Возвращает список описаний портов: [{com_port, baudrate, units: [(unit_id, address)]}]"""
+    ports = cfg.get("ports")
+    if (cfg.get("points") or cfg.get("points_file")) and not any(map(_has_points, ports or ())):
+        ports = _ports_from_table(compile_points(cfg), ports or ())
+    if not ports:
+        ports = [{
+            "com_port": cfg.get("com_port", "COM3"),
+            "baudrate": cfg.get("baudrate", 9600),
+            "unit_id": cfg.get("unit_id", 1),
+            "address": cfg.get("address", {}),
+        }]
+
+    result = []
+    for port in ports:
+        units = []
+        if port.get("units"):
+            for unit in port["units"]:
+                units.append((int(unit.get("unit_id", 1)), unit.get("address", {})))
+        elif port.get("unit_ids"):
+            for unit_id in port["unit_ids"]:
+                units.append((int(unit_id), port.get("address", {})))
+        else:
+            units.append((int(port.get("unit_id", cfg.get("unit_id", 1))), port.get("address", {})))
+
+        result.append({
+            "com_port": port.get("com_port", "COM3"),
+            "baudrate": port.get("baudrate", cfg.get("baudrate", 9600)),
+            "max_gap": port.get("max_gap", cfg.get("max_gap", 0)),
+            "transport": port.get("transport", cfg.get("transport")),
+            "units": units,
+        })
+    return result
+
+
+def _has_points(port):
+    return bool(port.get("units") or port.get("unit_ids") or port.get("address"))
+
+
+def _ports_from_table(table, settings=()):
+    """Описания портов из скомпилированной таблицы точек; settings - записи "ports" с настройками портов"""
+    settings = {port.get("com_port"): port for port in settings}
+    ports = []
+    for port_name in table.port_names:
+        units = table.unit_map(port_name)
+        by_unit = {}
+        for key, address in table.address_map(port_name).items():
+            by_unit.setdefault(units[key], {})[key] = address
+        port = dict(settings.get(port_name, {}))
+        port.update({
+            "com_port": port_name,
+            "units": [{"unit_id": unit_id, "address": address} for unit_id, address in by_unit.items()],
+        })
+        ports.append(port)
+    return ports
+
+
+class PortPoller:
+    """Опрос одной шины RS-485: одна задача-производитель и один обработчик очереди"""
+
+    def __init__(self, port_cfg, on_values, interval=2.0, timeout=1):
+        self.port = port_cfg["com_port"]
+        self.port_cfg = port_cfg
+        self.baudrate = port_cfg["baudrate"]
+        self.timeout = timeout
+        self.interval = interval
+        self.on_values = on_values
+        self.plans = [(unit_id, plan_reads(address, max_gap=port_cfg["max_gap"]))
+                      for unit_id, address in port_cfg["units"]]
+        self.queue = asyncio.Queue()
+        self.client = None
+
+    def _make_client(self):
+        gateway = make_client({}, self.port_cfg, sync=False)
+        if gateway is not None:
+            return gateway
+        from pymodbus.client import AsyncModbusSerialClient
+
+        return AsyncModbusSerialClient(
+            port=self.port,
+            stopbits=1,
+            bytesize=8,
+            baudrate=self.baudrate,
+            timeout=self.timeout,
+            retries=1,
+            parity="N"
+        )
+
+    async def submit(self, unit_id, plan):
+        """Ставит чтение плана в очередь порта и ждёт результат"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((unit_id, plan, future))
+        return await future
+
+    async def _schedule(self):
+        """Раз в interval ставит в очередь чтение всех приборов шины"""
+        while True:
+            started = asyncio.get_running_loop().time()
+            for unit_id, plan in self.plans:
+                # Не копим повторные задания, если шина не успевает
+                if self.queue.qsize() < len(self.plans):
+                    await self.queue.put((unit_id, plan, None))
+            elapsed = asyncio.get_running_loop().time() - started
+            await asyncio.sleep(max(0.0, self.interval - elapsed))
+
+    async def _worker(self):
+        """Выполняет задания из очереди строго по одному: шина полудуплексная"""
+        while True:
+            unit_id, plan, future = await self.queue.get()
+            try:
+                if hasattr(self.client, "read_plan"):
+                    # Шлюз Modbus TCP: блоки плана идут конвейером
+                    values = await self.client.read_plan(plan, unit_id)
+                else:
+                    values = await read_plan_async(self.client, plan, unit_id)
+            except Exception as e:
+                if future is not None and not future.done():
+                    future.set_exception(e)
+                continue
+            finally:
+                self.queue.task_done()
+
+            if future is not None:
+                if not future.done():
+                    future.set_result(values)
+                continue
+            try:
+                self.on_values(self.port, unit_id, values)
+            except Exception:
+                # Сбой обработчика не должен останавливать опрос шины
+                log.exception("❌ %s unit %s: ошибка обработки значений", self.port, unit_id)
+
+    async def _connect(self):
+        """Открывает порт, при неудаче повторяет с растущей паузой"""
+        delay = RECONNECT_DELAY
+        while True:
+            self.client = self._make_client()
+            try:
+                connected = await self.client.connect()
+            except Exception as e:
+                log.debug("%s: ошибка подключения: %s", self.port, e)
+                connected = False
+            if connected:
+                return
+            self.client.close()
+            log.error("❌ Ошибка: не удалось открыть COM-порт: %s, повтор через %.0f с", self.port, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX)
+
+    async def run(self):
+        await self._connect()
+        log.info("✅ %s: подключено, приборов на шине: %d", self.port, len(self.plans))
+        try:
+            await asyncio.gather(self._schedule(), self._worker())
+        finally:
+            self.client.close()
+
+
+class PollingEngine:
+    """Запускает по одному PortPoller на каждый порт из конфига"""
+
+    def __init__(self, cfg, on_values, interval=2.0, timeout=1):
+        self.pollers = [PortPoller(port_cfg, on_values, interval, timeout)
+                        for port_cfg in port_configs(cfg)]
+
+    async def run(self):
+        await asyncio.gather(*(poller.run() for poller in self.pollers))
+
+
+def log_values(port, unit_id, values):
+    """Обработчик по умолчанию: прочитанные значения - в журнал"""
+    if not log.isEnabledFor(logging.INFO):
+        return
+    for key, value in values.items():
+        shown = hex(value) if value is not None else "нет ответа"
+        log.info("%s unit %s %s: %s", port, unit_id, key, shown)
+
+
+def main(config_path="config.json"):
+    cfg = load_config(config_path)
+    setup_logging(cfg.get("logging"))
+    engine = PollingEngine(cfg, log_values, interval=cfg.get("interval", 2))
+
+    log.info("=== Асинхронный мониторинг === (CTRL+C для выхода)")
+    try:
+        asyncio.run(engine.run())
+    except KeyboardInterrupt:
+        log.info("Остановлено пользователем.")
+    finally:
+        shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+"""Бенчмарк движков опроса на локальном имитаторе прибора.
+
+Запускает simulator.py в отдельном процессе (TCP на localhost) и прогоняет
+против него движки опроса:
+
+    legacy    - по одному запросу на точку, как в исходных main2/main_nt
+    planner   - блочное чтение через read_planner
+    async     - асинхронный опрос нескольких имитаторов-«линий» параллельно
+    scheduler - EDF-планировщик (scheduler.py): классы точек со своими
+                интервалами, --duration секунд работы run_scheduled
+    gateway   - шлюз Modbus TCP (transport.py): блоки плана конвейером
+                через пул соединений (TCP-сервер pymodbus в имитаторе
+                отвечает только на один запрос в соединении за раз,
+                поэтому по умолчанию --in-flight 1, а параллельность даёт
+                --pool-size)
+
+Для каждого движка и числа точек считаются опросы в секунду, p50/p99
+задержки на регистр, время цикла (для scheduler - пачки наступивших
+точек) и процессорное время на цикл, а также p99 интервала между чтениями
+одной точки по классам (у циклических движков он равен времени цикла) -
+задержка обнаружения изменения. Результаты пишутся в JSON для сравнения
+движков и поиска регрессий:
+
+    python bench.py --points 10,100,1000,5000 --delay 0.002 --output bench_results.json
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import platform
+import socket
+import time
+from datetime import datetime
+
+from pymodbus.client import AsyncModbusTcpClient, ModbusTcpClient
+
+from read_planner import plan_reads, read_plan, read_plan_async
+from scheduler import PollScheduler, point_class, run_scheduled
+from simulator import run_process
+from transport import SyncGatewayClient
+
+BASE_ADDRESS = 40001
+ENGINES = ("legacy", "planner", "async", "scheduler", "gateway")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_addresses(points, spacing=1):
+    """Ключи и адреса точек, как в config.json (типы чередуются)"""
+    kinds = ("fire_zone", "device", "actuator", "security_zone")
+    return {f"{kinds[i % len(kinds)]}_{i}": str(BASE_ADDRESS + i * spacing) for i in range(points)}
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Simulators:
+    """Имитаторы в отдельных процессах, чтобы их CPU не попадал в замер"""
+
+    def __init__(self, count, register_map, delay, error_rate):
+        self.ports = [free_port() for _ in range(count)]
+        self.processes = [
+            multiprocessing.Process(target=run_process,
+                                    args=(register_map, "127.0.0.1", port, delay, error_rate, 0.0),
+                                    daemon=True)
+            for port in self.ports
+        ]
+
+    def __enter__(self):
+        for process in self.processes:
+            process.start()
+        for port in self.ports:
+            self._wait(port)
+        return self
+
+    @staticmethod
+    def _wait(port, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                return
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError(f"Имитатор на порту {port} не запустился")
+
+    def __exit__(self, *exc):
+        for process in self.processes:
+            process.terminate()
+            process.join()
+
+
+class TimedClient:
+    """Обёртка клиента: замеряет задержку каждого запроса и делит её на регистры"""
+
+    def __init__(self, client, stats):
+        self.client = client
+        self.stats = stats
+
+    def read_holding_registers(self, address, count=1, device_id=1):
+        started = time.perf_counter()
+        try:
+            result = self.client.read_holding_registers(address, count=count, device_id=device_id)
+        except Exception:
+            self.stats["exceptions"] += 1
+            raise
+        self.stats["record"](time.perf_counter() - started, count, result)
+        return result
+
+
+class AsyncTimedClient(TimedClient):
+    async def read_holding_registers(self, address, count=1, device_id=1):
+        started = time.perf_counter()
+        try:
+            result = await self.client.read_holding_registers(address, count=count, device_id=device_id)
+        except Exception:
+            self.stats["exceptions"] += 1
+            raise
+        self.stats["record"](time.perf_counter() - started, count, result)
+        return result
+
+
+def new_stats():
+    stats = {"latencies": [], "requests": 0, "registers": 0, "errors": 0, "exceptions": 0}
+
+    def record(elapsed, count, result):
+        stats["requests"] += 1
+        if result is None or result.isError():
+            stats["errors"] += 1
+            return
+        stats["registers"] += count
+        # Каждый регистр блока получен через elapsed после начала запроса
+        stats["latencies"].extend([elapsed] * count)
+
+    stats["record"] = record
+    return stats
+
+
+def run_sync(engine, addresses, port, cycles, max_gap, timeout):
+    stats = new_stats()
+    client = ModbusTcpClient("127.0.0.1", port=port, timeout=timeout, retries=0)
+    client.connect()
+    timed = TimedClient(client, stats)
+
+    if engine == "legacy":
+        plan = plan_reads(addresses, max_gap=0, max_count=1)
+    else:
+        plan = plan_reads(addresses, max_gap=max_gap)
+
+    cycle_times = []
+    cpu_started = time.process_time()
+    for _ in range(cycles):
+        started = time.perf_counter()
+        read_plan(timed, plan)
+        cycle_times.append(time.perf_counter() - started)
+    cpu = time.process_time() - cpu_started
+    client.close()
+    return stats, cycle_times, cpu, len(plan)
+
+
+def run_gateway(addresses, port, cycles, max_gap, timeout, pool_size, max_in_flight):
+    """Конвейерное чтение плана через шлюз; задержка - по каждому блоку"""
+    stats = new_stats()
+    client = SyncGatewayClient("127.0.0.1", port, "tcp", pool_size, timeout, max_in_flight)
+    client.connect()
+    plan = plan_reads(addresses, max_gap=max_gap)
+
+    def observe(address, elapsed, result, error):
+        if error is not None:
+            stats["exceptions"] += 1
+            return
+        stats["record"](elapsed, len(result.registers) if not result.isError() else 0, result)
+
+    cycle_times = []
+    cpu_started = time.process_time()
+    for _ in range(cycles):
+        started = time.perf_counter()
+        client.read_plan(plan, 1, observe)
+        cycle_times.append(time.perf_counter() - started)
+    cpu = time.process_time() - cpu_started
+    client.close()
+    return stats, cycle_times, cpu, len(plan)
+
+
+class _Finished(Exception):
+    """Время замера планировщика вышло"""
+
+
+def run_scheduler(addresses, port, duration, max_gap, timeout):
+    """run_scheduled в течение duration секунд; цикл - одна пачка наступивших точек"""
+    stats = new_stats()
+    client = ModbusTcpClient("127.0.0.1", port=port, timeout=timeout, retries=0)
+    client.connect()
+    timed = TimedClient(client, stats)
+    scheduler = PollScheduler(addresses, max_gap=max_gap)
+    end = time.perf_counter() + duration
+    batch_times = []
+    requests = []
+    last_read = {}
+    intervals = {}
+
+    def sleep(seconds):
+        if time.perf_counter() + seconds >= end:
+            raise _Finished
+        time.sleep(seconds)
+
+    def on_cycle(seconds):
+        batch_times.append(seconds)
+        requests.append(stats["requests"])
+
+    def on_values(values, changed):
+        now = time.perf_counter()
+        for key in values:
+            if key in last_read:
+                intervals.setdefault(scheduler.point_classes[key], []).append(now - last_read[key])
+            last_read[key] = now
+        if now >= end:
+            raise _Finished
+
+    cpu_started = time.process_time()
+    try:
+        run_scheduled(timed, scheduler, 1, on_values, sleep=sleep, on_cycle=on_cycle)
+    except _Finished:
+        pass
+    cpu = time.process_time() - cpu_started
+    client.close()
+    polls = sum(len(times) for times in intervals.values()) + len(last_read)
+    requests_per_cycle = requests[-1] / len(requests) if requests else 0
+    return stats, batch_times, cpu, requests_per_cycle, polls, duration, intervals
+
+
+def run_async(addresses, ports, cycles, max_gap, timeout):
+    """Точки делятся между линиями, каждая линия опрашивается своей задачей"""
+    stats = new_stats()
+    keys = list(addresses)
+    shares = [{key: addresses[key] for key in keys[i::len(ports)]} for i in range(len(ports))]
+    plans = [plan_reads(share, max_gap=max_gap) for share in shares]
+
+    async def run_all():
+        clients = []
+        for port in ports:
+            client = AsyncModbusTcpClient("127.0.0.1", port=port, timeout=timeout, retries=0)
+            await client.connect()
+            clients.append(client)
+        timed = [AsyncTimedClient(client, stats) for client in clients]
+
+        cycle_times = []
+        try:
+            for _ in range(cycles):
+                started = time.perf_counter()
+                await asyncio.gather(*(read_plan_async(line, plan) for line, plan in zip(timed, plans)))
+                cycle_times.append(time.perf_counter() - started)
+        finally:
+            for client in clients:
+                client.close()
+        return cycle_times
+
+    cpu_started = time.process_time()
+    cycle_times = asyncio.run(run_all())
+    cpu = time.process_time() - cpu_started
+    return stats, cycle_times, cpu, sum(len(plan) for plan in plans)
+
+
+def cycle_intervals(addresses, cycle_times):
+    """Интервалы между чтениями по классам точек у циклических движков: каждая точка - раз в цикл"""
+    return {point_class(key): cycle_times for key in addresses}
+
+
+def summarize(engine, points, stats, cycle_times, cpu, requests_per_cycle, polls=None, elapsed=None,
+              intervals=None):
+    total_time = sum(cycle_times)
+    latencies = stats["latencies"]
+    if polls is None:
+        polls, elapsed = points * len(cycle_times), total_time
+    return {
+        "engine": engine,
+        "points": points,
+        "cycles": len(cycle_times),
+        "requests_per_cycle": requests_per_cycle,
+        "polls_per_second": polls / elapsed if elapsed else None,
+        "latency_p50_ms": percentile(latencies, 0.50) * 1000 if latencies else None,
+        "latency_p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+        "cycle_time_ms": total_time / len(cycle_times) * 1000 if cycle_times else None,
+        "cpu_per_cycle_ms": cpu / len(cycle_times) * 1000 if cycle_times else None,
+        "interval_p99_ms": {str(name): percentile(samples, 0.99) * 1000
+                            for name, samples in sorted((intervals or {}).items(), key=lambda item: str(item[0]))
+                            if samples},
+        "errors": stats["errors"],
+        "exceptions": stats["exceptions"],
+    }
+
+
+def run_benchmark(engines, point_counts, cycles, delay, error_rate, max_gap, lines, spacing, timeout,
+                  duration=5.0, pool_size=4, max_in_flight=1):
+    results = []
+    largest = max(point_counts)
+    register_map = {int(address): 0 for address in make_addresses(largest, spacing).values()}
+
+    with Simulators(max(1, lines), register_map, delay, error_rate) as simulators:
+        for points in point_counts:
+            addresses = make_addresses(points, spacing)
+            for engine in engines:
+                if engine == "scheduler":
+                    result = summarize(engine, points,
+                                       *run_scheduler(addresses, simulators.ports[0], duration, max_gap, timeout))
+                    results.append(result)
+                    print(f"{engine:9} {points:6} точек: пачка {result['cycle_time_ms'] or 0:.1f} мс, "
+                          f"{result['polls_per_second'] or 0:.0f} опросов/с, "
+                          f"p99 {result['latency_p99_ms'] or 0:.2f} мс, "
+                          "интервал p99: " + ", ".join(f"{name} {value:.0f} мс"
+                                                       for name, value in result['interval_p99_ms'].items()))
+                    continue
+                if engine == "async":
+                    measured = run_async(addresses, simulators.ports, cycles, max_gap, timeout)
+                elif engine == "gateway":
+                    measured = run_gateway(addresses, simulators.ports[0], cycles, max_gap, timeout,
+                                           pool_size, max_in_flight)
+                else:
+                    measured = run_sync(engine, addresses, simulators.ports[0], cycles, max_gap, timeout)
+                result = summarize(engine, points, *measured, intervals=cycle_intervals(addresses, measured[1]))
+                results.append(result)
+                print(f"{engine:9} {points:6} точек: цикл {result['cycle_time_ms']:.1f} мс, "
+                      f"{result['polls_per_second'] or 0:.0f} опросов/с, "
+                      f"p99 {result['latency_p99_ms'] or 0:.2f} мс")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк движков опроса Modbus")
+    parser.add_argument("--engines", default=",".join(ENGINES))
+    parser.add_argument("--points", default="10,100,1000,5000", help="Число точек через запятую")
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--delay", type=float, default=0.0, help="Задержка ответа имитатора, с")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-gap", type=int, default=10)
+    parser.add_argument("--spacing", type=int, default=1, help="Шаг адресов между точками")
+    parser.add_argument("--lines", type=int, default=2, help="Число линий для движка async")
+    parser.add_argument("--timeout", type=float, default=1.0)
+    parser.add_argument("--duration", type=float, default=5.0, help="Время работы движка scheduler, с")
+    parser.add_argument("--pool-size", type=int, default=4, help="Соединений шлюза для движка gateway")
+    parser.add_argument("--in-flight", type=int, default=1, help="Запросов в полёте на соединение шлюза")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args(argv)
+
+    engines = [engine.strip() for engine in args.engines.split(",") if engine.strip()]
+    unknown = set(engines) - set(ENGINES)
+    if unknown:
+        parser.error(f"неизвестные движки: {', '.join(sorted(unknown))}")
+    point_counts = [int(points) for points in args.points.split(",")]
+
+    results = run_benchmark(engines, point_counts, args.cycles, args.delay, args.error_rate,
+                            args.max_gap, args.lines, args.spacing, args.timeout,
+                            args.duration, args.pool_size, args.in_flight)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Запись и воспроизведение сырого обмена с приборами.
+
+Процесс опроса может записывать каждое чтение регистров в компактный
+двоичный файл: время, порт, unit, начальный адрес, результат и значения.
+Запись воспроизводится клиентом ReplayClient вместо ModbusSerialClient:
+данные проходят через те же декодеры, чек-лист, события и веб-интерфейс,
+что и на объекте. Скорость воспроизведения - реальное время, в N раз
+быстрее или без пауз (часы записи за секунды).
+
+Формат файла (little-endian):
+    заголовок  - сигнатура b'R3CP', версия (uint16);
+    запись     - время (double, Unix), номер порта (uint8), unit (uint8),
+                 адрес (uint16), результат (uint8), число регистров (uint8),
+                 при результате OK - значения регистров uint16.
+Результат: OK - значения прочитаны; NO_RESPONSE - исключение или таймаут;
+EMPTY - клиент вернул None; 0x80 | код - ответ прибора с исключением Modbus.
+Запись с результатом PORT объявляет имя порта: номер порта - её номер,
+вместо значений - имя в UTF-8 (число регистров - длина имени в байтах).
+
+    python cli.py web --record capture.r3c
+    python cli.py replay capture.r3c --speed 60
+"""
+
+import struct
+import time
+
+MAGIC = b'R3CP'
+VERSION = 1
+HEADER = struct.Struct('<4sH')
+RECORD = struct.Struct('<dBBHBB')   # время, порт, unit, адрес, результат, число регистров
+
+OK = 0
+NO_RESPONSE = 1
+EMPTY = 2
+PORT = 0x7f
+EXCEPTION = 0x80
+
+READ_HOLDING = 0x03
+# Период сброса буфера записи на диск, с
+FLUSH_INTERVAL = 1.0
+
+
+class ReplayFinished(Exception):
+    """Запись воспроизведена до конца"""
+
+
+class CaptureWriter:
+    """Запись чтений регистров в файл (только поток опроса)"""
+
+    def __init__(self, path, clock=time.time):
+        self.clock = clock
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION))
+        self.ports = {}
+        self.flushed = clock()
+
+    def _port(self, name, now):
+        code = self.ports.get(name)
+        if code is None:
+            if len(self.ports) > 0xff:
+                raise ValueError("В записи не более 256 портов")
+            code = self.ports[name] = len(self.ports)
+            data = str(name).encode('utf-8')[:0xff]
+            self.file.write(RECORD.pack(now, code, 0, 0, PORT, len(data)) + data)
+        return code
+
+    def record(self, port, unit, address, count, status, registers=(), now=None):
+        now = self.clock() if now is None else now
+        if status == OK:
+            registers = registers[:0xff]
+            count = len(registers)
+        self.file.write(RECORD.pack(now, self._port(port, now), unit, address, status, min(count, 0xff))
+                        + (struct.pack(f'<{count}H', *registers) if status == OK else b''))
+        if now - self.flushed >= FLUSH_INTERVAL:
+            self.file.flush()
+            self.flushed = now
+
+    def close(self):
+        self.file.close()
+
+
+class RecordingClient:
+    """Обёртка клиента Modbus, записывающая каждое чтение регистров"""
+
+    def __init__(self, client, writer, port):
+        self.client = client
+        self.writer = writer
+        self.port = port
+
+    def __getattr__(self, name):
+        # Конвейерный read_plan шлюза скрыт: каждый блок должен пройти через read_holding_registers
+        if name == 'read_plan':
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def read_holding_registers(self, address, count=1, device_id=1):
+        try:
+            result = self.client.read_holding_registers(address, count=count, device_id=device_id)
+        except Exception:
+            self.writer.record(self.port, device_id, address, count, NO_RESPONSE)
+            raise
+        if result is None:
+            self.writer.record(self.port, device_id, address, count, EMPTY)
+        elif result.isError():
+            code = getattr(result, 'exception_code', 0) or 0
+            self.writer.record(self.port, device_id, address, count, EXCEPTION | code & 0x7f)
+        else:
+            self.writer.record(self.port, device_id, address, count, OK, list(result.registers))
+        return result
+
+
+def iter_records(path):
+    """Записи файла по одной: (время, порт, unit, адрес, число регистров, результат, значения)"""
+    ports = {}
+    with open(path, 'rb') as f:
+        magic, version = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} не является записью обмена")
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            ts, port, unit, address, status, count = RECORD.unpack(head)
+            if status == PORT:
+                ports[port] = f.read(count).decode('utf-8')
+                continue
+            registers = ()
+            if status == OK:
+                data = f.read(count * 2)
+                if len(data) < count * 2:
+                    # Обрезанный хвост: процесс опроса остановлен во время записи
+                    return
+                registers = struct.unpack(f'<{count}H', data)
+            yield ts, ports.get(port, str(port)), unit, address, count, status, registers
+
+
+class ReplayClock:
+    """Время воспроизведения в шкале записи.
+
+    speed > 0 - в speed раз быстрее реального времени; speed = 0 - без
+    пауз: время записи продвигается только вызовами sleep.
+    """
+
+    def __init__(self, start, end, speed=1.0):
+        self.start = start
+        self.end = end
+        self.speed = speed
+        self.now = start
+        self.wall_start = time.monotonic()
+
+    def __call__(self):
+        if self.speed:
+            self.now = self.start + (time.monotonic() - self.wall_start) * self.speed
+        return self.now
+
+    def sleep(self, seconds):
+        """Пауза планировщика опроса; после конца записи - ReplayFinished"""
+        if self() >= self.end:
+            raise ReplayFinished()
+        if self.speed:
+            time.sleep(min(seconds, self.end - self.now) / self.speed)
+        else:
+            self.now += min(seconds, self.end - self.now) or seconds
+
+
+class ReplayClient:
+    """Клиент Modbus, отвечающий значениями из записи на текущий момент воспроизведения.
+
+    Записи применяются к образу регистров по мере продвижения времени
+    clock; чтение блока отдаёт образ: значения или ошибку, записанную для
+    этих регистров последней. port - имя порта в записи (None - все порты).
+    """
+
+    def __init__(self, path, port=None, speed=1.0):
+        self.path = path
+        self.port = port
+        start = end = None
+        for record in iter_records(path):
+            if port is None or record[1] == port:
+                start = record[0] if start is None else start
+                end = record[0]
+        if start is None:
+            raise ValueError(f"В записи {path} нет чтений" + (f" порта {port}" if port else ""))
+        self.clock = ReplayClock(start, end, speed)
+        self.records = iter_records(path)
+        self.pending = None
+        self.image = {}
+        self.replayed = 0
+
+    def connect(self):
+        return True
+
+    def close(self):
+        self.records.close()
+
+    def _advance(self):
+        now = self.clock()
+        while True:
+            if self.pending is None:
+                self.pending = next(self.records, None)
+                if self.pending is None:
+                    return
+            ts, port, unit, address, count, status, registers = self.pending
+            if ts > now:
+                return
+            self.pending = None
+            if self.port is not None and port != self.port:
+                continue
+            self.replayed += 1
+            if status == OK:
+                for offset, value in enumerate(registers):
+                    self.image[(unit, address + offset)] = (OK, value)
+            else:
+                # Ошибка относится ко всем регистрам блока до следующего успешного чтения
+                for offset in range(count):
+                    self.image[(unit, address + offset)] = (status, None)
+
+    def read_holding_registers(self, address, count=1, device_id=1):
+        # Ответы в формате клиента шлюза; transport (и asyncio) нужен только при воспроизведении
+        from transport import ModbusTransportError, RegistersResult
+
+        self._advance()
+        registers = []
+        for offset in range(count):
+            status, value = self.image.get((device_id, address + offset), (None, None))
+            if status is None or status == NO_RESPONSE:
+                raise ModbusTransportError(f"Нет ответа для регистра {address + offset} в записи")
+            if status == EMPTY:
+                return None
+            if status & EXCEPTION:
+                return RegistersResult(READ_HOLDING, exception_code=status & 0x7f)
+            registers.append(value)
+        return RegistersResult(READ_HOLDING, registers)
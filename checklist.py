@@ -0,0 +1,55 @@
+"""Чек-лист пусконаладки по индексу (ключ конфига, маска) -> строка.
+
+Строки чек-листа привязаны к своей точке и своему биту, поэтому одинаковые
+описания в разных секциях больше не путаются. Отметка строки берётся из
+накопленного покрытия (state_coverage.CoverageTracker): состояние, хоть
+раз увиденное за сессию, остаётся отмеченным и после снятия. Строки
+пересчитываются только для впервые увиденных состояний, а счётчик
+отмеченных состояний считается по маскам покрытия.
+
+Строки неизменяемые (snapshot.ChecklistRow): список rows - рабочий буфер
+потока опроса, изменённая строка заменяется в нём новой, а опубликованные
+снимки продолжают ссылаться на прежние.
+"""
+
+from state_coverage import CoverageTracker
+
+
+class ChecklistIndex:
+    """Индекс строк чек-листа по точкам и маскам"""
+
+    def __init__(self, rows, coverage=None):
+        self.rows = rows
+        # ключ -> [(бит состояния в покрытии, номер строки)]
+        self.slots = {}
+        wanted = {}
+        for row_id, row in enumerate(rows):
+            masks = wanted.setdefault(row.key, [])
+            self.slots.setdefault(row.key, []).append((1 << len(masks), row_id))
+            masks.append(row.mask)
+        self.coverage = coverage if coverage is not None else CoverageTracker()
+        self.coverage.configure(wanted)
+        # Строки состояний, увиденных до перезапуска или перечитывания таблицы
+        for key in self.slots:
+            self.mark(key, self.coverage.mask(key))
+
+    @property
+    def active_count(self):
+        return self.coverage.active_count()
+
+    def mark(self, key, bits):
+        """Отмечает строки впервые увиденных состояний точки, возвращает изменившиеся строки"""
+        slots = self.slots.get(key)
+        if not slots or not bits:
+            return []
+
+        changed = []
+        for bit, row_id in slots:
+            if not bit & bits:
+                continue
+            row = self.rows[row_id]
+            if row.result == '✅':
+                continue
+            row = self.rows[row_id] = row._replace(actual=hex(row.mask), result='✅')
+            changed.append(row)
+        return changed
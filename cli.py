@@ -0,0 +1,123 @@
+"""Единая точка входа: режимы мониторинга и утилиты.
+
+    python cli.py monitor             опрос, история, события и журнал без веб-интерфейса
+    python cli.py web                 то же с веб-интерфейсом (как main_nt.py)
+    python cli.py console             вывод изменений в консоль (как main2.py)
+    python cli.py poll                асинхронный опрос нескольких портов (async_poller.py)
+    python cli.py replay FILE         воспроизведение записи обмена (--record) вместо опроса
+    python cli.py bench ...           бенчмарк движков опроса (bench.py)
+    python cli.py simulate ...        имитатор прибора Modbus (simulator.py)
+    python cli.py export ...          выгрузка чек-листа и истории (export.py)
+    python cli.py scan ...            поиск приборов и регистров на шинах (scanner.py)
+    python cli.py profiles ...        проверка и компиляция профилей приборов (profiles.py)
+
+Модуль режима импортируется только после разбора командной строки: Flask
+загружается лишь для веб-интерфейса, pymodbus - лишь при опросе COM-порта,
+openpyxl - при выгрузке XLSX. Время от запуска до первого цикла опроса
+пишется в журнал и в метрику r3_first_poll_seconds - оно определяет, как
+быстро служба на объекте возвращается к опросу после перезапуска.
+"""
+
+import argparse
+import time
+
+# Отметка запуска для замера времени до первого опроса - до импорта модулей режимов
+STARTED = time.perf_counter()
+
+
+def run_monitor(args):
+    from main_nt import main
+    main(args.config, web=False, started=STARTED, record=args.record)
+
+
+def run_web(args):
+    from main_nt import main
+    main(args.config, web=True, started=STARTED, record=args.record)
+
+
+def run_replay(args):
+    from main_nt import main
+    main(args.config, web=not args.no_web, started=STARTED, replay=args.capture, speed=args.speed)
+
+
+def run_console(args):
+    from main2 import main
+    main(args.config, started=STARTED)
+
+
+def run_poll(args):
+    from async_poller import main
+    main(args.config)
+
+
+def run_bench(argv):
+    from bench import main
+    main(argv)
+
+
+def run_simulate(argv):
+    from simulator import main
+    main(argv)
+
+
+def run_export(argv):
+    from export import main
+    main(argv)
+
+
+def run_scan(argv):
+    from scanner import main
+    main(argv)
+
+
+def run_profiles(argv):
+    from profiles import main
+    main(argv)
+
+
+# Режимы с конфигом: имя -> (описание, запуск)
+MODES = {
+    "monitor": ("Опрос, история и события без веб-интерфейса", run_monitor),
+    "web": ("Опрос с веб-интерфейсом чек-листа", run_web),
+    "console": ("Вывод изменений точек в консоль", run_console),
+    "poll": ("Асинхронный опрос нескольких портов", run_poll),
+    "replay": ("Воспроизведение записи обмена через декодеры, чек-лист и веб-интерфейс", run_replay),
+}
+# Утилиты со своими аргументами: остаток командной строки передаётся им целиком
+TOOLS = {
+    "bench": ("Бенчмарк движков опроса", run_bench),
+    "simulate": ("Имитатор прибора Modbus TCP", run_simulate),
+    "export": ("Выгрузка чек-листа и истории в XLSX/CSV", run_export),
+    "scan": ("Поиск приборов и регистров, таблица точек для points_file", run_scan),
+    "profiles": ("Проверка профилей приборов и заполнение кэша скомпилированных", run_profiles),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Мониторинг приборов R3-МС-КП по Modbus")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="режим")
+    for name, (help_text, _) in MODES.items():
+        command = commands.add_parser(name, help=help_text, description=help_text)
+        command.add_argument("--config", default="config.json", help="Файл конфигурации")
+        if name in ("monitor", "web"):
+            command.add_argument("--record", metavar="FILE", help="Записывать сырой обмен в файл")
+        elif name == "replay":
+            command.add_argument("capture", help="Файл записи обмена")
+            command.add_argument("--speed", type=float, default=1.0,
+                                 help="Во сколько раз быстрее реального времени; 0 - без пауз")
+            command.add_argument("--no-web", action="store_true", help="Без веб-интерфейса")
+    for name, (help_text, _) in TOOLS.items():
+        # Справку (-h) выводит сама утилита
+        commands.add_parser(name, help=help_text, add_help=False)
+
+    args, rest = parser.parse_known_args(argv)
+    if args.command in TOOLS:
+        TOOLS[args.command][1](rest)
+        return
+    if rest:
+        parser.error(f"неизвестные аргументы: {' '.join(rest)}")
+    MODES[args.command][1](args)
+
+
+if __name__ == "__main__":
+    main()
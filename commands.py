@@ -0,0 +1,389 @@
+"""Команды приборам: приоритетная очередь записи с подтверждением.
+
+Команду (открыть/закрыть заслонку, обход пожарной зоны) ставит в очередь
+любой поток - веб-обработчик или код в процессе опроса. Шину занимает
+только поток опроса: CommandClient оборачивает его клиента и перед каждым
+запросом чтения сначала отправляет стоящие в очереди команды, а паузу
+планировщика прерывает сразу при появлении команды. Команда уходит на шину
+не позже чем через один кадр опроса, а не после цикла.
+
+После записи состояние прибора подтверждается чтением его регистра
+состояния: команда подтверждена, когда (значение & mask) == expect.
+Заслонка переключается не мгновенно, поэтому чтение повторяется каждые
+check_interval секунд до подтверждения или confirm_timeout. Для каждой
+команды замеряются задержка записи и полная задержка от постановки в
+очередь до подтверждения.
+
+Запись на объекте включается только явно:
+
+    "commands": {
+        "enabled": true, "confirm_timeout": 10, "check_interval": 0.1,
+        "registers": {"actuator_1": 42600},
+        "actions": {
+            "open": {"value": 1, "mask": 1024, "expect": 1024},
+            "close": {"value": 2, "mask": 512, "expect": 512},
+            "bypass": {"value": 8, "mask": 8, "expect": 8}
+        }
+    }
+
+"registers" - регистр команд точки (по умолчанию - регистр роли "command"
+профиля прибора, без неё пишется в регистр состояния), "actions" -
+именованные команды: записываемое значение и ожидаемые биты состояния
+(см. профили приборов, profiles.py).
+
+Веб-сервер слушает все интерфейсы, поэтому POST /api/v1/commands
+принимается только от разрешённых узлов и/или с токеном:
+
+    "commands": {"enabled": true, "token": "...", "allowed_hosts": ["10.0.5.0/24"]}
+
+"allowed_hosts" - адреса и подсети; без "token" по умолчанию только
+локальный узел, с "token" - любой узел с заголовком
+"Authorization: Bearer <token>". Заданы оба - нужны оба.
+
+Команды принимает только веб-сервер процесса опроса: в многопроцессном
+режиме ("web_workers" > 0) веб-процессы работают по образу регистров
+без доступа к шине и на /api/v1/commands отвечают 503.
+"""
+
+import heapq
+import hmac
+import ipaddress
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from metrics import Histogram
+
+log = logging.getLogger(__name__)
+
+QUEUED = "queued"
+SENT = "sent"
+CONFIRMED = "confirmed"
+FAILED = "failed"
+TIMEOUT = "timeout"
+
+CONFIRM_TIMEOUT = 10.0
+CHECK_INTERVAL = 0.1
+# Сколько последних команд хранится для API
+RECENT = 100
+COMMAND_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Узлы, которым запись разрешена без токена и без "allowed_hosts"
+LOCAL_HOSTS = ("127.0.0.1/32", "::1/128")
+
+
+def _register_value(name, value):
+    """Целое 0..0xffff из JSON или конфига; иначе ValueError"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name}: ожидается целое число, получено {value!r}") from None
+    if not 0 <= value <= 0xffff:
+        raise ValueError(f"{name}: вне диапазона регистра 0..0xffff: {value}")
+    return value
+
+
+class Command:
+    """Одна команда и её результат; wait() - ожидание завершения из другого потока"""
+
+    __slots__ = ('id', 'key', 'action', 'value', 'register', 'address', 'unit', 'mask', 'expect',
+                 'priority', 'timeout', 'state', 'raw', 'error', 'created', 'submitted', 'written',
+                 'finished', 'next_check', 'done')
+
+    def __init__(self, command_id, key, action, value, register, address, unit, mask, expect,
+                 priority, timeout, submitted):
+        self.id = command_id
+        self.key = key
+        self.action = action
+        self.value = value
+        self.register = register
+        self.address = address
+        self.unit = unit
+        self.mask = mask
+        self.expect = expect
+        self.priority = priority
+        self.timeout = timeout
+        self.state = QUEUED
+        self.raw = None
+        self.error = None
+        self.created = time.time()
+        self.submitted = submitted
+        self.written = None
+        self.finished = None
+        self.next_check = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        """Ждёт подтверждения или ошибки; возвращает True, если команда завершена"""
+        return self.done.wait(timeout)
+
+    @property
+    def write_latency(self):
+        return None if self.written is None else self.written - self.submitted
+
+    @property
+    def latency(self):
+        return None if self.finished is None else self.finished - self.submitted
+
+    def record(self):
+        """Команда в виде словаря для JSON"""
+        return {
+            'id': self.id,
+            'key': self.key,
+            'action': self.action,
+            'value': self.value,
+            'register': self.register,
+            'unit': self.unit,
+            'state': self.state,
+            'raw': self.raw,
+            'raw_hex': None if self.raw is None else f"0x{self.raw:04x}",
+            'error': self.error,
+            'created': datetime.fromtimestamp(self.created).isoformat(timespec='milliseconds'),
+            'write_latency': self.write_latency,
+            'latency': self.latency,
+        }
+
+
+class CommandClient:
+    """Обёртка клиента шины: команды из очереди уходят между кадрами опроса"""
+
+    def __init__(self, client, actions=None, registers=None, confirm_timeout=CONFIRM_TIMEOUT,
+                 check_interval=CHECK_INTERVAL, clock=time.monotonic, token=None, allowed_hosts=None):
+        self.client = client
+        # Кто может ставить команды через API (см. allows)
+        self.token = token or None
+        if allowed_hosts is None:
+            allowed_hosts = () if self.token else LOCAL_HOSTS
+        self.allowed_hosts = tuple(ipaddress.ip_network(host, strict=False) for host in allowed_hosts)
+        self.actions = dict(actions or {})
+        self.registers = {key: int(register) for key, register in (registers or {}).items()}
+        # Регистры команд из профилей приборов: ключ -> адрес
+        self.profile_registers = {}
+        self.confirm_timeout = confirm_timeout
+        self.check_interval = check_interval
+        self.clock = clock
+
+        self.points = {}            # ключ -> (адрес, unit)
+        self.queue = []             # (приоритет, номер, команда)
+        self.sent = []              # записанные, ждут подтверждения
+        self.recent = deque(maxlen=RECENT)
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+        self.write_latency = Histogram(COMMAND_BUCKETS)
+        self.latency = Histogram(COMMAND_BUCKETS)
+        self.totals = dict.fromkeys((CONFIRMED, FAILED, TIMEOUT), 0)
+
+    @classmethod
+    def from_config(cls, client, cfg):
+        """Обёртка по разделу "commands" конфига; None, если запись не включена явно"""
+        commands = cfg.get("commands") or {}
+        if not commands.get("enabled", False):
+            return None
+        return cls(client, commands.get("actions"), commands.get("registers"),
+                   commands.get("confirm_timeout", CONFIRM_TIMEOUT),
+                   commands.get("check_interval", CHECK_INTERVAL),
+                   token=commands.get("token"), allowed_hosts=commands.get("allowed_hosts"))
+
+    def allows(self, host, token=None):
+        """Можно ли узлу host (с токеном token) ставить команды"""
+        if self.allowed_hosts:
+            try:
+                address = ipaddress.ip_address(host)
+            except ValueError:
+                return False
+            if not any(address in network for network in self.allowed_hosts):
+                return False
+        if self.token:
+            return token is not None and hmac.compare_digest(token.encode(), self.token.encode())
+        return True
+
+    def configure(self, addresses, units=None, default_unit=1, registers=None):
+        """Точки, которым можно отправлять команды: ключ -> адрес регистра состояния.
+
+        registers - регистры команд по профилям (ключ -> адрес), "registers" конфига важнее.
+        """
+        units = units or {}
+        self.profile_registers = dict(registers or {})
+        self.points = {key: (int(address), units.get(key, default_unit))
+                       for key, address in addresses.items() if address and str(address).strip()}
+
+    # --- постановка в очередь (любой поток) ---
+
+    def submit(self, key, action=None, value=None, mask=None, expect=None, priority=0):
+        """Ставит команду в очередь и возвращает её (Command).
+
+        action - имя из "actions" конфига, иначе value с ожидаемыми битами mask/expect.
+        Без mask подтверждением служит expect - ожидается ровно это состояние,
+        без expect - все биты mask. Меньший priority - раньше.
+        Неверные параметры - ValueError, очередь при этом не меняется.
+        """
+        point = self.points.get(key)
+        if point is None:
+            raise ValueError(f"Неизвестная точка: {key}")
+        if action is not None:
+            params = self.actions.get(action)
+            if params is None:
+                raise ValueError(f"Неизвестная команда: {action}")
+            value = params.get("value")
+            mask = params.get("mask")
+            expect = params.get("expect")
+            timeout = params.get("timeout", self.confirm_timeout)
+        else:
+            timeout = self.confirm_timeout
+        if value is None:
+            raise ValueError("Не задано ни имя команды, ни значение")
+        value = _register_value("value", value)
+        if mask is not None:
+            mask = _register_value("mask", mask)
+        if expect is not None:
+            expect = _register_value("expect", expect)
+            if mask is None:
+                mask = 0xffff
+        elif mask is not None:
+            expect = mask
+        if mask is not None and expect & ~mask:
+            raise ValueError(f"expect 0x{expect:04x} содержит биты вне mask 0x{mask:04x} - не подтвердится")
+        try:
+            priority = int(priority)
+        except (TypeError, ValueError):
+            raise ValueError(f"priority: ожидается целое число, получено {priority!r}") from None
+
+        address, unit = point
+        register = self.registers.get(key, self.profile_registers.get(key, address))
+        command = Command(next(self.ids), key, action, value, register, address, unit,
+                          mask, expect, priority, timeout, self.clock())
+        with self.lock:
+            heapq.heappush(self.queue, (priority, command.id, command))
+            self.recent.append(command)
+        self.wakeup.set()
+        return command
+
+    def get(self, command_id):
+        for command in list(self.recent):
+            if command.id == command_id:
+                return command
+        return None
+
+    def commands(self):
+        """Последние команды, новые первыми"""
+        return list(reversed(list(self.recent)))
+
+    # --- обслуживание (только поток опроса) ---
+
+    def _finish(self, command, state, error=None):
+        command.state = state
+        command.error = error
+        command.finished = self.clock()
+        self.totals[state] += 1
+        if command in self.sent:
+            self.sent.remove(command)
+        if state == CONFIRMED:
+            self.latency.observe(command.latency)
+            log.info("✅ Команда %s %s (%s): подтверждена за %.3f с, состояние 0x%04x", command.id,
+                     command.action or command.value, command.key, command.latency, command.raw)
+        else:
+            log.warning("❌ Команда %s %s (%s): %s", command.id, command.action or command.value,
+                        command.key, error)
+        command.done.set()
+
+    def _write(self, command):
+        try:
+            result = self.client.write_register(command.register, command.value, device_id=command.unit)
+        except Exception as e:
+            self._finish(command, FAILED, f"нет ответа на запись: {e}")
+            return
+        if result is None or result.isError():
+            self._finish(command, FAILED, f"прибор отклонил запись: {result}")
+            return
+        command.written = command.next_check = self.clock()
+        command.state = SENT
+        self.write_latency.observe(command.write_latency)
+        self.sent.append(command)
+
+    def _check(self, command, now):
+        """Адресное чтение регистра состояния после записи"""
+        try:
+            result = self.client.read_holding_registers(command.address, count=1, device_id=command.unit)
+        except Exception:
+            result = None
+        if result is not None and not result.isError() and result.registers:
+            command.raw = result.registers[0]
+            if command.mask is None or command.raw & command.mask == command.expect:
+                self._finish(command, CONFIRMED)
+                return
+        now = self.clock()
+        if now - command.written >= command.timeout:
+            state = "нет ответа" if command.raw is None else f"состояние 0x{command.raw:04x}"
+            self._finish(command, TIMEOUT, f"не подтверждена за {command.timeout} с ({state})")
+        else:
+            command.next_check = now + self.check_interval
+
+    def serve(self):
+        """Отправляет команды из очереди и выполняет наступившие чтения подтверждения"""
+        while self.queue:
+            with self.lock:
+                command = heapq.heappop(self.queue)[2] if self.queue else None
+            if command is None:
+                break
+            self._guarded(self._write, command)
+        if self.sent:
+            now = self.clock()
+            for command in [command for command in self.sent if command.next_check <= now]:
+                self._guarded(self._check, command, now)
+
+    def _guarded(self, step, command, *args):
+        # Сбой одной команды завершает только её и не останавливает опрос шины
+        try:
+            step(command, *args)
+        except Exception as e:
+            log.exception("Ошибка обработки команды %s", command.id)
+            if not command.done.is_set():
+                self._finish(command, FAILED, f"ошибка обработки: {e}")
+
+    def sleep(self, seconds):
+        """Пауза планировщика опроса, прерываемая командами и чтениями подтверждения"""
+        deadline = self.clock() + seconds
+        while True:
+            self.serve()
+            now = self.clock()
+            wait = deadline - now
+            if self.sent:
+                wait = min(wait, min(command.next_check for command in self.sent) - now)
+            if wait <= 0:
+                if now >= deadline:
+                    return
+                continue
+            if self.wakeup.wait(wait):
+                self.wakeup.clear()
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if name == 'read_plan':
+            # Конвейерное чтение шлюза: команды - перед каждым планом
+            def read_plan(plan, unit_id=1):
+                self.serve()
+                return attr(plan, unit_id)
+            return read_plan
+        return attr
+
+    def read_holding_registers(self, address, count=1, device_id=1):
+        self.serve()
+        return self.client.read_holding_registers(address, count=count, device_id=device_id)
+
+    def render_metrics(self):
+        """Строки Prometheus: задержки и итоги команд"""
+        lines = ["# HELP r3_command_write_latency_seconds От постановки команды в очередь до ответа на запись",
+                 "# TYPE r3_command_write_latency_seconds histogram"]
+        lines.extend(self.write_latency.render("r3_command_write_latency_seconds"))
+        lines.append("# HELP r3_command_latency_seconds От постановки команды в очередь до подтверждения")
+        lines.append("# TYPE r3_command_latency_seconds histogram")
+        lines.extend(self.latency.render("r3_command_latency_seconds"))
+        lines.append("# HELP r3_commands_total Завершённые команды по результату")
+        lines.append("# TYPE r3_commands_total counter")
+        for state, count in dict(self.totals).items():
+            lines.append(f'r3_commands_total{{state="{state}"}} {count}')
+        return lines
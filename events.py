@@ -0,0 +1,219 @@
+"""Поток событий по фронтам битов состояния.
+
+Движок стоит после декодеров: новое сырое слово точки сравнивается с
+предыдущим через XOR, и на каждый изменившийся бит с известной маской
+выпускается событие "raise" (состояние появилось) или "clear" (пропало)
+с временем чтения. Потеря связи (0xffff) и её восстановление - отдельные
+события "no_link"/"link", биты при этом не трогаются: после восстановления
+связи новое слово сравнивается с последним достоверным.
+
+События попадают в ограниченный кольцевой буфер (последние N, с номерами
+для догоняющих читателей) и в очереди подписчиков: журнал, хранилище,
+веб-интерфейс. Переполненная очередь медленного подписчика теряет события,
+а не задерживает опрос.
+"""
+
+import json
+import logging
+import queue
+import threading
+from collections import deque, namedtuple
+from datetime import datetime
+
+from web_push import KEEPALIVE_SECONDS
+
+log = logging.getLogger(__name__)
+
+NO_LINK = 0xffff
+# Сколько последних событий хранится в памяти
+BUFFER_SIZE = 4096
+# Ёмкость очереди одного подписчика
+SUBSCRIBER_QUEUE_SIZE = 10000
+# Ёмкость очереди одного открытого браузера
+WEB_QUEUE_SIZE = 1000
+
+RAISE = "raise"
+CLEAR = "clear"
+LINK_LOST = "no_link"
+LINK_RESTORED = "link"
+ACTIONS = {RAISE: " - возникло", CLEAR: " - снято"}
+
+Event = namedtuple('Event', 'seq time kind key address type mask label')
+
+
+def event_record(event):
+    """Событие в виде словаря для JSON"""
+    return {
+        'seq': event.seq,
+        'time': datetime.fromtimestamp(event.time).isoformat(timespec='milliseconds'),
+        'kind': event.kind,
+        'key': event.key,
+        'address': event.address,
+        'type': event.type,
+        'mask': f"0x{event.mask:04x}",
+        'label': event.label,
+    }
+
+
+class EventEngine:
+    """Выделение фронтов битов и раздача событий подписчикам"""
+
+    def __init__(self, buffer_size=BUFFER_SIZE):
+        self.buffer = deque(maxlen=buffer_size)
+        self.seq = 0
+        self.points = {}
+        self.previous = {}
+        self.linked = {}
+        self.subscribers = []
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def configure(self, points):
+        """Задаёт точки: ключ -> (адрес, тип, {маска: название}).
+
+        Предыдущие значения сохраняются для точек, оставшихся в таблице.
+        """
+        self.points = {key: (address, kind, [(mask, label) for mask, label in masks.items() if mask])
+                       for key, (address, kind, masks) in points.items()}
+        self.previous = {key: value for key, value in self.previous.items() if key in self.points}
+        self.linked = {key: value for key, value in self.linked.items() if key in self.points}
+
+    def process(self, values, now):
+        """Сравнивает новые значения с предыдущими, публикует и возвращает события"""
+        events = []
+        for key, raw in values.items():
+            point = self.points.get(key)
+            if point is None or raw is None:
+                continue
+            address, kind, masks = point
+
+            if raw == NO_LINK:
+                if self.linked.get(key, True):
+                    self.linked[key] = False
+                    events.append((LINK_LOST, key, address, kind, NO_LINK, "Нет связи с прибором"))
+                continue
+            if not self.linked.get(key, True):
+                self.linked[key] = True
+                events.append((LINK_RESTORED, key, address, kind, NO_LINK, "Связь восстановлена"))
+
+            previous = self.previous.get(key)
+            self.previous[key] = raw
+            # Первое чтение: установленные биты - события "raise", снятые не сообщаются
+            diff = raw ^ previous if previous is not None else raw
+            if not diff:
+                continue
+            for mask, label in masks:
+                if mask & diff:
+                    events.append((RAISE if raw & mask else CLEAR, key, address, kind, mask, label))
+
+        if events:
+            return self._publish(events, now)
+        return []
+
+    def _publish(self, items, now):
+        with self.lock:
+            events = []
+            for item in items:
+                self.seq += 1
+                events.append(Event(self.seq, now, *item))
+            self.buffer.extend(events)
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            for event in events:
+                try:
+                    subscriber.put_nowait(event)
+                except queue.Full:
+                    self.dropped += 1
+        return events
+
+    def since(self, seq, limit=None):
+        """События из буфера с номером больше seq (старые, вытесненные из буфера, теряются)"""
+        with self.lock:
+            if self.buffer and self.buffer[0].seq > seq:
+                events = list(self.buffer)
+            else:
+                events = [event for event in self.buffer if event.seq > seq]
+        return events[-limit:] if limit else events
+
+    def subscribe(self, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        """Новая очередь подписчика: в неё попадают все события после подписки"""
+        subscriber = queue.Queue(maxsize)
+        with self.lock:
+            self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def stream(self, since=0):
+        """Генератор SSE-сообщений: события из буфера после since, затем новые"""
+        # Подписка до чтения буфера, повторы отсекаются по номеру
+        subscriber = self.subscribe(WEB_QUEUE_SIZE)
+        try:
+            yield "retry: 2000\n\n"
+            last = since
+            pending = self.since(since)
+            while True:
+                for event in pending:
+                    if event.seq <= last:
+                        continue
+                    last = event.seq
+                    yield f"id: {event.seq}\ndata: {json.dumps(event_record(event), ensure_ascii=False)}\n\n"
+                try:
+                    pending = [subscriber.get(timeout=KEEPALIVE_SECONDS)]
+                except queue.Empty:
+                    pending = []
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+
+class EventConsumer:
+    """Фоновый поток, передающий события из очереди подписчика обработчику"""
+
+    def __init__(self, engine, handle, name="events"):
+        self.engine = engine
+        self.handle = handle
+        self.queue = engine.subscribe()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def _run(self):
+        while True:
+            event = self.queue.get()
+            if event is None:
+                break
+            try:
+                self.handle(event)
+            except Exception:
+                log.exception("Ошибка обработки события %s", event)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.engine.unsubscribe(self.queue)
+        self.queue.put(None)
+        self._thread.join(timeout=5)
+
+
+def log_event(event):
+    """Обработчик-журнал: одна строка на событие"""
+    log.info("%s%s (%s - %s) в %s", event.label, ACTIONS.get(event.kind, ""), event.key, event.address,
+             datetime.fromtimestamp(event.time).strftime('%H:%M:%S.%f')[:-3])
+
+
+class EventFileWriter:
+    """Обработчик-хранилище: события дописываются в файл JSON Lines"""
+
+    def __init__(self, path):
+        self.file = open(path, "a", encoding="utf-8")
+
+    def __call__(self, event):
+        self.file.write(json.dumps(event_record(event), ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,220 @@
+"""Выгрузка чек-листа и истории изменений в XLSX и CSV.
+
+Строки отдаются генераторами и пишутся потоком: CSV - построчно, XLSX -
+через openpyxl в режиме write_only, при котором книга не держится в памяти
+целиком. Поэтому выгрузка сессии пусконаладки на десятки тысяч строк
+занимает секунды и постоянный объём памяти.
+
+Листы выгрузки:
+    Чек-лист - состояние каждой строки и время первого обнаружения состояния;
+    История  - все изменения сырых значений точек с декодированными состояниями.
+
+Время первого обнаружения берётся из истории на диске (history.py), поэтому
+переживает перезапуски. openpyxl нужен только для XLSX:
+
+    python export.py report.xlsx --since "2026-10-17 09:00"
+    python export.py checklist.csv --sheet checklist
+"""
+
+import argparse
+import csv
+import time
+from datetime import datetime
+
+from checklist import ChecklistIndex
+from history import HistoryStore
+from point_table import load_point_table
+from snapshot import ChecklistRow
+from state_coverage import CoverageTracker, coverage_path, state_matches
+from status_tables import StatusDecoder
+
+# Разделитель CSV: русский Excel открывает такие файлы без мастера импорта
+CSV_DELIMITER = ';'
+# Цвета как на странице мониторинга
+HEADER_COLOR = "366092"
+SUCCESS_COLOR = "D4EDDA"
+FAIL_COLOR = "F8D7DA"
+
+CHECKLIST_HEADER = ("Секция", "Состояние прибора", "Ожидаемый код", "Полученный код", "Результат",
+                    "Впервые обнаружено")
+HISTORY_HEADER = ("Время", "Точка", "Адрес", "Значение", "Состояния")
+
+
+def _format_time(ts):
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] if ts else ""
+
+
+def parse_since(text):
+    """Начало сессии: ISO-дата/время или секунды Unix; пусто - вся история"""
+    if not text:
+        return 0.0
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+
+def first_detected(history, rows, since=0.0, until=None):
+    """Время первого появления состояния каждой строки: номер строки -> время.
+
+    Состояние отмечается по тому же правилу, что и в чек-листе
+    (state_coverage.state_matches), включая норму с маской 0x00.
+    """
+    until = time.time() if until is None else until
+    masks_by_key = {}
+    for row in rows:
+        masks_by_key.setdefault(row.key, []).append((row.mask, row.id))
+
+    detected = {}
+    for key, slots in masks_by_key.items():
+        remaining = list(slots)
+        for ts, value in history.iter_changes(key, since, until):
+            found = [(mask, row_id) for mask, row_id in remaining if state_matches(value, mask)]
+            for mask, row_id in found:
+                detected[row_id] = ts
+            if found:
+                remaining = [slot for slot in remaining if slot not in found]
+                if not remaining:
+                    break
+    return detected
+
+
+def checklist_rows(rows, detected):
+    """Строки листа "Чек-лист" (без заголовка)"""
+    for row in rows:
+        yield (row.section, row.state, row.expected, row.actual, row.result,
+               _format_time(detected.get(row.id)))
+
+
+def history_rows(history, points, decode, since=0.0, until=None):
+    """Строки листа "История": points - [(ключ, адрес)], decode(ключ, значение) -> названия"""
+    until = time.time() if until is None else until
+    for key, address in points:
+        for ts, value in history.iter_changes(key, since, until):
+            yield (_format_time(ts), key, address, f"0x{value:04x}", ", ".join(decode(key, value)))
+
+
+class _LineBuffer:
+    """Приёмник csv.writer, отдающий записанную строку"""
+
+    def write(self, text):
+        return text
+
+
+def iter_csv(header, rows):
+    """CSV построчно (для потоковой отдачи по HTTP); первая строка с BOM для Excel"""
+    writer = csv.writer(_LineBuffer(), delimiter=CSV_DELIMITER)
+    yield '\ufeff' + writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_csv(path, header, rows):
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f, delimiter=CSV_DELIMITER)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def write_xlsx(target, sheets):
+    """Книга XLSX в режиме write_only; sheets - [(название, заголовок, строки)].
+
+    target - путь или открытый на запись двоичный файл.
+    """
+    try:
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font, PatternFill
+    except ImportError:
+        raise RuntimeError("Для выгрузки в XLSX нужен пакет openpyxl (pip install openpyxl)")
+
+    workbook = Workbook(write_only=True)
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill("solid", fgColor=HEADER_COLOR)
+    result_fills = {'✅': PatternFill("solid", fgColor=SUCCESS_COLOR),
+                    '❌': PatternFill("solid", fgColor=FAIL_COLOR)}
+
+    for title, header, rows in sheets:
+        sheet = workbook.create_sheet(title)
+        sheet.freeze_panes = "A2"
+        header_cells = []
+        for text in header:
+            cell = WriteOnlyCell(sheet, value=text)
+            cell.font = header_font
+            cell.fill = header_fill
+            header_cells.append(cell)
+        sheet.append(header_cells)
+
+        result_column = header.index("Результат") if "Результат" in header else None
+        for row in rows:
+            if result_column is not None and row[result_column] in result_fills:
+                cell = WriteOnlyCell(sheet, value=row[result_column])
+                cell.fill = result_fills[row[result_column]]
+                row = list(row)
+                row[result_column] = cell
+            sheet.append(row)
+
+    workbook.save(target)
+
+
+def report_sheets(history, rows, points, decode, since=0.0, until=None):
+    """Листы полного отчёта для write_xlsx"""
+    until = time.time() if until is None else until
+    detected = first_detected(history, rows, since, until)
+    return [
+        ("Чек-лист", CHECKLIST_HEADER, checklist_rows(rows, detected)),
+        ("История", HISTORY_HEADER, history_rows(history, points, decode, since, until)),
+    ]
+
+
+def rows_from_history(decoder, addresses, types, history, until=None, coverage=None, profiles=None):
+    """Чек-лист по покрытию сессии и последним сохранённым значениям (выгрузка без запущенного опроса)"""
+    until = time.time() if until is None else until
+    checklist = decoder.create_checklist_from_config(addresses, types, profiles)
+    rows = [ChecklistRow(number, section, state, expected, '', '❌', key, mask)
+            for number, (section, state, expected, key, mask) in enumerate(checklist)]
+    index = ChecklistIndex(rows, coverage)
+    for key in addresses:
+        index.mark(key, index.coverage.matches(key, history.value_at(key, until)))
+    return index.rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Выгрузка чек-листа и истории в XLSX/CSV")
+    parser.add_argument("output", help="Файл .xlsx или .csv")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--since", help="Начало сессии (ISO-дата/время), по умолчанию вся история")
+    parser.add_argument("--sheet", choices=["checklist", "history"], default="checklist",
+                        help="Лист для выгрузки в CSV")
+    args = parser.parse_args(argv)
+
+    table, cfg = load_point_table(args.config)
+    port = cfg.get("com_port", "COM3")
+    addresses = table.address_map(port)
+    types = {key: table.type(key) for key in addresses}
+    profiles = table.profile_map(port)
+    decoder = StatusDecoder.from_config(cfg)
+    history = HistoryStore(cfg.get("history_dir", "history"))
+    since = parse_since(args.since)
+    until = time.time()
+
+    def decode(key, value):
+        return decoder.table(types[key], profiles.get(key))[value]
+
+    started = time.perf_counter()
+    path = coverage_path(cfg)
+    coverage = CoverageTracker(path) if path else None
+    rows = rows_from_history(decoder, addresses, types, history, until, coverage, profiles)
+    points = [(key, addresses[key]) for key in addresses]
+    if args.output.lower().endswith(".xlsx"):
+        write_xlsx(args.output, report_sheets(history, rows, points, decode, since, until))
+    elif args.sheet == "checklist":
+        write_csv(args.output, CHECKLIST_HEADER,
+                  checklist_rows(rows, first_detected(history, rows, since, until)))
+    else:
+        write_csv(args.output, HISTORY_HEADER, history_rows(history, points, decode, since, until))
+    print(f"Выгрузка {args.output}: {time.perf_counter() - started:.2f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Исправность точек и приборов: автомат healthy / suspect / quarantined.
+
+Точка, не ответившая (None) или ответившая 0xffff (нет связи с прибором),
+становится подозрительной, после QUARANTINE_AFTER таких чтений подряд -
+уходит в карантин. Прибор (unit), по которому UNIT_QUARANTINE_AFTER
+чтений подряд остались без ответа, отправляет в карантин сразу все свои
+точки. Точки в карантине не читаются в основном расписании: планировщик
+опрашивает их пробами в свободное от основного опроса время, с интервалом
+от PROBE_MIN до PROBE_MAX, удваивающимся после каждой неудачной пробы.
+Первое нормальное значение возвращает точку в основной опрос.
+
+Состояние прибора выводится из его точек: quarantined - все в карантине,
+suspect - есть неисправные, иначе healthy.
+
+    "health": {"quarantine_after": 3, "unit_quarantine_after": 5, "probe_min": 5, "probe_max": 300}
+"""
+
+import logging
+
+log = logging.getLogger(__name__)
+
+NO_LINK = 0xffff
+
+HEALTHY = "healthy"
+SUSPECT = "suspect"
+QUARANTINED = "quarantined"
+# Коды состояний в образе регистров и метриках
+STATES = (HEALTHY, SUSPECT, QUARANTINED)
+LABELS = {HEALTHY: "в норме", SUSPECT: "под подозрением", QUARANTINED: "в карантине"}
+
+QUARANTINE_AFTER = 3
+UNIT_QUARANTINE_AFTER = 5
+PROBE_MIN = 5.0
+PROBE_MAX = 300.0
+
+
+class PointHealth:
+    """Состояние одной точки"""
+
+    __slots__ = ('state', 'failures', 'probes', 'since')
+
+    def __init__(self, since=None):
+        self.state = HEALTHY
+        self.failures = 0
+        self.probes = 0
+        self.since = since
+
+
+class HealthTracker:
+    """Исправность точек и приборов по результатам чтений (только поток опроса)"""
+
+    def __init__(self, quarantine_after=QUARANTINE_AFTER, unit_quarantine_after=UNIT_QUARANTINE_AFTER,
+                 probe_min=PROBE_MIN, probe_max=PROBE_MAX):
+        self.quarantine_after = quarantine_after
+        self.unit_quarantine_after = unit_quarantine_after
+        self.probe_min = probe_min
+        self.probe_max = probe_max
+        self.points = {}
+        self.units = {}
+        self.unit_failures = {}
+        # Растёт при каждой смене состояния точки: потребителям не нужно сравнивать все точки
+        self.version = 0
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Автомат по разделу "health" конфига; None, если карантин отключён ("enabled": false)"""
+        health = cfg.get("health") or {}
+        if not health.get("enabled", True):
+            return None
+        return cls(health.get("quarantine_after", QUARANTINE_AFTER),
+                   health.get("unit_quarantine_after", UNIT_QUARANTINE_AFTER),
+                   health.get("probe_min", PROBE_MIN), health.get("probe_max", PROBE_MAX))
+
+    def configure(self, units):
+        """Точки опроса: ключ -> unit; состояние оставшихся точек сохраняется"""
+        self.units = dict(units)
+        self.points = {key: self.points.get(key) or PointHealth() for key in self.units}
+        self.version += 1
+        self.unit_failures = {unit: count for unit, count in self.unit_failures.items()
+                              if unit in set(self.units.values())}
+
+    def state(self, key):
+        point = self.points.get(key)
+        return point.state if point is not None else HEALTHY
+
+    def _set(self, key, point, state, now):
+        if point.state == state:
+            return
+        if state == QUARANTINED:
+            log.warning("Точка %s в карантине: нет ответа или связи %d раз подряд", key, point.failures)
+        elif point.state == QUARANTINED:
+            log.info("Точка %s снова отвечает, возврат в основной опрос", key)
+        point.state = state
+        point.since = now
+        self.version += 1
+        if state != QUARANTINED:
+            point.probes = 0
+
+    def observe(self, key, value, now):
+        """Учитывает результат чтения точки, возвращает её новое состояние"""
+        point = self.points.get(key)
+        if point is None:
+            return HEALTHY
+        unit = self.units.get(key)
+
+        if value is None:
+            self.unit_failures[unit] = self.unit_failures.get(unit, 0) + 1
+            if self.unit_failures[unit] == self.unit_quarantine_after:
+                self._quarantine_unit(unit, now)
+        else:
+            self.unit_failures[unit] = 0
+
+        if value is None or value == NO_LINK:
+            point.failures += 1
+            if point.state == QUARANTINED:
+                point.probes += 1
+            elif point.failures >= self.quarantine_after:
+                self._set(key, point, QUARANTINED, now)
+            else:
+                self._set(key, point, SUSPECT, now)
+        else:
+            point.failures = 0
+            self._set(key, point, HEALTHY, now)
+        return point.state
+
+    def _quarantine_unit(self, unit, now):
+        log.warning("Прибор unit %s не отвечает %d чтений подряд, его точки в карантине",
+                    unit, self.unit_quarantine_after)
+        for key, point_unit in self.units.items():
+            point = self.points[key]
+            if point_unit == unit and point.state != QUARANTINED:
+                point.failures = max(point.failures, self.quarantine_after)
+                self._set(key, point, QUARANTINED, now)
+
+    def probe_delay(self, key):
+        """Интервал до следующей пробы точки в карантине, с"""
+        point = self.points.get(key)
+        probes = point.probes if point is not None else 0
+        return min(self.probe_max, self.probe_min * 2 ** min(probes, 32))
+
+    def unit_state(self, unit):
+        points = self.points
+        states = [points[key].state for key, point_unit in self.units.items()
+                  if point_unit == unit and key in points]
+        if states and all(state == QUARANTINED for state in states):
+            return QUARANTINED
+        if any(state != HEALTHY for state in states):
+            return SUSPECT
+        return HEALTHY
+
+    def states(self):
+        """Копия состояний точек: ключ -> состояние"""
+        return {key: point.state for key, point in list(self.points.items())}
+
+    def counts(self):
+        """Число точек в каждом состоянии"""
+        counts = dict.fromkeys(STATES, 0)
+        for point in list(self.points.values()):
+            counts[point.state] += 1
+        return counts
+
+    def render_metrics(self):
+        """Строки Prometheus: состояние точек и приборов (0 - норма, 1 - подозрение, 2 - карантин)"""
+        lines = ["# HELP r3_points_health Число точек в состоянии исправности",
+                 "# TYPE r3_points_health gauge"]
+        for state, count in self.counts().items():
+            lines.append(f'r3_points_health{{state="{state}"}} {count}')
+        lines.append("# HELP r3_unit_health Исправность прибора: 0 - норма, 1 - подозрение, 2 - карантин")
+        lines.append("# TYPE r3_unit_health gauge")
+        for unit in sorted(set(self.units.values()), key=str):
+            lines.append(f'r3_unit_health{{unit="{unit}"}} {STATES.index(self.unit_state(unit))}')
+        lines.append("# HELP r3_point_health Исправность точки вне нормы: 1 - подозрение, 2 - карантин")
+        lines.append("# TYPE r3_point_health gauge")
+        for key, point in sorted(list(self.points.items())):
+            if point.state != HEALTHY:
+                lines.append(f'r3_point_health{{point="{key}"}} {STATES.index(point.state)}')
+        return lines
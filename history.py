@@ -0,0 +1,279 @@
+"""Компактная история значений регистров на диске.
+
+Для каждой точки ведётся каталог сегментов. Запись добавляется только при
+изменении значения и занимает 6 байт: смещение времени от начала сегмента
+в миллисекундах (uint32) и сырое 16-битное слово. Рядом с каждым сегментом
+лежит небольшой индекс: время каждой INDEX_STRIDE-й записи. Чтение идёт через
+mmap, поэтому запросы "значение точки X в момент T" и "все изменения между
+T1 и T2" не загружают файлы в память целиком.
+
+Время записей точки не убывает: если системные часы перевели назад,
+запись получает время последней записанной, а не открывает сегмент с
+более ранним началом (сегменты упорядочены по времени начала).
+"""
+
+import bisect
+import logging
+import mmap
+import os
+import re
+import struct
+import time
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'R3HS'
+HEADER = struct.Struct('<4sHQ')     # сигнатура, версия, начало сегмента (мс)
+RECORD = struct.Struct('<IH')       # смещение от начала сегмента (мс), значение
+INDEX_ENTRY = struct.Struct('<II')  # смещение (мс), номер записи
+VERSION = 1
+
+# Записей в сегменте до перехода на новый
+SEGMENT_RECORDS = 65536
+# Шаг разреженного индекса внутри сегмента
+INDEX_STRIDE = 256
+# Предел смещения uint32 (около 49 суток)
+MAX_DELTA_MS = 0xffffffff
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def repair_segment(path):
+    """Приводит сегмент в порядок после аварийной остановки.
+
+    Недописанная запись в конце файла отрезается (иначе следующие записи
+    легли бы со сдвигом), индекс пересобирается, если не совпадает с
+    записями. Возвращает False, если от сегмента не осталось даже заголовка.
+    """
+    size = os.path.getsize(path)
+    if size < HEADER.size:
+        log.warning("Сегмент истории %s без заголовка, удалён", path)
+        os.remove(path)
+        if os.path.exists(path[:-4] + '.idx'):
+            os.remove(path[:-4] + '.idx')
+        return False
+    count = (size - HEADER.size) // RECORD.size
+    end = HEADER.size + count * RECORD.size
+    index_path = path[:-4] + '.idx'
+    index_size = os.path.getsize(index_path) if os.path.exists(index_path) else -1
+    entries = (count + INDEX_STRIDE - 1) // INDEX_STRIDE
+    if size == end and index_size == entries * INDEX_ENTRY.size:
+        return True
+
+    with open(path, 'r+b') as f:
+        if size != end:
+            log.warning("Сегмент истории %s: отрезана недописанная запись (%d байт)", path, size - end)
+            f.truncate(end)
+        f.seek(HEADER.size)
+        data = f.read(count * RECORD.size)
+    index = b''.join(INDEX_ENTRY.pack(RECORD.unpack_from(data, number * RECORD.size)[0], number)
+                     for number in range(0, count, INDEX_STRIDE))
+    temporary = index_path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(index)
+    os.replace(temporary, index_path)
+    return True
+
+
+def point_dirname(point):
+    """Имя каталога точки, безопасное для файловой системы"""
+    return re.sub(r'[^0-9A-Za-z_.-]', '_', str(point))
+
+
+class _Segment:
+    """Открытый на запись сегмент одной точки"""
+
+    def __init__(self, path, base_ms, count, last_ms=None):
+        self.path = path
+        self.base_ms = base_ms
+        self.count = count
+        # Время последней записи: следующие не раньше него
+        self.last_ms = base_ms if last_ms is None else last_ms
+        self.data = open(path, 'ab', buffering=0)
+        self.index = open(path[:-4] + '.idx', 'ab', buffering=0)
+
+    def append(self, ts_ms, value):
+        delta = ts_ms - self.base_ms
+        if self.count % INDEX_STRIDE == 0:
+            self.index.write(INDEX_ENTRY.pack(delta, self.count))
+        self.data.write(RECORD.pack(delta, value))
+        self.count += 1
+        self.last_ms = ts_ms
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+
+class _SegmentReader:
+    """Чтение сегмента через mmap"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        _, _, self.base_ms = HEADER.unpack_from(self.map, 0)
+        self.count = (size - HEADER.size) // RECORD.size
+
+        with open(path[:-4] + '.idx', 'rb') as f:
+            raw = f.read()
+        entries = [INDEX_ENTRY.unpack_from(raw, offset)
+                   for offset in range(0, len(raw) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size)]
+        self.index_times = [self.base_ms + delta for delta, _ in entries]
+        self.index_records = [number for _, number in entries]
+
+    def record(self, number):
+        delta, value = RECORD.unpack_from(self.map, HEADER.size + number * RECORD.size)
+        return self.base_ms + delta, value
+
+    def first_after(self, ts_ms):
+        """Номер первой записи со временем > ts_ms"""
+        position = bisect.bisect_right(self.index_times, ts_ms)
+        start = self.index_records[position - 1] if position else 0
+        end = self.index_records[position] if position < len(self.index_records) else self.count
+        end = min(end, self.count)
+        # Внутри шага индекса - двоичный поиск по записям в mmap
+        low, high = start, end
+        while low < high:
+            middle = (low + high) // 2
+            if self.record(middle)[0] <= ts_ms:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class HistoryStore:
+    """Хранилище истории изменений по точкам"""
+
+    def __init__(self, root, segment_records=SEGMENT_RECORDS):
+        self.root = root
+        self.segment_records = segment_records
+        self.segments = {}
+        self.last_values = {}
+        os.makedirs(root, exist_ok=True)
+
+    def _point_dir(self, point):
+        return os.path.join(self.root, point_dirname(point))
+
+    def _segment_paths(self, point):
+        """Пути сегментов точки по возрастанию времени начала"""
+        directory = self._point_dir(point)
+        if not os.path.isdir(directory):
+            return []
+        names = sorted((int(name[4:-4]), name) for name in os.listdir(directory)
+                       if name.startswith('seg-') and name.endswith('.dat'))
+        return [os.path.join(directory, name) for _, name in names]
+
+    def _open_segment(self, point, ts_ms):
+        directory = self._point_dir(point)
+        os.makedirs(directory, exist_ok=True)
+        # Сегмент с тем же началом (переход в ту же миллисекунду) не перезаписывается
+        while True:
+            path = os.path.join(directory, f'seg-{ts_ms:013d}.dat')
+            try:
+                with open(path, 'xb') as f:
+                    f.write(HEADER.pack(MAGIC, VERSION, ts_ms))
+                break
+            except FileExistsError:
+                ts_ms += 1
+        open(path[:-4] + '.idx', 'wb').close()
+        return _Segment(path, ts_ms, 0)
+
+    def _resume(self, point):
+        """Продолжает последний сегмент точки после перезапуска"""
+        paths = self._segment_paths(point)
+        while paths and not repair_segment(paths[-1]):
+            paths.pop()
+        if not paths:
+            return None
+        reader = _SegmentReader(paths[-1])
+        try:
+            last_ms = None
+            if reader.count:
+                last_ms, self.last_values[point] = reader.record(reader.count - 1)
+            return _Segment(paths[-1], reader.base_ms, reader.count, last_ms)
+        finally:
+            reader.close()
+
+    def append(self, point, value, ts=None):
+        """Добавляет значение, если оно изменилось; возвращает True, если записано"""
+        if value is None:
+            return False
+        segment = self.segments.get(point)
+        if segment is None and point not in self.last_values:
+            segment = self.segments[point] = self._resume(point)
+        if self.last_values.get(point) == value:
+            return False
+
+        ts_ms = int(ts * 1000) if ts is not None else _now_ms()
+        if segment is not None and ts_ms < segment.last_ms:
+            # Часы перевели назад: время записи не уходит раньше уже записанных
+            ts_ms = segment.last_ms
+        if (segment is None or segment.count >= self.segment_records
+                or ts_ms - segment.base_ms > MAX_DELTA_MS):
+            if segment is not None:
+                segment.close()
+            segment = self.segments[point] = self._open_segment(point, ts_ms)
+            # Начало сегмента могло сдвинуться из-за совпадения имён
+            ts_ms = max(ts_ms, segment.base_ms)
+
+        segment.append(ts_ms, value)
+        self.last_values[point] = value
+        return True
+
+    def value_at(self, point, ts):
+        """Значение точки в момент ts (последнее изменение не позже ts) или None"""
+        ts_ms = int(ts * 1000)
+        paths = self._segment_paths(point)
+        starts = [int(os.path.basename(path)[4:-4]) for path in paths]
+        position = bisect.bisect_right(starts, ts_ms)
+        for path in reversed(paths[:position]):
+            reader = _SegmentReader(path)
+            try:
+                number = reader.first_after(ts_ms)
+                if number:
+                    return reader.record(number - 1)[1]
+            finally:
+                reader.close()
+        return None
+
+    def changes(self, point, start, end):
+        """Все изменения точки в интервале [start, end]: список (время, значение)"""
+        return list(self.iter_changes(point, start, end))
+
+    def iter_changes(self, point, start, end):
+        """Изменения точки в интервале [start, end] по одному, без загрузки в память"""
+        start_ms = int(start * 1000)
+        end_ms = int(end * 1000)
+        paths = self._segment_paths(point)
+        starts = [int(os.path.basename(path)[4:-4]) for path in paths]
+
+        first = max(0, bisect.bisect_right(starts, start_ms) - 1)
+        for path in paths[first:]:
+            if int(os.path.basename(path)[4:-4]) > end_ms:
+                break
+            reader = _SegmentReader(path)
+            try:
+                number = reader.first_after(start_ms - 1)
+                while number < reader.count:
+                    ts_ms, value = reader.record(number)
+                    if ts_ms > end_ms:
+                        return
+                    yield ts_ms / 1000, value
+                    number += 1
+            finally:
+                reader.close()
+
+    def close(self):
+        for segment in self.segments.values():
+            if segment is not None:
+                segment.close()
+        self.segments.clear()
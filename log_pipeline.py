@@ -0,0 +1,129 @@
+"""Журналирование вне потока опроса.
+
+Поток опроса только кладёт записи в очередь (без ожидания), а вывод в
+файл с ротацией и/или в консоль делает фоновый поток QueueListener. Уровень
+задаётся в конфиге, поэтому отладочный вывод каждого чтения в работе
+выключен. Повторяющиеся одинаковые ошибки пропускаются и сводятся в одну
+запись "повторилось N раз".
+
+Настройки в config.json:
+
+    "logging": {"level": "INFO", "file": "monitor.log", "console": true,
+                "max_bytes": 1048576, "backup_count": 5, "repeat_window": 30}
+"""
+
+import logging
+import logging.handlers
+import queue
+import time
+
+# Ёмкость очереди: при переполнении записи отбрасываются, а не блокируют опрос
+QUEUE_SIZE = 10000
+FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+CONSOLE_FORMAT = "%(message)s"
+# Предел числа отслеживаемых повторов: в ключ входят адреса и значения
+REPEAT_KEYS = 10000
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который при заполненной очереди отбрасывает запись"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RepeatFilter(logging.Filter):
+    """Пропускает повтор одинаковой записи (уровень WARNING и выше) чаще раза в window секунд"""
+
+    def __init__(self, window=30.0, clock=time.monotonic, max_keys=REPEAT_KEYS):
+        super().__init__()
+        self.window = window
+        self.clock = clock
+        self.max_keys = max_keys
+        self.seen = {}
+        self.swept = clock()
+
+    def _sweep(self, now):
+        """Забывает записи, окно которых истекло без повторов; не больше max_keys записей"""
+        self.seen = {key: entry for key, entry in self.seen.items()
+                     if entry[1] or now - entry[0] < self.window}
+        # Отброшенные записи с подавленными повторами теряют только счётчик
+        while len(self.seen) >= self.max_keys:
+            del self.seen[next(iter(self.seen))]
+        self.swept = now
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING or self.window <= 0:
+            return True
+
+        key = (record.name, record.levelno, record.msg, record.args if isinstance(record.args, tuple) else None)
+        now = self.clock()
+        if now - self.swept >= self.window or len(self.seen) >= self.max_keys:
+            self._sweep(now)
+        first, suppressed = self.seen.get(key, (None, 0))
+        if first is not None and now - first < self.window:
+            self.seen[key] = (first, suppressed + 1)
+            return False
+
+        self.seen[key] = (now, 0)
+        if suppressed:
+            record.msg = f"{record.msg} (повторилось ещё {suppressed} раз)"
+        return True
+
+
+_listener = None
+
+
+def setup_logging(settings=None):
+    """Настраивает корневой логгер на фоновую запись; возвращает QueueListener"""
+    global _listener
+    settings = settings or {}
+    if _listener is not None:
+        _listener.stop()
+
+    handlers = []
+    if settings.get("console", True):
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        handlers.append(console)
+    if settings.get("file"):
+        file_handler = logging.handlers.RotatingFileHandler(
+            settings["file"],
+            maxBytes=settings.get("max_bytes", 1024 * 1024),
+            backupCount=settings.get("backup_count", 5),
+            encoding="utf-8"
+        )
+        file_handler.setFormatter(logging.Formatter(FORMAT))
+        handlers.append(file_handler)
+
+    log_queue = queue.Queue(settings.get("queue_size", QUEUE_SIZE))
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(RepeatFilter(settings.get("repeat_window", 30.0)))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, str(settings.get("level", "INFO")).upper(), logging.INFO))
+
+    # Журнал запросов Flask не нужен в консоли на каждый запрос браузера
+    logging.getLogger("werkzeug").setLevel(settings.get("web_level", "WARNING"))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает фоновый поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
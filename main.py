@@ -1,17 +1,11 @@
-import json
 import time
-from pymodbus.client import ModbusSerialClient
-
-
-def load_config():
-    with open("config.json", "r", encoding="utf-8") as f:
-        return json.load(f)
+from point_table import load_config
 
 
 def read_register(client, unit_id, address):
     try:
         address = int(address)
-        result = client.read_holding_registers(address, 1, unit=unit_id)
+        result = client.read_holding_registers(address, count=1, device_id=unit_id)
         if result and result.registers:
             return result.registers[0]
         else:
@@ -29,6 +23,8 @@ def main():
 
     addresses = cfg["address"]
 
+    from pymodbus.client import ModbusSerialClient
+
     client = ModbusSerialClient(
         port=port,
         baudrate=baud,
@@ -1,200 +1,76 @@
 import json
-import time
-from pymodbus.client import ModbusSerialClient
-import os
+import logging
+import multiprocessing
+import signal
 from datetime import datetime
-from flask import Flask, render_template_string
+import tempfile
 import threading
-
-# Глобальные переменные для обмена данными между потоками
-current_results = []
-last_update_time = ""
-
-
-def load_config():
-    with open("config.json", "r", encoding="utf-8") as f:
-        return json.load(f)
-
-
-def read_register(client, address):
-    try:
-        address = int(address)
-        print(f"Попытка чтения регистра {address}...")
-        result = client.read_holding_registers(address)
-        if result and not result.isError():
-            print(f"Успешно прочитан регистр {address}: {hex(result.registers[0])}")
-            return hex(result.registers[0])
-        else:
-            print(f"Ошибка чтения регистра {address}: {result}")
-            return None
-    except Exception as e:
-        print(f"Исключение при чтении регистра {address}: {e}")
-        return None
-
-
-class StatusDecoder:
-    def __init__(self):
-        self.status_masks_device = {
-            0x00: "Норма, отсутствие неисправностей",
-            0x01: "Неисправность",
-            0x02: "Пожар/Внимание",
-            0x04: "Тревога",
-            0x08: "Отключен",
-            0x10: "Автоматика откл",
-            0x20: "Запуск СПТ",
-            0x40: "Вскрытие",
-            0x80: "Неисправность питания",
-            0x0200: "На охране",
-            0x0400: "Обрыв АЛС",
-            0x0800: "Короткое замыкание АЛС"
-        }
-
-        self.status_masks_actuator = {
-            0x00: "Выключено, отсутствие неисправностей",
-            0x01: "Включено",
-            0x02: "Автоматика вкл",
-            0x04: "Неисправность",
-            0x10: "Потеря связи",
-            0x20: "Отсутствие 220В",
-            0x40: "Отсутствие АКБ",
-            0x0200: "Заслонка ЗАКРЫТА",
-            0x0400: "Заслонка ОТКРЫТА",
-            0x0800: "Заслонка закрывается",
-            0x1000: "Заслонка открывается"
-        }
-
-        self.status_masks_sec_zone = {
-            0x00: "Не на охране",
-            0x01: "Тревога",
-            0x02: "Задержка по входу/выходу",
-            0x04: "Неудачная постановка на охрану",
-            0x20: "На охране"
-        }
-
-        self.status_masks_fire_zone = {
-            0x00: "Норма, отсутствие неисправностей",
-            0x01: "Внимание",
-            0x02: "Неисправность",
-            0x08: "Отключено («Обход»)",
-            0x80: "Пожар"
-        }
-
-        # Обратное соответствие название -> код
-        self.state_to_code = {}
-        self._build_reverse_mapping()
-
-    def _build_reverse_mapping(self):
-        """Строит обратное соответствие название состояния -> код"""
-        for code, name in self.status_masks_device.items():
-            self.state_to_code[name] = hex(code)
-        for code, name in self.status_masks_actuator.items():
-            self.state_to_code[name] = hex(code)
-        for code, name in self.status_masks_sec_zone.items():
-            self.state_to_code[name] = hex(code)
-        for code, name in self.status_masks_fire_zone.items():
-            self.state_to_code[name] = hex(code)
-
-    def create_checklist_from_config(self, addresses):
-        """Создает чек-лист на основе конфигурации"""
-        checklist = []
-
-        # Приборы
-        device_keys = [key for key in addresses.keys()
-                       if "device" in key and addresses[key] and addresses[key].strip()]
-        for key in device_keys:
-            section_name = f'Прибор "{key}"'
-            for code, description in self.status_masks_device.items():
-                checklist.append((section_name, description, hex(code)))
-
-        # Исполнительные устройства
-        actuator_keys = [key for key in addresses.keys()
-                         if "actuator" in key and addresses[key] and addresses[key].strip()]
-        for key in actuator_keys:
-            section_name = f'Исполнительное устройство "{key}"'
-            for code, description in self.status_masks_actuator.items():
-                checklist.append((section_name, description, hex(code)))
-
-        # Охранные зоны
-        security_keys = [key for key in addresses.keys()
-                         if "security_zone" in key and addresses[key] and addresses[key].strip()]
-        for key in security_keys:
-            section_name = f'Охранная зона "{key}"'
-            for code, description in self.status_masks_sec_zone.items():
-                checklist.append((section_name, description, hex(code)))
-
-        # Пожарные зоны
-        fire_keys = [key for key in addresses.keys()
-                     if "fire_zone" in key and addresses[key] and addresses[key].strip()]
-        for key in fire_keys:
-            section_name = f'Пожарная зона "{key}"'
-            for code, description in self.status_masks_fire_zone.items():
-                checklist.append((section_name, description, hex(code)))
-
-        return checklist
-
-    def hex_int(self, status_value):
-        if isinstance(status_value, str):
-            if status_value.startswith('0x'):
-                status_value = int(status_value, 16)
-            else:
-                status_value = int(status_value)
-        return status_value
-
-    def decode_device(self, status_value):
-        active = []
-        status_value = self.hex_int(status_value)
-
-        if status_value == 0xffff:
-            active.append('Неизвестно или нет связи с прибором')
-        else:
-            for mask, description in self.status_masks_device.items():
-                if status_value & mask:
-                    active.append(description)
-        return active
-
-    def decode_actuator(self, status_value):
-        active = []
-        status_value = self.hex_int(status_value)
-        if status_value == 0xffff:
-            active.append('Неизвестно или нет связи с прибором')
-        else:
-            for mask, description in self.status_masks_actuator.items():
-                if status_value & mask:
-                    active.append(description)
-        return active
-
-    def decode_sec_zone(self, status_value):
-        active = []
-        status_value = self.hex_int(status_value)
-        if status_value == 0xffff:
-            active.append('Неизвестно или нет связи с прибором')
-        else:
-            for mask, description in self.status_masks_sec_zone.items():
-                if status_value & mask:
-                    active.append(description)
-        return active
-
-    def decode_fire_zone(self, status_value):
-        active = []
-        status_value = self.hex_int(status_value)
-        if status_value == 0xffff:
-            active.append('Неизвестно или нет связи с прибором')
-        else:
-            for mask, description in self.status_masks_fire_zone.items():
-                if status_value & mask:
-                    active.append(description)
-        return active
-
-
-# Web интерфейс
-app = Flask(__name__)
+import time
+from scheduler import PollScheduler, run_scheduled
+from status_tables import StatusDecoder, describe_point
+from web_push import ChangeFeed
+from checklist import ChecklistIndex
+from snapshot import ChecklistRow, PointBuffer, PointState, Snapshot, EMPTY, health_counts
+from points_api import points_response
+from events import EventConsumer, EventEngine, EventFileWriter, event_record, log_event
+from export import (CHECKLIST_HEADER, HISTORY_HEADER, checklist_rows, first_detected, history_rows,
+                    iter_csv, parse_since, report_sheets, write_xlsx)
+from history import HistoryStore
+from metrics import PollMetrics, InstrumentedClient
+from log_pipeline import setup_logging, shutdown_logging
+from point_table import PointTableWatcher, point_type
+from profiles import ProfileError
+from shared_image import SharedImageReader, SharedImageWriter
+from capture import CaptureWriter, RecordingClient, ReplayClient, ReplayFinished
+from timing import AdaptiveTimingClient, TimingController
+from health import HEALTHY, QUARANTINED, STATES, SUSPECT, HealthTracker
+from commands import CommandClient
+from state_coverage import CoverageTracker, coverage_path
+
+log = logging.getLogger("main_nt")
+
+# Опубликованный снимок чек-листа: поток опроса подменяет ссылку целиком,
+# веб-потоки читают её один раз за запрос
+snapshot = EMPTY
+# Лента изменений для Server-Sent Events
+change_feed = ChangeFeed()
+# Индекс (ключ конфига, маска) -> строка чек-листа
+checklist_index = None
+# Покрытие состояний за сессию: в процессе опроса - с файлом, в веб-процессе - из образа регистров
+coverage = CoverageTracker()
+# Состояния точек для /api/v1/points
+point_buffer = None
+# События по фронтам битов: кольцевой буфер и подписчики
+event_engine = EventEngine()
+# Отдельный экземпляр хранилища истории только для чтения из веб-потоков (выгрузка)
+history_reader = None
+# Образ регистров процесса опроса (только в веб-процессах многопроцессного режима)
+image_reader = None
+# Очередь команд приборам (commands.CommandClient); None - запись не включена или веб-процесс
+commands = None
+
+# Порт веб-интерфейса; веб-процессы занимают порты подряд начиная с него
+WEB_PORT = 5000
+# Период проверки образа регистров веб-процессом, с
+FOLLOW_INTERVAL = 0.2
+# Период выгрузки метрик процесса опроса в образ, с
+METRICS_INTERVAL = 5.0
+# Метрики опроса для /metrics
+metrics = PollMetrics()
+
+
+# Web интерфейс (Flask загружается только в режимах со страницей, см. create_app)
+app = None
+# Сколько последних событий показывает страница
+EVENTS_SHOWN = 20
+# Наибольшее ожидание подтверждения команды в запросе API, с
+COMMAND_WAIT_MAX = 30.0
 
 HTML_TEMPLATE = """
 <!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
-    <meta http-equiv="refresh" content="2">
     <title>Тестирование R3-МС-КП</title>
     <style>
         body { 
@@ -263,10 +139,47 @@ HTML_TEMPLATE = """
         <h1>📊 Тестирование R3-МС-КП</h1>
 
         <div class="status">
-            <strong>Последнее обновление:</strong> {{ time }} | 
-            <strong>Всего состояний:</strong> {{ total_states }} | 
-            <strong>Обнаружено:</strong> <span style="color: green">{{ active_states }}</span> | 
-            <strong>Ожидание:</strong> <span style="color: red">{{ inactive_states }}</span>
+            <strong>Последнее обновление:</strong> <span id="time">{{ time }}</span> | 
+            <strong>Всего состояний:</strong> <span id="total_states">{{ total_states }}</span> | 
+            <strong>Обнаружено за сессию:</strong> <span id="active_states" style="color: green">{{ active_states }}</span> | 
+            <strong>Ожидание:</strong> <span id="inactive_states" style="color: red">{{ inactive_states }}</span> |
+            <button onclick="if (confirm('Начать новую сессию? Отметки чек-листа будут сброшены.')) fetch('/api/v1/coverage/reset', {method: 'POST'});">Новая сессия</button>
+        </div>
+
+        <div class="status">
+            <strong>Точек под подозрением:</strong> <span id="suspect_points">{{ suspect_points }}</span> |
+            <strong>В карантине (опрос пробами):</strong> <span id="quarantined_points" style="color: red">{{ quarantined_points }}</span>
+        </div>
+
+        <div class="status">
+            <strong>Выгрузка:</strong>
+            <a href="/export/report.xlsx">отчёт XLSX</a> |
+            <a href="/export/checklist.csv">чек-лист CSV</a> |
+            <a href="/export/history.csv">история CSV</a>
+        </div>
+
+        <div class="section">
+            <h2>Журнал событий</h2>
+            <table>
+                <thead>
+                    <tr>
+                        <th>Время</th>
+                        <th>Событие</th>
+                        <th>Точка</th>
+                        <th>Код</th>
+                    </tr>
+                </thead>
+                <tbody id="events">
+                    {% for event in events %}
+                    <tr class="{{ 'fail' if event.kind in ('raise', 'no_link') else 'success' }}">
+                        <td>{{ event.time }}</td>
+                        <td>{{ event.label }}{{ ' - возникло' if event.kind == 'raise' else ' - снято' if event.kind == 'clear' else '' }}</td>
+                        <td>{{ event.key }} ({{ event.address }})</td>
+                        <td>{{ event.mask }}</td>
+                    </tr>
+                    {% endfor %}
+                </tbody>
+            </table>
         </div>
 
         {% for section in sections %}
@@ -283,11 +196,11 @@ HTML_TEMPLATE = """
                 </thead>
                 <tbody>
                     {% for row in section.rows %}
-                    <tr class="{{ 'success' if row.result == '✅' else 'fail' if row.result == '❌' else 'header' }}">
+                    <tr id="row-{{ row.id }}" class="{{ 'success' if row.result == '✅' else 'fail' if row.result == '❌' else 'header' }}">
                         <td>{{ row.state }}</td>
                         <td>{{ row.expected }}</td>
-                        <td>{{ row.actual }}</td>
-                        <td>{{ row.result }}</td>
+                        <td class="actual">{{ row.actual }}</td>
+                        <td class="result">{{ row.result }}</td>
                     </tr>
                     {% endfor %}
                 </tbody>
@@ -295,199 +208,709 @@ HTML_TEMPLATE = """
         </div>
         {% endfor %}
 
-        <div style="text-align: center; color: #6c757d; margin-top: 30px;">
-            Авто-обновление каждые 2 секунды
+        <div id="feed-status" style="text-align: center; color: #6c757d; margin-top: 30px;">
+            Обновление в реальном времени
         </div>
     </div>
+    <script>
+        // Применяем на месте только изменившиеся строки
+        var source = new EventSource('/events?v={{ version }}');
+        source.onmessage = function (event) {
+            var data = JSON.parse(event.data);
+            if (data.reload) {
+                window.location.reload();
+                return;
+            }
+            data.rows.forEach(function (row) {
+                var tr = document.getElementById('row-' + row.id);
+                if (!tr) {
+                    return;
+                }
+                tr.className = row.result === '✅' ? 'success' : row.result === '❌' ? 'fail' : 'header';
+                tr.querySelector('.actual').textContent = row.actual;
+                tr.querySelector('.result').textContent = row.result;
+            });
+            if (data.stats) {
+                for (var name in data.stats) {
+                    document.getElementById(name).textContent = data.stats[name];
+                }
+            }
+        };
+        source.onerror = function () {
+            document.getElementById('feed-status').textContent = 'Нет связи с сервером, переподключение...';
+        };
+        source.onopen = function () {
+            document.getElementById('feed-status').textContent = 'Обновление в реальном времени';
+        };
+
+        // Новые события добавляются сверху журнала
+        var alarms = new EventSource('/api/v1/events/stream?since={{ event_seq }}');
+        alarms.onmessage = function (message) {
+            var event = JSON.parse(message.data);
+            var action = event.kind === 'raise' ? ' - возникло' : event.kind === 'clear' ? ' - снято' : '';
+            var tr = document.createElement('tr');
+            tr.className = event.kind === 'raise' || event.kind === 'no_link' ? 'fail' : 'success';
+            [event.time, event.label + action, event.key + ' (' + event.address + ')', event.mask].forEach(function (text) {
+                var td = document.createElement('td');
+                td.textContent = text;
+                tr.appendChild(td);
+            });
+            var body = document.getElementById('events');
+            body.insertBefore(tr, body.firstChild);
+            while (body.rows.length > {{ events_shown }}) {
+                body.deleteRow(body.rows.length - 1);
+            }
+        };
+    </script>
 </body>
 </html>
 """
 
 
-@app.route('/')
-def index():
-    global current_results, last_update_time
-
-    # Группируем результаты по секциям
-    sections = {}
-    for row in current_results:
-        section_name = row['section']
-        if section_name not in sections:
-            sections[section_name] = []
-        sections[section_name].append(row)
-
-    # Преобразуем в список для шаблона
-    section_list = []
-    for section_name, rows in sections.items():
-        section_list.append({
-            'name': section_name,
-            'rows': rows
-        })
-
-    # Статистика
-    total_states = len(current_results)
-    active_states = sum(1 for row in current_results if row['result'] == '✅')
-    inactive_states = total_states - active_states
-
-    return render_template_string(HTML_TEMPLATE,
-                                  sections=section_list,
-                                  time=last_update_time,
-                                  total_states=total_states,
-                                  active_states=active_states,
-                                  inactive_states=inactive_states)
-
-
-def start_web_server():
-    """Запускает веб-сервер в отдельном потоке"""
-    print("🚀 Запуск веб-сервера на http://localhost:5000")
-    app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
-
-
-def initialize_checklist(decoder, addresses):
-    """Инициализирует чек-лист на основе конфига"""
-    global current_results
-    checklist = decoder.create_checklist_from_config(addresses)
-
-    current_results = []
-    for section_name, state_name, expected_code in checklist:
-        current_results.append({
-            'section': section_name,
-            'state': state_name,
-            'expected': expected_code,
-            'actual': '',
-            'result': '❌'
-        })
-
-
-def update_web_results(current_states, decoder):
-    """Обновляет результаты для веб-интерфейса"""
-    global current_results, last_update_time
-
-    # Собираем все активные состояния
-    active_states = set()
-    for device_type in current_states.values():
-        for states_list in device_type.values():
-            active_states.update(states_list)
-
-    # Обновляем результаты
-    for result in current_results:
-        state_name = result['state']
-        if state_name in active_states:
-            result['actual'] = decoder.state_to_code.get(state_name, 'N/A')
-            result['result'] = '✅'
+def create_app():
+    """Приложение Flask со страницей чек-листа, API, выгрузками и метриками"""
+    from flask import Flask, render_template_string, request, Response, send_file
+
+    app = Flask(__name__)
+
+    @app.route('/')
+    def index():
+        # Одно чтение ссылки: вся страница строится по одному согласованному снимку,
+        # а изменения после его версии придут по /events
+        state = snapshot
+        # Последние события (новые сверху); дальше журнал пополняется по /api/v1/events/stream
+        events = event_engine.since(0, limit=EVENTS_SHOWN)
+        event_seq = events[-1].seq if events else event_engine.seq
+        health = health_counts(state.points)
+
+        return render_template_string(HTML_TEMPLATE,
+                                      sections=state.sections,
+                                      events=[event_record(event) for event in reversed(events)],
+                                      event_seq=event_seq,
+                                      events_shown=EVENTS_SHOWN,
+                                      time=state.time,
+                                      version=state.version,
+                                      total_states=state.total_states,
+                                      active_states=state.active_states,
+                                      inactive_states=state.inactive_states,
+                                      suspect_points=health.get(SUSPECT, 0),
+                                      quarantined_points=health.get(QUARANTINED, 0))
+
+
+    @app.route('/events')
+    def events():
+        """Поток изменений чек-листа (Server-Sent Events)"""
+        version = request.headers.get('Last-Event-ID') or request.args.get('v', '0')
+        try:
+            version = int(version)
+        except ValueError:
+            version = 0
+
+        return Response(change_feed.stream(version),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+    @app.route('/api/v1/points')
+    def api_points():
+        """Сырые значения, декодированные состояния и время изменения точек (JSON)"""
+        body, tag = points_response(snapshot, request.args, request.headers.get('Accept-Encoding', ''))
+        headers = {'ETag': f'"{tag}"', 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if request.if_none_match.contains_weak(tag):
+            return Response(status=304, headers=headers)
+
+        data, encoding = body()
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return Response(data, content_type='application/json; charset=utf-8', headers=headers)
+
+
+    @app.route('/api/v1/events')
+    def api_events():
+        """События из кольцевого буфера после номера since (JSON)"""
+        since = request.args.get('since', 0, type=int)
+        limit = request.args.get('limit', None, type=int)
+        events = event_engine.since(since, limit)
+        return Response(json.dumps({'seq': event_engine.seq, 'events': [event_record(event) for event in events]},
+                                   ensure_ascii=False),
+                        content_type='application/json; charset=utf-8')
+
+
+    @app.route('/api/v1/coverage')
+    def api_coverage():
+        """Покрытие состояний за сессию: маски и время первого/последнего появления по точкам"""
+        view = coverage.snapshot()
+        return json_response({'total_states': view.total_count(), 'active_states': view.active_count(),
+                              'points': [view.record(key) for key in view.keys]})
+
+
+    @app.route('/api/v1/coverage/reset', methods=['POST'])
+    def api_coverage_reset():
+        """Новая сессия пусконаладки: сброс покрытия выполняет поток опроса"""
+        if image_reader is not None:
+            return json_response({'error': "Сброс доступен только в однопроцессном режиме (web_workers = 0)"}, 503)
+        coverage.reset_requested = True
+        return json_response({'reset': True}, 202)
+
+
+    @app.route('/api/v1/commands', methods=['GET', 'POST'])
+    def api_commands():
+        """Последние команды (GET) или новая команда (POST JSON: key, action или value/mask/expect, wait)"""
+        if commands is None:
+            return json_response({'error': "Команды принимает только процесс опроса (web_workers = 0) с разделом "
+                                           "\"commands\": {\"enabled\": true} в конфиге"}, 503)
+        if request.method == 'GET':
+            return json_response({'commands': [command.record() for command in commands.commands()]})
+
+        authorization = request.headers.get('Authorization', '')
+        token = authorization[7:] if authorization.startswith('Bearer ') else None
+        if not commands.allows(request.remote_addr, token):
+            log.warning("⛔ Команда с %s отклонена: узел не разрешён или неверный токен", request.remote_addr)
+            return json_response({'error': "Запись с этого узла не разрешена (commands.token, commands.allowed_hosts)"},
+                                 403)
+
+        body = request.get_json(silent=True) or {}
+        if not isinstance(body, dict):
+            return json_response({'error': "Ожидается JSON-объект"}, 400)
+        # Все поля проверяются до постановки в очередь: ошибка в запросе не оставляет команду
+        try:
+            wait = min(float(body.get('wait', 0)), COMMAND_WAIT_MAX)
+            command = commands.submit(body.get('key'), body.get('action'), body.get('value'),
+                                      body.get('mask'), body.get('expect'), body.get('priority', 0))
+        except (TypeError, ValueError) as e:
+            return json_response({'error': str(e)}, 400)
+        # С wait ответ приходит после подтверждения; без него - сразу, статус по /api/v1/commands/<id>
+        if wait > 0:
+            command.wait(wait)
+        return json_response(command.record(), 200 if command.done.is_set() else 202)
+
+
+    @app.route('/api/v1/commands/<int:command_id>')
+    def api_command(command_id):
+        """Состояние команды по номеру"""
+        command = commands.get(command_id) if commands is not None else None
+        if command is None:
+            return json_response({'error': "Команда не найдена"}, 404)
+        return json_response(command.record())
+
+
+    @app.route('/api/v1/events/stream')
+    def api_events_stream():
+        """Поток новых событий (Server-Sent Events)"""
+        since = request.headers.get('Last-Event-ID') or request.args.get('since', '0')
+        try:
+            since = int(since)
+        except ValueError:
+            since = 0
+
+        return Response(event_engine.stream(since),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+    @app.route('/export/<name>')
+    def export_file(name):
+        """Выгрузка чек-листа и истории: report.xlsx, checklist.csv, history.csv (?since=начало сессии)"""
+        if history_reader is None:
+            return Response("История не ведётся", status=503)
+        try:
+            since = parse_since(request.args.get('since'))
+        except ValueError:
+            return Response("Неверный параметр since", status=400)
+
+        state = snapshot
+        buffer = point_buffer
+        until = time.time()
+        points = [(point.key, point.address) for point in state.points]
+
+        def decode(key, value):
+            return buffer.decoders[key][value]
+
+        if name == 'checklist.csv':
+            rows = checklist_rows(state.rows, first_detected(history_reader, state.rows, since, until))
+            body = iter_csv(CHECKLIST_HEADER, rows)
+        elif name == 'history.csv':
+            body = iter_csv(HISTORY_HEADER, history_rows(history_reader, points, decode, since, until))
+        elif name == 'report.xlsx':
+            target = tempfile.TemporaryFile()
+            try:
+                write_xlsx(target, report_sheets(history_reader, state.rows, points, decode, since, until))
+            except RuntimeError as e:
+                target.close()
+                return Response(str(e), status=501)
+            target.seek(0)
+            return send_file(target, as_attachment=True, download_name=name,
+                             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
         else:
-            result['actual'] = ''
-            result['result'] = '❌'
+            return Response("Неизвестная выгрузка", status=404)
 
-    last_update_time = datetime.now().strftime('%H:%M:%S')
+        return Response(body, content_type='text/csv; charset=utf-8',
+                        headers={'Content-Disposition': f'attachment; filename={name}'})
 
 
-def main():
-    cfg = load_config()
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Метрики опроса в формате Prometheus"""
+        # В веб-процессе метрики приходят из образа процесса опроса
+        text = image_reader.text() if image_reader is not None else metrics.render()
+        return Response(text, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    return app
+
+
+def json_response(body, status=200):
+    from flask import Response
+
+    return Response(json.dumps(body, ensure_ascii=False), status=status,
+                    content_type='application/json; charset=utf-8')
+
+
+def start_web_server(port=WEB_PORT):
+    """Запускает веб-сервер в отдельном потоке"""
+    global app
+    if app is None:
+        app = create_app()
+    log.info("🚀 Запуск веб-сервера на http://localhost:%d", port)
+    app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False)
+
+
+def image_points(addresses, types, profiles=None):
+    """Точки для образа регистров: [(ключ, адрес, тип, профиль)]"""
+    profiles = profiles or {}
+    return [(key, address, types[key], profiles.get(key)) for key, address in addresses.items()
+            if address and str(address).strip()]
+
+
+def follow_image(reader, decoder, interval=FOLLOW_INTERVAL):
+    """Поток веб-процесса: переносит изменения образа регистров в снимок страницы"""
+    seq = generation = None
+    keys = []
+    previous = {}
+    while True:
+        if reader.sequence() == seq:
+            time.sleep(interval)
+            continue
+
+        try:
+            state = reader.read()
+            if state.generation != generation:
+                meta_generation, meta = reader.meta()
+        except TimeoutError:
+            # Писатель не давал согласованного снимка - следующая попытка после паузы
+            log.warning("Образ регистров непрерывно изменяется, повтор чтения")
+            time.sleep(interval)
+            continue
+        if state.generation != generation:
+            if meta_generation != state.generation:
+                # Таблицу точек заменили между чтениями - повторить
+                continue
+            generation = meta_generation
+            keys = meta['keys']
+            addresses = dict(zip(keys, meta['addresses']))
+            types = dict(zip(keys, meta['types']))
+            profiles = {key: profile for key, profile in zip(keys, meta.get('profiles', ())) if profile}
+            initialize_checklist(decoder, addresses, types, profiles)
+            previous = {}
+        seq = state.seq
+
+        values = {key: state.values[slot] for slot, key in enumerate(keys) if state.read[slot]}
+        changed = {key: value for key, value in values.items() if previous.get(key) != value}
+        previous = values
+        if changed:
+            event_engine.process(changed, state.updated)
+        covered = {}
+        for slot, key in enumerate(keys):
+            bits = coverage.merge(key, state.seen[slot], state.updated)
+            if bits:
+                covered[key] = bits
+        update_web_results(values, health={key: STATES[state.health[slot]] for slot, key in enumerate(keys)},
+                           covered=covered)
+
+
+def run_web_worker(image_name, port, cfg):
+    """Точка входа веб-процесса: страница и API по образу регистров процесса опроса"""
+    global image_reader, history_reader
+    # Ctrl+C получает вся группа процессов; веб-процессы останавливает процесс опроса
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Файл журнала ведёт только процесс опроса
+    setup_logging({**(cfg.get("logging") or {}), "file": None})
+    image_reader = SharedImageReader(image_name)
+    history_reader = HistoryStore(cfg.get("history_dir", "history"))
+    threading.Thread(target=follow_image, args=(image_reader, StatusDecoder.from_config(cfg)),
+                     name="image-follower", daemon=True).start()
+    start_web_server(port)
+
+
+def start_web_workers(image_name, count, cfg):
+    """Запускает веб-процессы на портах WEB_PORT, WEB_PORT + 1, ..."""
+    workers = []
+    for number in range(count):
+        worker = multiprocessing.Process(target=run_web_worker, args=(image_name, WEB_PORT + number, cfg),
+                                         name=f"web-{number}", daemon=True)
+        worker.start()
+        workers.append(worker)
+    return workers
+
+
+def initialize_checklist(decoder, addresses, types=None, profiles=None):
+    """Инициализирует чек-лист на основе конфига и публикует его снимок; profiles - ключ -> профиль точки"""
+    global snapshot, checklist_index, point_buffer
+    profiles = profiles or {}
+    checklist = decoder.create_checklist_from_config(addresses, types, profiles)
+
+    rows = []
+    sections = {}
+    for section_name, state_name, expected_code, key, mask in checklist:
+        rows.append(ChecklistRow(len(rows), section_name, state_name, expected_code, '', '❌', key, mask))
+        sections.setdefault(key, section_name)
+    checklist_index = ChecklistIndex(rows, coverage)
+
+    points = []
+    decoders = {}
+    event_points = {}
+    for key, address in addresses.items():
+        if not address or not str(address).strip():
+            continue
+        kind = point_type(key, types.get(key) if types else None)
+        decoders[key] = decoder.table(kind, profiles.get(key))
+        points.append(PointState(key, int(address), kind, sections.get(key, key), None, (), None, HEALTHY))
+        event_points[key] = (int(address), kind, decoder.masks(kind, profiles.get(key)))
+    point_buffer = PointBuffer(points, decoders)
+    event_engine.configure(event_points)
+
+    # Открытые страницы перезагрузятся и получат новый снимок
+    version = change_feed.reset()
+    snapshot = Snapshot(version, snapshot.time, rows, checklist_index.active_count,
+                        points=point_buffer.points)
+
+
+def update_web_results(values, now=None, health=None, covered=None):
+    """Обновляет результаты для веб-интерфейса по сырым значениям точек.
+
+    now - время чтения, health - изменившиеся состояния исправности точек,
+    covered - впервые увиденные состояния (CoverageTracker.observe).
+    """
+    global snapshot
+
+    # Пересчитываются только строки впервые увиденных состояний
+    changed = []
+    for key, bits in (covered or {}).items():
+        changed.extend(checklist_index.mark(key, bits))
+
+    now = datetime.now() if now is None else datetime.fromtimestamp(now)
+    update_time = now.strftime('%H:%M:%S')
+    points_changed = point_buffer.update(values, now.isoformat(timespec='milliseconds'), health)
+    if not changed and not points_changed:
+        snapshot = snapshot.retimed(update_time)
+        return
+
+    total_states = len(checklist_index.rows)
+    health_total = health_counts(point_buffer.points)
+    stats = {
+        'time': update_time,
+        'total_states': total_states,
+        'active_states': checklist_index.active_count,
+        'inactive_states': total_states - checklist_index.active_count,
+        'suspect_points': health_total.get(SUSPECT, 0),
+        'quarantined_points': health_total.get(QUARANTINED, 0)
+    }
+    # Браузерам отправляются только изменения; снимок публикуется с версией ленты
+    rows = [{'id': row.id, 'actual': row.actual, 'result': row.result} for row in changed]
+    version = change_feed.publish(rows, stats)
+    snapshot = Snapshot(version, update_time, checklist_index.rows, checklist_index.active_count,
+                        points=point_buffer.points)
+
+
+def main(config_path="config.json", web=True, started=None, record=None, replay=None, speed=1.0):
+    """Мониторинг: опрос, история, события; web=False - без веб-интерфейса и без Flask.
+
+    started - отметка time.perf_counter() запуска процесса для замера времени до первого опроса.
+    record - файл записи сырого обмена (по умолчанию "capture_file" конфига).
+    replay - файл записи, воспроизводимый вместо опроса приборов со скоростью
+    speed (1 - реальное время, 0 - без пауз); история и файл событий при этом не пишутся.
+    """
+    started = time.perf_counter() if started is None else started
+    # Конфиг компилируется один раз в таблицу точек и перечитывается в фоне при изменении
+    watcher = PointTableWatcher(config_path)
+    cfg = watcher.cfg
+    table = watcher.table
 
     port = cfg.get("com_port", "COM3")
     baud = cfg.get("baudrate", 9600)
     unit_id = cfg.get("unit_id", 1)
-    addresses = cfg["address"]
-
-    # Запускаем веб-сервер в отдельном потоке
-    web_thread = threading.Thread(target=start_web_server, daemon=True)
-    web_thread.start()
-
-    print(f"🔧 Настройки подключения:")
-    print(f"  Порт: {port}")
-    print(f"  Скорость: {baud} бод")
-    print(f"  Unit ID: {unit_id}")
-    print(f"  Адреса: {addresses}")
-
-    client = ModbusSerialClient(
-        port=port,
-        stopbits=1,
-        bytesize=8,
-        baudrate=baud,
-        timeout=1,  # Увеличенный таймаут
-        retries=1,  # Уменьшенное количество попыток
-        parity="N"
-    )
-
-    print(f"🔌 Попытка подключения к COM-порту: {port}")
-    
+    addresses = table.address_map(port)
+
+    # Вывод журнала идёт из фонового потока, опрос не ждёт консоль
+    setup_logging(cfg.get("logging"))
+
+    # Веб-сервер - поток этого процесса или отдельные процессы над образом регистров
+    web_workers = cfg.get("web_workers", 0) if web else 0
+    if web and not web_workers:
+        web_thread = threading.Thread(target=start_web_server, daemon=True)
+        web_thread.start()
+
+    log.info("🔧 Настройки подключения:")
+    log.info("  Порт: %s", port)
+    log.info("  Скорость: %s бод", baud)
+    log.info("  Unit ID: %s", unit_id)
+    log.info("  Точек: %d", len(addresses))
+
+    # Шлюз Modbus TCP / RTU поверх TCP, если задан "transport", иначе COM-порт
+    client = None
+    if replay:
+        client = ReplayClient(replay, speed=speed)
+    elif cfg.get("transport"):
+        from transport import make_client
+        client = make_client(cfg)
+    target = port
+    if replay:
+        target = f"{replay} (воспроизведение, скорость {speed or 'без пауз'})"
+    elif client is not None:
+        transport = cfg["transport"]
+        target = f'{transport["host"]}:{transport.get("port", 502)}'
+    else:
+        from pymodbus.client import ModbusSerialClient
+
+        client = ModbusSerialClient(
+            port=port,
+            stopbits=1,
+            bytesize=8,
+            baudrate=baud,
+            timeout=1,  # Увеличенный таймаут
+            retries=1,  # Уменьшенное количество попыток
+            parity="N",
+            trace_packet=metrics.trace_packet
+        )
+        # Таймауты по измеренному времени ответа приборов вместо фиксированной секунды
+        timing = TimingController.from_config(cfg)
+        if timing is not None:
+            client = AdaptiveTimingClient(client, timing)
+            metrics.timing = timing
+
+    log.info("🔌 Попытка подключения: %s", target)
+
     if not client.connect():
-        print("❌ Ошибка: не удалось открыть COM-порт:", port)
+        log.error("❌ Ошибка: не удалось подключиться: %s", target)
+        shutdown_logging()
         return
 
-    print("✅ Подключение к COM-порту успешно установлено")
+    log.info("✅ Подключение успешно установлено")
 
-    decoder = StatusDecoder()
+    # В режиме воспроизведения планировщик живёт по времени записи
+    clock = client.clock if replay else time.time
+    capture = None
+    record = record or (None if replay else cfg.get("capture_file"))
+    if record:
+        capture = CaptureWriter(record)
+        client = RecordingClient(client, capture, target)
+        log.info("⏺ Запись обмена: %s", record)
 
-    # Инициализируем чек-лист
-    initialize_checklist(decoder, addresses)
+    # Маски и таблицы состояний - из профилей приборов (скомпилированные берутся из кэша)
+    decoder = StatusDecoder.from_config(cfg)
 
-    print("✅ Веб-интерфейс доступен по адресу: http://localhost:5000")
-    print("📡 Запуск мониторинга устройств...")
+    # Покрытие состояний сессии переживает перезапуски (при воспроизведении - только в памяти)
+    global coverage
+    coverage = CoverageTracker(None if replay else coverage_path(cfg))
 
+    # Инициализируем чек-лист
+    types = {key: table.type(key) for key in addresses}
+    profiles = table.profile_map(port)
+    initialize_checklist(decoder, addresses, types, profiles)
+
+    # Неотвечающие точки и приборы уходят в карантин и опрашиваются пробами
+    health = HealthTracker.from_config(cfg)
+    metrics.health = health
+
+    # Опрос по расписанию: у каждого класса точек свой интервал и приоритет
+    scheduler = PollScheduler(addresses, cfg.get("poll_classes"), baud, cfg.get("max_gap", 0),
+                              units=table.unit_map(port), clock=clock if replay else time.monotonic,
+                              health=health, types=types)
+    log.info("⏱ Загрузка шины по расписанию: %.0f%%", scheduler.bus_load() * 100)
+    warning = scheduler.capacity_warning()
+    if warning:
+        log.warning("⚠️ %s", warning)
+
+    image = None
+    workers = []
+    if web_workers:
+        # Многопроцессный режим: страницы строят веб-процессы, опрос только пишет образ
+        image = SharedImageWriter(max(len(table) * 2, 1024))
+        image.configure(image_points(addresses, types, profiles))
+        # Покрытие, восстановленное из файла, - сразу в образ
+        image.write({}, coverage=coverage.masks())
+        workers = start_web_workers(image.name, web_workers, cfg)
+        for number in range(web_workers):
+            log.info("✅ Веб-интерфейс доступен по адресу: http://localhost:%d", WEB_PORT + number)
+    elif web:
+        log.info("✅ Веб-интерфейс доступен по адресу: http://localhost:%d", WEB_PORT)
+    log.info("📡 Запуск мониторинга устройств...")
+
+    # История изменений сырых значений на диске
+    global history_reader
+    history = None
+    if not replay:
+        history = HistoryStore(cfg.get("history_dir", "history"))
+        history_reader = HistoryStore(cfg.get("history_dir", "history"))
+
+    def apply_point_table(new_table):
+        """Переход на перечитанную таблицу точек (вызывается из потока опроса)"""
+        nonlocal table, addresses, types, profiles
+        new_addresses = new_table.address_map(port)
+        new_types = {key: new_table.type(key) for key in new_addresses}
+        new_profiles = new_table.profile_map(port)
+        # Профили новых точек загружаются до подмены: с ошибкой в профиле опрос идёт по прежней таблице
+        try:
+            decoder.role_map("status", new_addresses, new_types, new_profiles)
+        except (OSError, ProfileError) as e:
+            log.error("❌ Таблица точек не применена: %s", e)
+            return False
+        table, addresses, types, profiles = new_table, new_addresses, new_types, new_profiles
+        scheduler.reload(addresses, table.unit_map(port), types)
+        if commands is not None:
+            commands.configure(addresses, table.unit_map(port), unit_id,
+                               decoder.role_map("command", addresses, types, profiles))
+        initialize_checklist(decoder, addresses, types, profiles)
+        if image is not None:
+            published = image.configure(image_points(addresses, types, profiles))
+            image.write({}, coverage=coverage.masks())
+            if published < len(addresses):
+                log.error("❌ Образ регистров вмещает %d точек из %d, перезапустите мониторинг",
+                          published, len(addresses))
+        return True
+
+    # Подписчики событий: журнал и файл событий
+    consumers = [EventConsumer(event_engine, log_event, name="events-log").start()]
+    event_file = None
+    if cfg.get("events_file") and not replay:
+        event_file = EventFileWriter(cfg["events_file"])
+        consumers.append(EventConsumer(event_engine, event_file, name="events-file").start())
+
+    metrics_written = 0.0
+    first_poll = True
+    # Исправность точек, уже переданная странице / образу: ключ -> состояние
+    health_sent = {}
+    health_version = None
+
+    def changed_health():
+        """Изменившиеся с прошлого цикла состояния исправности точек"""
+        nonlocal health_version
+        if health is None or health.version == health_version:
+            return None
+        health_version = health.version
+        changes = {key: state for key, state in health.states().items() if health_sent.get(key) != state}
+        health_sent.update(changes)
+        return changes
+
+    # Таблица точек, отклонённая из-за ошибки в профилях
+    rejected = None
+
+    def on_values(values, changed):
+        nonlocal metrics_written, first_poll, health_version, rejected
+        if first_poll:
+            first_poll = False
+            metrics.observe_first_poll(time.perf_counter() - started)
+            log.info("⏱ Первый опрос через %.3f с после запуска", metrics.first_poll)
+        # Проверка новой таблицы - одно сравнение ссылок за цикл
+        if watcher.table is not table and watcher.table is not rejected:
+            if apply_point_table(watcher.table):
+                changed = changed & set(addresses)
+                # Чек-лист и образ пересозданы с исправными точками - состояния передаются заново
+                health_sent.clear()
+                health_version = None
+            else:
+                rejected = watcher.table
+
+        # Фронты битов - по изменившимся точкам с временем чтения
+        now = clock()
+        event_engine.process({key: values[key] for key in changed}, now)
+
+        # Покрытие: каждое чтение, впервые увиденные состояния отмечают строки чек-листа
+        if coverage.reset_requested:
+            coverage.reset()
+            initialize_checklist(decoder, addresses, types, profiles)
+            log.info("📋 Начата новая сессия пусконаладки, покрытие сброшено")
+        covered = {}
+        for key, value in values.items():
+            bits = coverage.observe(key, value, now)
+            if bits:
+                covered[key] = bits
+        coverage.maybe_save()
+
+        metrics.observe_values(values)
+        for key in changed:
+            if values[key] is not None:
+                if history is not None:
+                    history.append(key, values[key])
+                if log.isEnabledFor(logging.INFO):
+                    log.info(describe_point(decoder, key, addresses[key], values[key], types[key],
+                                            profiles.get(key)))
+
+        # Обновляем веб-интерфейс
+        if not web:
+            return
+        health_changes = changed_health()
+        if image is None:
+            update_web_results(values, now, health_changes, covered)
+            return
+        image.write(values, now, health_changes and {key: STATES.index(state)
+                                                     for key, state in health_changes.items()},
+                    {key: coverage.mask(key) for key in covered})
+        if time.time() - metrics_written >= METRICS_INTERVAL:
+            image.write_text(metrics.render())
+            metrics_written = time.time()
+
+    # Команды приборам: очередь записи обслуживается между кадрами опроса и в паузах
+    global commands
+    poll_client = InstrumentedClient(client, metrics)
+    sleep = clock.sleep if replay else time.sleep
+    commands = None if replay else CommandClient.from_config(poll_client, cfg)
+    if commands is not None:
+        commands.configure(addresses, table.unit_map(port), unit_id,
+                           decoder.role_map("command", addresses, types, profiles))
+        metrics.commands = commands
+        poll_client = commands
+        sleep = commands.sleep
+        log.info("🎛 Команды приборам включены: %s", ", ".join(commands.actions) or "только значения")
+        if web_workers:
+            log.warning("🎛 Веб-процессы (web_workers = %d) команды не принимают: /api/v1/commands отвечает 503",
+                        web_workers)
+
+    watcher.start()
     try:
-        while True:
-            current_states = {
-                'device': {},
-                'actuator': {},
-                'security': {},
-                'fire': {}
-            }
-
-            # Читаем состояния приборов
-            device_keys = [key for key in addresses.keys()
-                           if "device" in key and addresses[key] and addresses[key].strip()]
-            for key in device_keys:
-                code = read_register(client, addresses[key])
-                if code:
-                    codes = decoder.decode_device(code)
-                    current_states['device'][key] = codes
-                    print(f"Прибор ({key} - {addresses[key]}): {codes}")
-
-            # Читаем состояния ИУ
-            actuator_keys = [key for key in addresses.keys()
-                             if "actuator" in key and addresses[key] and addresses[key].strip()]
-            for key in actuator_keys:
-                code = read_register(client, addresses[key])
-                if code:
-                    codes = decoder.decode_actuator(code)
-                    current_states['actuator'][key] = codes
-                    print(f"ИУ ({key} - {addresses[key]}): {codes}")
-
-            # Читаем состояния охранных зон
-            security_keys = [key for key in addresses.keys()
-                             if "security_zone" in key and addresses[key] and addresses[key].strip()]
-            for key in security_keys:
-                code = read_register(client, addresses[key])
-                if code:
-                    codes = decoder.decode_sec_zone(code)
-                    current_states['security'][key] = codes
-                    print(f"Охранная зона ({key} - {addresses[key]}): {codes}")
-
-            # Читаем состояния пожарных зон
-            fire_keys = [key for key in addresses.keys()
-                         if "fire_zone" in key and addresses[key] and addresses[key].strip()]
-            for key in fire_keys:
-                code = read_register(client, addresses[key])
-                if code:
-                    codes = decoder.decode_fire_zone(code)
-                    current_states['fire'][key] = codes
-                    print(f"Пожарная зона ({key} - {addresses[key]}): {codes}")
-
-            # Обновляем веб-интерфейс
-            update_web_results(current_states, decoder)
-
-            print("---")
-            time.sleep(2)
-            os.system('cls' if os.name == 'nt' else 'clear')
+        run_scheduled(poll_client, scheduler, unit_id, on_values, sleep=sleep, on_cycle=metrics.observe_cycle)
+
+    except ReplayFinished:
+        log.info("⏹ Воспроизведение завершено: %d чтений за %.1f с", client.replayed,
+                 time.perf_counter() - started)
+        if web:
+            # Страница остаётся открытой для разбора до Ctrl+C
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                log.info("🛑 Остановлено пользователем")
 
     except KeyboardInterrupt:
-        print("\n🛑 Остановлено пользователем")
-        print("🌐 Веб-интерфейс продолжает работать")
+        log.info("🛑 Остановлено пользователем")
 
     finally:
+        watcher.stop()
+        for worker in workers:
+            worker.terminate()
+            worker.join()
+        if image is not None:
+            image.close()
+        for consumer in consumers:
+            consumer.stop()
+        if event_file is not None:
+            event_file.close()
+        if history is not None:
+            history.close()
+        coverage.save()
+        if capture is not None:
+            capture.close()
         client.close()
+        shutdown_logging()
 
 
 if __name__ == "__main__":
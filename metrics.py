@@ -0,0 +1,212 @@
+"""Метрики опроса в формате Prometheus.
+
+Счётчики пишет только поток опроса, поэтому блокировки не нужны: запись -
+это инкремент элемента списка или словаря под GIL. Веб-поток при выдаче
+/metrics копирует словари целиком (копирование встроенного dict атомарно
+под GIL) и может увидеть значения на одно чтение старее - для метрик это
+допустимо, а цикл опроса не замедляется.
+"""
+
+import bisect
+import time
+
+NO_LINK = 0xffff
+
+# Границы корзин гистограмм, с
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+CYCLE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами (без блокировок, один писатель)"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels=""):
+        lines = []
+        cumulative = 0
+        counts = list(self.counts)
+        separator = "," if labels else ""
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+class PollMetrics:
+    """Метрики опроса: задержки, ошибки, длительность цикла и свежесть точек"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.latency = {}
+        self.cycle = Histogram(CYCLE_BUCKETS)
+        self.counters = {
+            "timeouts": 0,
+            "exceptions": 0,
+            "crc_errors": 0,
+            "error_responses": 0,
+        }
+        self.last_success = {}
+        self.no_link = {}
+        self.first_poll = None
+        # Контроллер адаптивных таймаутов (timing.TimingController), если включён
+        self.timing = None
+        # Автомат исправности точек (health.HealthTracker), если карантин включён
+        self.health = None
+        # Очередь команд (commands.CommandClient), если запись включена
+        self.commands = None
+        self._received = 0
+
+    # --- запись (только поток опроса) ---
+
+    def trace_packet(self, sending, data):
+        """Обработчик trace_packet клиента pymodbus: отмечает, пришли ли байты ответа"""
+        self._received = 0 if sending else len(data)
+        return data
+
+    def observe_read(self, address, elapsed):
+        histogram = self.latency.get(address)
+        if histogram is None:
+            histogram = self.latency[address] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(elapsed)
+
+    def observe_failure(self, error):
+        """Классифицирует исключение чтения.
+
+        Нет ответа - таймаут; байты пришли, но кадр не принят - ошибка CRC/кадра.
+        """
+        # Ошибки шлюза (transport.py) сами указывают свой счётчик
+        counter = getattr(error, "counter", None)
+        if counter is not None:
+            self.counters[counter] += 1
+            return
+
+        # pymodbus уже загружен клиентом, выбросившим исключение
+        from pymodbus.exceptions import ModbusIOException
+
+        if isinstance(error, ModbusIOException):
+            if self._received:
+                self.counters["crc_errors"] += 1
+            else:
+                self.counters["timeouts"] += 1
+        else:
+            self.counters["exceptions"] += 1
+
+    def observe_first_poll(self, elapsed):
+        """Время от запуска процесса до первого завершённого цикла опроса"""
+        self.first_poll = elapsed
+
+    def observe_cycle(self, elapsed):
+        self.cycle.observe(elapsed)
+
+    def observe_values(self, values):
+        """Учитывает прочитанные значения точек: время успешного чтения и 0xffff"""
+        now = self.clock()
+        for key, value in values.items():
+            if value is None:
+                continue
+            self.last_success[key] = now
+            if value == NO_LINK:
+                self.no_link[key] = self.no_link.get(key, 0) + 1
+
+    # --- выдача (веб-поток) ---
+
+    def render(self):
+        """Текст метрик в формате Prometheus"""
+        now = self.clock()
+        lines = [
+            "# HELP r3_read_latency_seconds Задержка запроса чтения по начальному адресу",
+            "# TYPE r3_read_latency_seconds histogram",
+        ]
+        for address, histogram in sorted(dict(self.latency).items()):
+            lines.extend(histogram.render("r3_read_latency_seconds", f'address="{address}"'))
+
+        counters = dict(self.counters)
+        for name, help_text in (
+                ("timeouts", "Запросы без ответа"),
+                ("exceptions", "Исключения при чтении"),
+                ("crc_errors", "Ответы с ошибкой CRC или кадра"),
+                ("error_responses", "Ответы прибора с кодом исключения Modbus")):
+            lines.append(f"# HELP r3_read_{name}_total {help_text}")
+            lines.append(f"# TYPE r3_read_{name}_total counter")
+            lines.append(f"r3_read_{name}_total {counters[name]}")
+
+        if self.first_poll is not None:
+            lines.append("# HELP r3_first_poll_seconds Время от запуска до первого цикла опроса")
+            lines.append("# TYPE r3_first_poll_seconds gauge")
+            lines.append(f"r3_first_poll_seconds {self.first_poll:.3f}")
+
+        lines.append("# HELP r3_cycle_duration_seconds Длительность цикла опроса")
+        lines.append("# TYPE r3_cycle_duration_seconds histogram")
+        lines.extend(self.cycle.render("r3_cycle_duration_seconds"))
+
+        if self.timing is not None:
+            lines.extend(self.timing.render_metrics())
+        if self.health is not None:
+            lines.extend(self.health.render_metrics())
+        if self.commands is not None:
+            lines.extend(self.commands.render_metrics())
+
+        lines.append("# HELP r3_point_last_success_age_seconds Время с последнего успешного чтения точки")
+        lines.append("# TYPE r3_point_last_success_age_seconds gauge")
+        for key, moment in sorted(dict(self.last_success).items()):
+            lines.append(f'r3_point_last_success_age_seconds{{point="{key}"}} {now - moment:.3f}')
+
+        lines.append("# HELP r3_point_no_link_total Ответы 0xffff (нет связи с прибором)")
+        lines.append("# TYPE r3_point_no_link_total counter")
+        for key, count in sorted(dict(self.no_link).items()):
+            lines.append(f'r3_point_no_link_total{{point="{key}"}} {count}')
+
+        return "\n".join(lines) + "\n"
+
+
+class InstrumentedClient:
+    """Обёртка клиента Modbus, замеряющая каждый запрос чтения"""
+
+    def __init__(self, client, metrics):
+        self.client = client
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if name == 'read_plan':
+            # Конвейерное чтение шлюза минует read_holding_registers - блоки замеряет сам план
+            def read_plan(plan, unit_id=1):
+                return attr(plan, unit_id, observe=self._observe)
+            return read_plan
+        return attr
+
+    def _observe(self, address, elapsed, result, error):
+        """Замер одного блока конвейерного чтения (вызывается из потока шлюза)"""
+        if error is not None:
+            self.metrics.observe_failure(error)
+            return
+        self.metrics.observe_read(address, elapsed)
+        if result is not None and result.isError():
+            self.metrics.counters["error_responses"] += 1
+
+    def read_holding_registers(self, address, count=1, device_id=1):
+        started = time.perf_counter()
+        try:
+            result = self.client.read_holding_registers(address, count=count, device_id=device_id)
+        except Exception as e:
+            self.metrics.observe_failure(e)
+            raise
+        self.metrics.observe_read(address, time.perf_counter() - started)
+        if result is not None and result.isError():
+            self.metrics.counters["error_responses"] += 1
+        return result
@@ -0,0 +1,218 @@
+"""Компиляция конфига в таблицу точек опроса.
+
+Конфиг разбирается один раз при запуске в отсортированную таблицу на
+массивах: адрес, тип, unit, порт, профиль и декодер каждой точки. Кроме плоского
+словаря "address" поддерживаются большие списки точек (тысячи строк) прямо
+в конфиге или во внешнем JSON/CSV-файле:
+
+    "points": [{"key": "fire_zone_1", "address": 41015, "type": "fire_zone", "unit": 1, "port": "COM3"}]
+    "points_file": "points.csv"     # столбцы key,address,type,unit,port[,profile]
+
+"profile" точки - имя профиля прибора (profiles.py), пусто - профиль объекта.
+
+PointTableWatcher следит за временем изменения файлов и в фоне подменяет
+таблицу целиком (одним присваиванием), опрос при этом не останавливается.
+"""
+
+import csv
+import json
+import logging
+import os
+import threading
+from array import array
+
+log = logging.getLogger(__name__)
+
+# Типы точек в порядке кодов в массиве kinds
+TYPES = ("device", "actuator", "security_zone", "fire_zone", "unknown")
+# Тип точки -> декодер StatusDecoder.compiled
+DECODERS = {
+    "device": "device",
+    "actuator": "actuator",
+    "security_zone": "sec_zone",
+    "fire_zone": "fire_zone",
+    "unknown": "device",
+}
+
+
+def point_type(key, declared=None):
+    """Тип точки: явно заданный или по подстроке ключа, как в исходных скриптах"""
+    if declared:
+        if declared not in TYPES:
+            raise ValueError(f"Неизвестный тип точки {key}: {declared}")
+        return declared
+    for name in ("actuator", "security_zone", "fire_zone", "device"):
+        if name in key:
+            return name
+    return "unknown"
+
+
+class PointTable:
+    """Неизменяемая таблица точек, отсортированная по (порт, unit, адрес)"""
+
+    def __init__(self, points, default_port, default_unit):
+        rows = []
+        seen = set()
+        for point in points:
+            key = str(point["key"])
+            if key in seen:
+                raise ValueError(f"Повторяющийся ключ точки: {key}")
+            seen.add(key)
+            address = int(point["address"])
+            if not 0 <= address <= 0xffff:
+                raise ValueError(f"Адрес точки {key} вне диапазона Modbus: {address}")
+            rows.append((
+                str(point.get("port") or default_port),
+                int(point.get("unit") or default_unit),
+                address,
+                key,
+                point_type(key, point.get("type")),
+                str(point.get("profile") or ""),
+            ))
+        rows.sort()
+
+        self.port_names = sorted({row[0] for row in rows})
+        port_codes = {name: code for code, name in enumerate(self.port_names)}
+        # Код 0 - профиль объекта по умолчанию
+        self.profile_names = [""] + sorted({row[5] for row in rows} - {""})
+        profile_codes = {name: code for code, name in enumerate(self.profile_names)}
+
+        self.keys = [row[3] for row in rows]
+        self.addresses = array('H', (row[2] for row in rows))
+        self.units = array('B', (row[1] for row in rows))
+        self.ports = array('H', (port_codes[row[0]] for row in rows))
+        self.kinds = array('B', (TYPES.index(row[4]) for row in rows))
+        self.profiles = array('H', (profile_codes[row[5]] for row in rows))
+        self.index = {key: row for row, key in enumerate(self.keys)}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def address(self, key):
+        return self.addresses[self.index[key]]
+
+    def unit(self, key):
+        return self.units[self.index[key]]
+
+    def port(self, key):
+        return self.port_names[self.ports[self.index[key]]]
+
+    def type(self, key):
+        return TYPES[self.kinds[self.index[key]]]
+
+    def profile(self, key):
+        """Имя профиля точки; None - профиль объекта"""
+        return self.profile_names[self.profiles[self.index[key]]] or None
+
+    def decoder(self, key):
+        """Имя таблицы декодирования StatusDecoder.compiled для точки"""
+        return DECODERS[self.type(key)]
+
+    def address_map(self, port=None):
+        """Словарь ключ -> адрес (строкой, как в config.json) для порта или всех портов"""
+        port_code = self.port_names.index(port) if port in self.port_names else None
+        return {key: str(self.addresses[row]) for row, key in enumerate(self.keys)
+                if port is None or self.ports[row] == port_code}
+
+    def unit_map(self, port=None):
+        """Словарь ключ -> unit для порта или всех портов"""
+        port_code = self.port_names.index(port) if port in self.port_names else None
+        return {key: self.units[row] for row, key in enumerate(self.keys)
+                if port is None or self.ports[row] == port_code}
+
+    def profile_map(self, port=None):
+        """Словарь ключ -> профиль для точек со своим профилем на порту или всех портах"""
+        port_code = self.port_names.index(port) if port in self.port_names else None
+        return {key: self.profile_names[self.profiles[row]] for row, key in enumerate(self.keys)
+                if self.profiles[row] and (port is None or self.ports[row] == port_code)}
+
+
+def _read_points_file(path):
+    """Точки из внешнего JSON (список объектов) или CSV (key,address,type,unit,port[,profile])"""
+    if path.lower().endswith(".csv"):
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            return [row for row in csv.DictReader(f) if row.get("key") and row.get("address")]
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data["points"] if isinstance(data, dict) else data
+
+
+def config_sources(cfg, config_path):
+    """Файлы, изменение которых требует перекомпиляции таблицы"""
+    sources = [config_path]
+    if cfg.get("points_file"):
+        sources.append(os.path.join(os.path.dirname(config_path), cfg["points_file"]))
+    return sources
+
+
+def compile_points(cfg, config_path="config.json"):
+    """Собирает PointTable из словаря "address", списка "points" и файла "points_file" """
+    points = []
+    for key, address in cfg.get("address", {}).items():
+        if address and str(address).strip():
+            points.append({"key": key, "address": address})
+    points.extend(cfg.get("points", []))
+    if cfg.get("points_file"):
+        points.extend(_read_points_file(config_sources(cfg, config_path)[1]))
+    return PointTable(points, cfg.get("com_port", "COM3"), cfg.get("unit_id", 1))
+
+
+def load_config(config_path="config.json"):
+    with open(config_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_point_table(config_path="config.json"):
+    cfg = load_config(config_path)
+    return compile_points(cfg, config_path), cfg
+
+
+class PointTableWatcher:
+    """Фоновая перекомпиляция таблицы при изменении конфига или файла точек"""
+
+    def __init__(self, config_path="config.json", interval=2.0):
+        self.config_path = config_path
+        self.interval = interval
+        self.table, self.cfg = load_point_table(config_path)
+        self.mtimes = self._mtimes()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _mtimes(self):
+        result = []
+        for path in config_sources(self.cfg, self.config_path):
+            try:
+                result.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                result.append(None)
+        return result
+
+    def check(self):
+        """Перечитывает конфиг, если файлы изменились; возвращает True при подмене таблицы"""
+        mtimes = self._mtimes()
+        if mtimes == self.mtimes:
+            return False
+        self.mtimes = mtimes
+        try:
+            table, cfg = load_point_table(self.config_path)
+        except (OSError, ValueError, KeyError) as e:
+            log.error("Конфиг не перечитан, продолжаем со старой таблицей точек: %s", e)
+            return False
+        # Одно присваивание: опрос видит либо старую, либо новую таблицу целиком
+        self.cfg = cfg
+        self.table = table
+        self.mtimes = self._mtimes()
+        log.info("Таблица точек перечитана: %d точек", len(table))
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
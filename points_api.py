@@ -0,0 +1,87 @@
+"""JSON API состояния точек: /api/v1/points.
+
+Ответ строится по опубликованному снимку (snapshot.Snapshot) и кэшируется
+в нём, поэтому повторные запросы той же версии не сериализуют данные
+заново. ETag строгий: идентификатор запуска, версия снимка, фильтр и
+кодировка. Клиент, опрашивающий с If-None-Match, пока ничего не
+изменилось, получает 304 без тела. Большие ответы сжимаются gzip.
+
+Фильтры в строке запроса (несколько значений - через запятую):
+
+    /api/v1/points?type=fire_zone,security_zone&section=Пожарная зона "fire_zone_1"
+"""
+
+import gzip
+import json
+import os
+import zlib
+
+# Ответы меньше этого размера не сжимаются
+GZIP_MIN_SIZE = 1024
+# Версии снимков начинаются заново при каждом запуске - ETag включает метку запуска
+BOOT_ID = os.urandom(4).hex()
+
+
+def _filter_values(args, name):
+    raw = args.get(name, "")
+    return frozenset(value.strip() for value in raw.split(",") if value.strip())
+
+
+def point_record(point):
+    """Точка в виде словаря для JSON"""
+    return {
+        'key': point.key,
+        'address': point.address,
+        'type': point.type,
+        'section': point.section,
+        'raw': point.raw,
+        'raw_hex': None if point.raw is None else f"0x{point.raw:04x}",
+        'states': list(point.states),
+        'changed': point.changed,
+        'health': point.health,
+    }
+
+
+def render_points(state, types=frozenset(), sections=frozenset()):
+    """Тело ответа (bytes) по снимку с учётом фильтров"""
+    points = [point_record(point) for point in state.points
+              if (not types or point.type in types) and (not sections or point.section in sections)]
+    body = {
+        'version': state.version,
+        'updated': state.updated,
+        'total_states': state.total_states,
+        'active_states': state.active_states,
+        'inactive_states': state.inactive_states,
+        'points': points,
+    }
+    return json.dumps(body, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def points_response(state, args, accept_encoding=""):
+    """ETag и построитель тела для снимка и параметров запроса.
+
+    Возвращает (body, etag), где body() даёт (данные, кодировка или None).
+    Тело строится лениво: для ответа 304 достаточно ETag.
+    """
+    types = _filter_values(args, 'type')
+    sections = _filter_values(args, 'section')
+    use_gzip = 'gzip' in accept_encoding.lower()
+
+    filter_key = "|".join(sorted(types)) + "#" + "|".join(sorted(sections))
+    tag = f"{BOOT_ID}-{state.version}-{zlib.crc32(filter_key.encode('utf-8')):08x}"
+
+    def body():
+        # Кэшируется только ответ без фильтров - его запрашивают все интеграции
+        cache_key = ('points', use_gzip) if not types and not sections else None
+        cached = state.cache.get(cache_key) if cache_key else None
+        if cached is None:
+            data = render_points(state, types, sections)
+            encoding = None
+            if use_gzip and len(data) >= GZIP_MIN_SIZE:
+                data, encoding = gzip.compress(data, compresslevel=6, mtime=0), 'gzip'
+            cached = (data, encoding)
+            if cache_key:
+                state.cache[cache_key] = cached
+        return cached
+
+    return body, (tag + "-gzip") if use_gzip else tag
@@ -0,0 +1,531 @@
+"""Профили приборов в файлах данных: маски, поля, перечисления, регистры.
+
+Профиль описывает семейство приборов (или версию прошивки) без правки
+кода: для каждого типа точки - биты состояний (строки чек-листа),
+многобитовые поля с перечислениями или масштабом и роли регистров
+относительно адреса точки. Встроенный профиль R3 лежит в каталоге
+profiles рядом с модулями, профили объекта - в "profiles_dir" (профиль
+объекта с тем же именем заменяет встроенный):
+
+    "profiles_dir": "profiles",           # профили объекта
+    "profile": "r3",                      # профиль точек без своего "profile"
+    "profile_cache": "history/profiles"   # скомпилированные профили; "" - не сохранять
+
+    "points": [{"key": "damper_7", "address": 42600, "type": "actuator", "profile": "r3-fw2"}]
+
+Файл профиля (JSON):
+
+    {"profile": "r3-fw2", "title": "...",
+     "types": {"actuator": {
+         "label": "ИУ", "section": "Исполнительное устройство",
+         "registers": {"status": 0, "command": 100},
+         "states": {"0x00": "Выключено", "0x01": "Включено"},
+         "fields": [
+             {"name": "Режим", "bits": "0x0300", "enum": {"0": "Ручной", "1": "Автомат"}},
+             {"name": "Положение", "register": "position", "bits": "0x00ff", "scale": 0.5, "unit": "%"}
+         ]}}}
+
+Поля регистра состояния с перечислением входят в декодированные
+состояния точки ("Режим: Автомат"), числовые поля считает values().
+
+Профиль проверяется и компилируется в таблицы на 65536 значений один
+раз: скомпилированная форма сохраняется в "profile_cache" под ключом -
+SHA-256 содержимого файла. При следующих запусках файл только читается
+и хешируется, таблицы загружаются из кэша без разбора и построения;
+загружаются только профили, на которые ссылаются точки.
+
+    python cli.py profiles            проверка всех профилей и заполнение кэша
+
+Формат кэша (little-endian): заголовок - сигнатура b'R3PF', версия
+(uint16), длина JSON (uint32); JSON с проверенным профилем, названиями
+состояний и числом наборов каждого типа; затем по типам в порядке JSON -
+индексы наборов (uint16[65536]), начала наборов (uint32[наборов + 1]) и
+номера названий в наборах (uint16). Наборы собираются в кортежи при
+первом обращении.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import namedtuple
+
+log = logging.getLogger(__name__)
+
+NO_LINK = 0xffff
+NO_LINK_TEXT = 'Неизвестно или нет связи с прибором'
+
+BUILTIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+DEFAULT_PROFILE = "r3"
+# Типы точек, которые может описывать профиль (point_table.TYPES без "unknown")
+KINDS = ("device", "actuator", "security_zone", "fire_zone")
+STATUS = "status"
+
+MAGIC = b'R3PF'
+VERSION = 1
+HEADER = struct.Struct('<4sHI')
+
+TYPE_KEYS = {"label", "section", "registers", "states", "fields"}
+FIELD_KEYS = {"name", "register", "bits", "enum", "scale", "offset", "unit"}
+
+# Многобитовое поле: shift - номер младшего бита маски bits
+Field = namedtuple('Field', 'name register bits shift enum scale offset unit')
+
+
+def _fields(spec):
+    """Поля проверенного описания типа в виде Field"""
+    return tuple(Field(field["name"], field["register"], field["bits"], field["shift"],
+                       dict((value, label) for value, label in field.get("enum", ())),
+                       field.get("scale"), field.get("offset"), field.get("unit"))
+                 for field in spec["fields"])
+
+
+def _status_enums(fields):
+    """Поля с перечислением в регистре состояния - входят в таблицу"""
+    return tuple(field for field in fields if field.enum and field.register == STATUS)
+
+
+class ProfileError(ValueError):
+    """Ошибка в файле профиля"""
+
+
+def _number(value, where):
+    """Целое из JSON: число или строка "0x.."/десятичная"""
+    if isinstance(value, bool):
+        raise ProfileError(f"{where}: ожидается число, получено {value!r}")
+    try:
+        return int(value, 0) if isinstance(value, str) else int(value)
+    except (TypeError, ValueError):
+        raise ProfileError(f"{where}: ожидается число, получено {value!r}") from None
+
+
+def _text(value, where):
+    if not isinstance(value, str) or not value.strip():
+        raise ProfileError(f"{where}: ожидается непустая строка")
+    return value
+
+
+def _validate_field(field, registers, where):
+    if not isinstance(field, dict):
+        raise ProfileError(f"{where}: ожидается объект")
+    unknown = set(field) - FIELD_KEYS
+    if unknown:
+        raise ProfileError(f"{where}: неизвестные ключи {sorted(unknown)}")
+    name = _text(field.get("name"), f"{where}.name")
+    register = field.get("register", STATUS)
+    if register not in registers:
+        raise ProfileError(f"{where}: регистр {register!r} не описан в registers")
+    bits = _number(field.get("bits", 0xffff), f"{where}.bits")
+    if not 0 < bits <= 0xffff:
+        raise ProfileError(f"{where}.bits: маска вне 16 бит")
+    shift = (bits & -bits).bit_length() - 1
+    width = (bits >> shift).bit_length()
+    if bits >> shift != (1 << width) - 1:
+        raise ProfileError(f"{where}.bits: биты поля должны идти подряд (0x{bits:04x})")
+
+    if "enum" in field:
+        if {"scale", "offset", "unit"} & set(field):
+            raise ProfileError(f"{where}: у поля с enum не бывает scale/offset/unit")
+        if not isinstance(field["enum"], dict) or not field["enum"]:
+            raise ProfileError(f"{where}.enum: ожидается непустой объект значение -> название")
+        enum = []
+        for value, label in field["enum"].items():
+            number = _number(value, f"{where}.enum")
+            if not 0 <= number < 1 << width:
+                raise ProfileError(f"{where}.enum: значение {value} не помещается в поле")
+            enum.append([number, _text(label, f"{where}.enum[{value}]")])
+        return {"name": name, "register": register, "bits": bits, "shift": shift, "enum": sorted(enum)}
+
+    scale = field.get("scale", 1)
+    offset = field.get("offset", 0)
+    for key, value in (("scale", scale), ("offset", offset)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ProfileError(f"{where}.{key}: ожидается число")
+    unit = field.get("unit", "")
+    if not isinstance(unit, str):
+        raise ProfileError(f"{where}.unit: ожидается строка")
+    return {"name": name, "register": register, "bits": bits, "shift": shift,
+            "scale": scale, "offset": offset, "unit": unit}
+
+
+def _check_combos(states, fields, where):
+    """Наборы состояний нумеруются uint16, и один номер занят "нет связи".
+
+    Оценка сверху: значения битов полей с перечислением, умноженные на
+    срабатывания масок по остальным битам.
+    """
+    enum_bits = 0
+    for field in fields:
+        if "enum" in field and field["register"] == STATUS:
+            enum_bits |= field["bits"]
+    mask_bits = 0
+    masks = 0
+    for mask in states:
+        if mask:
+            mask_bits |= mask
+            masks += 1
+    other = min(masks, (mask_bits & ~enum_bits).bit_count())
+    if enum_bits.bit_count() + other >= 16:
+        raise ProfileError(f"{where}: поля с enum (биты 0x{enum_bits:04x}) вместе с масками states "
+                           f"могут дать больше {NO_LINK} наборов состояний - сузьте bits полей")
+
+
+def _validate_type(spec, where):
+    if not isinstance(spec, dict):
+        raise ProfileError(f"{where}: ожидается объект")
+    unknown = set(spec) - TYPE_KEYS
+    if unknown:
+        raise ProfileError(f"{where}: неизвестные ключи {sorted(unknown)}")
+
+    registers = {STATUS: 0}
+    for role, offset in (spec.get("registers") or {}).items():
+        offset = _number(offset, f"{where}.registers.{role}")
+        if not 0 <= offset <= 0xffff:
+            raise ProfileError(f"{where}.registers.{role}: смещение вне диапазона Modbus")
+        registers[_text(role, f"{where}.registers")] = offset
+
+    states = spec.get("states")
+    if not isinstance(states, dict) or not states:
+        raise ProfileError(f"{where}.states: ожидается непустой объект маска -> название")
+    parsed = {}
+    for mask, label in states.items():
+        number = _number(mask, f"{where}.states")
+        if not 0 <= number < NO_LINK:
+            raise ProfileError(f"{where}.states: маска {mask} вне 16 бит")
+        if number in parsed:
+            raise ProfileError(f"{where}.states: маска {mask} повторяется")
+        parsed[number] = _text(label, f"{where}.states[{mask}]")
+    if len(set(parsed.values())) != len(parsed):
+        raise ProfileError(f"{where}.states: названия состояний повторяются")
+
+    fields = spec.get("fields") or []
+    if not isinstance(fields, list):
+        raise ProfileError(f"{where}.fields: ожидается список")
+    fields = [_validate_field(field, registers, f"{where}.fields[{number}]")
+              for number, field in enumerate(fields)]
+    if len({field["name"] for field in fields}) != len(fields):
+        raise ProfileError(f"{where}.fields: имена полей повторяются")
+    _check_combos(parsed, fields, where)
+
+    return {
+        "label": _text(spec.get("label", "Прибор"), f"{where}.label"),
+        "section": _text(spec.get("section", spec.get("label", "Прибор")), f"{where}.section"),
+        "registers": registers,
+        "states": [[mask, label] for mask, label in parsed.items()],
+        "fields": fields,
+    }
+
+
+def validate_profile(data, source="профиль"):
+    """Проверяет разобранный JSON профиля, возвращает нормализованное описание"""
+    if not isinstance(data, dict):
+        raise ProfileError(f"{source}: ожидается объект")
+    name = _text(data.get("profile"), f"{source}: profile")
+    types = data.get("types")
+    if not isinstance(types, dict) or not types:
+        raise ProfileError(f"{source}: types - непустой объект тип точки -> описание")
+    for kind in types:
+        if kind not in KINDS:
+            raise ProfileError(f"{source}: неизвестный тип точки {kind!r}, допустимы {', '.join(KINDS)}")
+    return {
+        "profile": name,
+        "title": str(data.get("title", name)),
+        "types": {kind: _validate_type(spec, f"{source}: types.{kind}") for kind, spec in types.items()},
+    }
+
+
+def build_table(masks, fields=()):
+    """Таблица значение регистра -> набор состояний: (наборы, индексы uint16[65536]).
+
+    masks - [(маска, название)] без нулевой, fields - перечисления
+    регистра состояния (Field). Одинаковые наборы хранятся один раз.
+    """
+    def hits(value):
+        result = 0
+        for index, (mask, _) in enumerate(masks):
+            if value & mask:
+                result |= 1 << index
+        return result
+
+    # (value & mask) != 0 тогда и только тогда, когда сработала младшая
+    # или старшая половина слова, поэтому карты половин объединяются через OR
+    low_hits = [hits(byte) for byte in range(256)]
+    high_hits = [hits(byte << 8) for byte in range(256)]
+
+    combos = []
+    interned = {}
+
+    def combo(key):
+        number = interned.get(key)
+        if number is None:
+            number = interned[key] = len(combos)
+            active = [description for index, (_, description) in enumerate(masks) if key[0] >> index & 1]
+            for field, value in zip(fields, key[1:]):
+                active.append(f"{field.name}: {field.enum.get(value, value)}")
+            combos.append(tuple(active))
+        return number
+
+    index = array('H', bytes(0x20000))
+    if fields:
+        for value in range(0x10000):
+            index[value] = combo((low_hits[value & 0xff] | high_hits[value >> 8],)
+                                 + tuple((value & field.bits) >> field.shift for field in fields))
+    else:
+        for high in range(256):
+            base = high << 8
+            high_hit = high_hits[high]
+            for low in range(256):
+                index[base | low] = combo((low_hits[low] | high_hit,))
+    if len(combos) > NO_LINK:
+        raise ProfileError(f"{len(combos)} наборов состояний не помещаются в таблицу uint16")
+    combos.append((NO_LINK_TEXT,))
+    index[NO_LINK] = len(combos) - 1
+    return tuple(combos), index
+
+
+class CachedCombos:
+    """Наборы состояний из кэша: кортеж набора собирается при первом обращении"""
+
+    __slots__ = ('labels', 'starts', 'members', 'combos')
+
+    def __init__(self, labels, starts, members):
+        self.labels = labels
+        self.starts = starts
+        self.members = members
+        self.combos = [None] * (len(starts) - 1)
+
+    def __len__(self):
+        return len(self.combos)
+
+    def __getitem__(self, number):
+        combo = self.combos[number]
+        if combo is None:
+            labels = self.labels
+            combo = self.combos[number] = tuple(
+                labels[member] for member in self.members[self.starts[number]:self.starts[number + 1]])
+        return combo
+
+
+def _array(typecode, data, offset, count):
+    """Массив little-endian из data[offset:], возвращает (массив, конец)"""
+    values = array(typecode)
+    end = offset + values.itemsize * count
+    values.frombytes(data[offset:end])
+    if len(values) != count:
+        raise ValueError("кэш обрезан")
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values, end
+
+
+def _bytes(values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class ProfileType:
+    """Описание одного типа точки в профиле и его скомпилированная таблица"""
+
+    def __init__(self, kind, spec, combos, index):
+        self.kind = kind
+        self.label = spec["label"]
+        self.section = spec["section"]
+        self.registers = spec["registers"]
+        self.states = {mask: label for mask, label in spec["states"]}
+        self.fields = _fields(spec)
+        self.combos = combos
+        self.index = index
+
+    def values(self, registers):
+        """Числовые поля по прочитанным регистрам: роль -> сырое значение; название -> значение"""
+        result = {}
+        for field in self.fields:
+            raw = registers.get(field.register)
+            if field.enum or raw is None or raw == NO_LINK:
+                continue
+            result[field.name] = ((raw & field.bits) >> field.shift) * field.scale + field.offset
+        return result
+
+    def register(self, role, address):
+        """Адрес регистра роли role для точки с адресом address; None, если роли нет"""
+        offset = self.registers.get(role)
+        return None if offset is None else address + offset
+
+
+class Profile:
+    """Проверенный и скомпилированный профиль: тип точки -> ProfileType"""
+
+    def __init__(self, spec, tables, path=None, digest=None):
+        self.name = spec["profile"]
+        self.title = spec["title"]
+        self.path = path
+        self.digest = digest
+        self.spec = spec
+        self.types = {kind: ProfileType(kind, type_spec, *tables[kind])
+                      for kind, type_spec in spec["types"].items()}
+
+    @classmethod
+    def compile(cls, spec, path=None, digest=None):
+        """Строит таблицы всех типов по проверенному описанию"""
+        tables = {}
+        for kind, type_spec in spec["types"].items():
+            masks = [(mask, label) for mask, label in type_spec["states"] if mask]
+            tables[kind] = build_table(masks, _status_enums(_fields(type_spec)))
+        return cls(spec, tables, path, digest)
+
+    def type(self, kind):
+        """Описание типа точки; тип "unknown" декодируется как прибор"""
+        ptype = self.types.get(kind) or (self.types.get("device") if kind == "unknown" else None)
+        if ptype is None:
+            raise ProfileError(f"Профиль {self.name} не описывает тип точки {kind}")
+        return ptype
+
+    # --- кэш ---
+
+    def dump(self):
+        """Скомпилированный профиль в формате кэша"""
+        labels = []
+        numbers = {}
+        tables = []
+        for ptype in self.types.values():
+            starts = array('I', [0])
+            members = array('H')
+            for number in range(len(ptype.combos)):
+                for label in ptype.combos[number]:
+                    if label not in numbers:
+                        numbers[label] = len(labels)
+                        labels.append(label)
+                    members.append(numbers[label])
+                starts.append(len(members))
+            tables.append((ptype.index, starts, members))
+        header = json.dumps({"spec": self.spec, "labels": labels,
+                             "combos": [len(starts) - 1 for _, starts, _ in tables]},
+                            ensure_ascii=False).encode('utf-8')
+        parts = [HEADER.pack(MAGIC, VERSION, len(header)), header]
+        for index, starts, members in tables:
+            parts.extend((_bytes(index), _bytes(starts), _bytes(members)))
+        return b''.join(parts)
+
+    @classmethod
+    def load(cls, data, path=None, digest=None):
+        """Профиль из кэша без разбора исходного файла и построения таблиц"""
+        magic, version, length = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("неизвестный формат кэша")
+        header = json.loads(data[HEADER.size:HEADER.size + length])
+        labels = header["labels"]
+        offset = HEADER.size + length
+        tables = {}
+        for kind, count in zip(header["spec"]["types"], header["combos"]):
+            index, offset = _array('H', data, offset, 0x10000)
+            starts, offset = _array('I', data, offset, count + 1)
+            members, offset = _array('H', data, offset, starts[-1])
+            tables[kind] = (CachedCombos(labels, starts, members), index)
+        return cls(header["spec"], tables, path, digest)
+
+
+def load_profile(path, cache_dir=None):
+    """Загружает профиль из файла: из кэша по SHA-256 содержимого или с проверкой и компиляцией"""
+    with open(path, 'rb') as f:
+        source = f.read()
+    digest = hashlib.sha256(MAGIC + bytes((VERSION,)) + source).hexdigest()
+    cache = os.path.join(cache_dir, digest[:32] + ".r3p") if cache_dir else None
+    if cache and os.path.exists(cache):
+        try:
+            with open(cache, 'rb') as f:
+                return Profile.load(f.read(), path, digest)
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            log.warning("⚠️ Кэш профиля %s не прочитан, профиль компилируется заново: %s", path, e)
+
+    try:
+        data = json.loads(source.decode('utf-8-sig'))
+    except ValueError as e:
+        raise ProfileError(f"{path}: неверный JSON: {e}") from None
+    profile = Profile.compile(validate_profile(data, path), path, digest)
+    if cache:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            temporary = cache + '.tmp'
+            with open(temporary, 'wb') as f:
+                f.write(profile.dump())
+            os.replace(temporary, cache)
+        except OSError as e:
+            log.warning("⚠️ Кэш профиля %s не записан: %s", path, e)
+    log.info("📐 Профиль %s скомпилирован из %s", profile.name, path)
+    return profile
+
+
+class ProfileLibrary:
+    """Профили по имени: файлы <имя>.json в каталогах объекта и встроенном; загрузка по требованию"""
+
+    def __init__(self, directory=None, cache_dir=None, default=DEFAULT_PROFILE):
+        self.directories = [path for path in (directory, BUILTIN_DIR) if path]
+        self.cache_dir = cache_dir
+        self.default = default
+        self.profiles = {}
+
+    @classmethod
+    def from_config(cls, cfg):
+        cache_dir = cfg.get("profile_cache")
+        if cache_dir is None:
+            cache_dir = os.path.join(cfg.get("history_dir", "history"), "profiles")
+        return cls(cfg.get("profiles_dir", "profiles"), cache_dir or None,
+                   cfg.get("profile") or DEFAULT_PROFILE)
+
+    def path(self, name):
+        for directory in self.directories:
+            path = os.path.join(directory, name + ".json")
+            if os.path.isfile(path):
+                return path
+        raise ProfileError(f"Профиль {name} не найден в {', '.join(self.directories)}")
+
+    def get(self, name=None):
+        """Профиль по имени (None - профиль по умолчанию)"""
+        name = name or self.default
+        profile = self.profiles.get(name)
+        if profile is None:
+            profile = load_profile(self.path(name), self.cache_dir)
+            if profile.name != name:
+                raise ProfileError(f"{profile.path}: в файле профиль {profile.name}, ожидался {name}")
+            self.profiles[name] = profile
+        return profile
+
+    def names(self):
+        """Имена всех доступных профилей"""
+        names = set()
+        for directory in self.directories:
+            if os.path.isdir(directory):
+                names.update(name[:-5] for name in os.listdir(directory) if name.endswith(".json"))
+        return sorted(names)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Проверка и компиляция профилей приборов")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("names", nargs="*", help="Профили (по умолчанию все)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    with open(args.config, "r", encoding="utf-8") as f:
+        library = ProfileLibrary.from_config(json.load(f))
+    errors = 0
+    for name in args.names or library.names():
+        started = time.perf_counter()
+        try:
+            profile = library.get(name)
+        except (OSError, ProfileError) as e:
+            errors += 1
+            print(f"❌ {name}: {e}")
+            continue
+        types = ", ".join(f"{kind} ({len(ptype.states)} состояний, {len(ptype.fields)} полей)"
+                          for kind, ptype in profile.types.items())
+        print(f"✅ {name}: {profile.title}; {types}; {(time.perf_counter() - started) * 1000:.1f} мс")
+    if errors:
+        sys.exit(1)
@@ -0,0 +1,200 @@
+"""Планировщик группового чтения регистров Modbus.
+
+Собирает адреса всех точек из конфига и объединяет их в минимальное число
+блочных запросов read_holding_registers (не более 125 регистров за запрос).
+"""
+
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+# Предел Modbus для функции 0x03
+MAX_REGISTERS_PER_READ = 125
+
+
+class ReadBlock:
+    """Один блочный запрос: начальный адрес, длина и нужные из блока адреса"""
+
+    def __init__(self, start, count, addresses):
+        self.start = start
+        self.count = count
+        self.addresses = addresses
+
+    def __repr__(self):
+        return f"ReadBlock(start={self.start}, count={self.count}, addresses={self.addresses})"
+
+
+class ReadPlan:
+    """План опроса: блоки и соответствие адрес -> ключи конфига"""
+
+    def __init__(self, blocks, keys_by_address):
+        self.blocks = blocks
+        self.keys_by_address = keys_by_address
+
+    def __len__(self):
+        return len(self.blocks)
+
+
+def collect_addresses(addresses):
+    """Возвращает соответствие адрес -> список ключей конфига (без пустых адресов)"""
+    keys_by_address = {}
+    for key, address in addresses.items():
+        if not address or not str(address).strip():
+            continue
+        keys_by_address.setdefault(int(address), []).append(key)
+    return keys_by_address
+
+
+def plan_reads(addresses, max_gap=0, max_count=MAX_REGISTERS_PER_READ):
+    """Строит план чтения из словаря ключ -> адрес.
+
+    max_gap - сколько лишних регистров подряд допускается прочитать между
+    нужными, чтобы не делать отдельный запрос.
+    """
+    if max_count < 1 or max_count > MAX_REGISTERS_PER_READ:
+        raise ValueError(f"max_count должен быть от 1 до {MAX_REGISTERS_PER_READ}")
+    if max_gap < 0:
+        raise ValueError("max_gap не может быть отрицательным")
+
+    keys_by_address = collect_addresses(addresses)
+
+    blocks = []
+    start = None
+    last = None
+    members = []
+    for address in sorted(keys_by_address):
+        if start is not None:
+            gap = address - last - 1
+            if gap <= max_gap and address - start + 1 <= max_count:
+                members.append(address)
+                last = address
+                continue
+            blocks.append(ReadBlock(start, last - start + 1, members))
+        start = last = address
+        members = [address]
+    if start is not None:
+        blocks.append(ReadBlock(start, last - start + 1, members))
+
+    return ReadPlan(blocks, keys_by_address)
+
+
+def _registers(result, start, count, unit_id):
+    """Значения из ответа на чтение блока или None при ошибке"""
+    if result is None or result.isError() or len(result.registers) < count:
+        log.warning("Ошибка чтения регистров %d..%d (unit %d): %s", start, start + count - 1, unit_id, result)
+        return None
+    return result.registers
+
+
+def _block_reads(block, values):
+    """Чтение одного блока плана в values, без ввода-вывода.
+
+    Генератор выдаёт запросы (адрес, число регистров) и получает в ответ
+    значения или None. Если блочный запрос не удался (например, в
+    промежуток попал несуществующий регистр), нужные адреса блока
+    дочитываются по одному. Синхронный и асинхронный опрос отличаются
+    только тем, как выполняют запрос.
+    """
+    registers = yield block.start, block.count
+    if registers is not None:
+        for address in block.addresses:
+            values[address] = registers[address - block.start]
+        return
+
+    for address in block.addresses:
+        if block.count == 1:
+            values[address] = None
+            continue
+        single = yield address, 1
+        values[address] = single[0] if single else None
+
+
+def _read_block(client, start, count, unit_id):
+    """Читает блок регистров, возвращает список значений или None"""
+    log.debug("Чтение регистров %d..%d (unit %d)", start, start + count - 1, unit_id)
+    try:
+        result = client.read_holding_registers(start, count=count, device_id=unit_id)
+    except Exception as e:
+        log.warning("Исключение при чтении регистров %d..%d: %s", start, start + count - 1, e)
+        return None
+    return _registers(result, start, count, unit_id)
+
+
+def read_plan(client, plan, unit_id=1):
+    """Выполняет план чтения, возвращает словарь ключ -> значение (int или None).
+
+    Клиент с собственным read_plan (транспорт с конвейером запросов, см.
+    transport.py) выполняет план сам.
+    """
+    if hasattr(client, "read_plan"):
+        return client.read_plan(plan, unit_id)
+
+    values = {}
+    for block in plan.blocks:
+        reads = _block_reads(block, values)
+        try:
+            request = next(reads)
+            while True:
+                request = reads.send(_read_block(client, *request, unit_id))
+        except StopIteration:
+            pass
+    return _spread_values(plan, values)
+
+
+async def _read_block_async(client, start, count, unit_id, observe=None):
+    """Асинхронный вариант _read_block для AsyncModbus*Client.
+
+    observe(адрес, длительность, ответ, исключение) - замер запроса для метрик.
+    """
+    log.debug("Чтение регистров %d..%d (unit %d)", start, start + count - 1, unit_id)
+    started = time.perf_counter()
+    try:
+        result = await client.read_holding_registers(start, count=count, device_id=unit_id)
+    except Exception as e:
+        if observe is not None:
+            observe(start, time.perf_counter() - started, None, e)
+        log.warning("Исключение при чтении регистров %d..%d: %s", start, start + count - 1, e)
+        return None
+    if observe is not None:
+        observe(start, time.perf_counter() - started, result, None)
+    return _registers(result, start, count, unit_id)
+
+
+async def _read_block_values_async(client, block, unit_id, values, observe=None):
+    """Читает один блок плана в values (с дочитыванием по одному при ошибке)"""
+    reads = _block_reads(block, values)
+    try:
+        request = next(reads)
+        while True:
+            request = reads.send(await _read_block_async(client, *request, unit_id, observe))
+    except StopIteration:
+        pass
+
+
+async def read_plan_async(client, plan, unit_id=1):
+    """Асинхронный вариант read_plan для AsyncModbus*Client"""
+    values = {}
+    for block in plan.blocks:
+        await _read_block_values_async(client, block, unit_id, values)
+    return _spread_values(plan, values)
+
+
+async def read_plan_pipelined(client, plan, unit_id=1, observe=None):
+    """Все блоки плана запрашиваются одновременно (для транспорта с конвейером запросов)"""
+    # asyncio нужен только асинхронным движкам, синхронный опрос его не загружает
+    import asyncio
+
+    values = {}
+    await asyncio.gather(*(_read_block_values_async(client, block, unit_id, values, observe)
+                           for block in plan.blocks))
+    return _spread_values(plan, values)
+
+
+def _spread_values(plan, values):
+    """Раскладывает значения по адресам обратно на ключи конфига"""
+    results = {}
+    for address, keys in plan.keys_by_address.items():
+        for key in keys:
+            results[key] = values.get(address)
+    return results
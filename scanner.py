@@ -0,0 +1,299 @@
+"""Поиск приборов и регистров на шинах для пусконаладки.
+
+Сканер перебирает unit ID и диапазоны регистров на всех портах конфига
+(порты - параллельно, на одной полудуплексной шине - по одному запросу) и
+составляет таблицу точек для "points_file" (см. point_table.py) с
+предложенным типом каждой точки.
+
+Порядок работы на порту:
+    1. прибор ищется одним чтением регистра: ответ с исключением Modbus
+       тоже означает, что прибор есть;
+    2. диапазоны отвечающих приборов читаются блоками по 125 регистров;
+       блок, отвергнутый прибором (несуществующий регистр), делится
+       пополам, пока не останутся читаемые участки;
+    3. значения читаются samples раз, биты объединяются - точка, где за
+       время поиска что-то мигнуло, получает тип по всем увиденным битам.
+
+Таймауты на COM-порту - адаптивные (timing.py) без повторов: первый
+ответивший прибор задаёт оценку линии, и отсутствующий unit стоит
+десятки миллисекунд, а не секунду. Тип точки - тот из масок профиля
+объекта ("profile"), чьи биты покрывают все увиденные биты значения; из
+подходящих выбирается самый узкий набор масок, остальные печатаются в
+отчёте как альтернативы. Точки с нулём во всех выборках в таблицу не
+попадают (их тип не определить), если не задан --include-zero.
+
+    "scan": {"units": "1-32", "registers": ["40000-43999"], "timeout": 0.2, "samples": 3}
+
+    python cli.py scan --out points.json
+    python cli.py scan --units 1-5 --registers 41000-41999 --out points.csv
+"""
+
+import argparse
+import csv
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from async_poller import port_configs
+from point_table import load_config
+from read_planner import MAX_REGISTERS_PER_READ, plan_reads
+from status_tables import StatusDecoder
+from timing import AdaptiveTimingClient, TimingController, bits_per_char, wire_time
+from transport import make_client
+
+log = logging.getLogger(__name__)
+
+UNITS = "1-32"
+REGISTERS = ("40000-43999",)
+# Наибольший запас на ответ сверх передачи кадров, с: живой прибор R3-МС-КП отвечает за десятки миллисекунд
+TIMEOUT = 0.2
+SAMPLES = 1
+SAMPLE_INTERVAL = 0.5
+NO_LINK = 0xffff
+# Исключения шлюза: путь недоступен, целевой прибор не ответил - прибора нет
+GATEWAY_NO_TARGET = (0x0a, 0x0b)
+
+
+def parse_ranges(text):
+    """Диапазоны "1-10,15,20-22" -> [(первый, последний)]"""
+    ranges = []
+    for part in str(text).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        first = int(first)
+        last = int(last) if last else first
+        if first > last:
+            raise ValueError(f"Неверный диапазон: {part}")
+        ranges.append((first, last))
+    return ranges
+
+
+def mask_union(masks):
+    union = 0
+    for code in masks:
+        union |= code
+    return union
+
+
+class TypeGuesser:
+    """Предлагает тип точки по битам, которые покрывают маски профиля StatusDecoder"""
+
+    def __init__(self, decoder=None):
+        decoder = decoder or StatusDecoder()
+        # (тип, объединение масок) от самого узкого набора к самому широкому
+        self.unions = sorted(((kind, mask_union(ptype.states)) for kind, ptype in decoder.profile.types.items()),
+                             key=lambda item: (bin(item[1]).count("1"), item[0]))
+
+    def candidates(self, seen):
+        """Типы, маски которых объясняют все увиденные биты"""
+        if not seen or seen == NO_LINK:
+            return []
+        return [kind for kind, union in self.unions if seen & ~union == 0]
+
+
+class PortScanner:
+    """Поиск на одной шине; запросы строго по одному"""
+
+    def __init__(self, port_cfg, cfg, units, ranges, samples=SAMPLES, timeout=TIMEOUT,
+                 sample_interval=SAMPLE_INTERVAL):
+        self.port = port_cfg["com_port"]
+        self.port_cfg = port_cfg
+        self.cfg = cfg
+        self.units = units
+        self.ranges = ranges
+        self.samples = samples
+        self.timeout = timeout
+        self.sample_interval = sample_interval
+        self.requests = 0
+        self.found = {}     # unit -> {адрес: объединение битов по выборкам}
+
+    def _make_client(self):
+        # Граница таймаута - запас на ответ сверх передачи самого длинного блока по линии
+        bits = bits_per_char(self.cfg.get("bytesize", 8), self.cfg.get("parity", "N"), self.cfg.get("stopbits", 1))
+        max_timeout = self.timeout + wire_time(MAX_REGISTERS_PER_READ, self.port_cfg["baudrate"], bits)
+        transport = self.port_cfg.get("transport")
+        gateway = make_client(self.cfg, {"transport": transport and dict(transport, timeout=max_timeout)})
+        if gateway is not None:
+            return gateway
+        from pymodbus.client import ModbusSerialClient
+
+        client = ModbusSerialClient(
+            port=self.port,
+            stopbits=self.cfg.get("stopbits", 1),
+            bytesize=self.cfg.get("bytesize", 8),
+            baudrate=self.port_cfg["baudrate"],
+            timeout=max_timeout,
+            retries=0,
+            parity=self.cfg.get("parity", "N"),
+        )
+        # Без повторов; таймаут по оценке линии
+        timing = TimingController(self.port_cfg["baudrate"], bits, max_timeout=max_timeout, retries=0)
+        return AdaptiveTimingClient(client, timing)
+
+    def _read(self, client, unit, address, count):
+        """Ответ прибора (результат pymodbus) или None, если ответа нет"""
+        self.requests += 1
+        try:
+            result = client.read_holding_registers(address, count=count, device_id=unit)
+        except Exception as e:
+            log.debug("%s unit %d: нет ответа на %d..%d: %s", self.port, unit, address, address + count - 1, e)
+            return None
+        if result is not None and result.isError() and getattr(result, 'exception_code', None) in GATEWAY_NO_TARGET:
+            return None
+        return result
+
+    def _present(self, client, unit):
+        return self._read(client, unit, self.ranges[0][0], 1) is not None
+
+    def _sweep(self, client, unit, start, count, values):
+        """Читает участок; отвергнутый прибором блок делится пополам"""
+        result = self._read(client, unit, start, count)
+        if result is None:
+            log.warning("%s unit %d: нет ответа на блок %d..%d", self.port, unit, start, start + count - 1)
+            return
+        if not result.isError() and len(result.registers) >= count:
+            for offset, value in enumerate(result.registers[:count]):
+                values[start + offset] = values.get(start + offset, 0) | value
+            return
+        if count > 1:
+            half = count // 2
+            self._sweep(client, unit, start, half, values)
+            self._sweep(client, unit, start + half, count - half, values)
+
+    def _map(self, client, unit):
+        """Первая выборка: поиск читаемых регистров, значения - по адресам"""
+        values = {}
+        for first, last in self.ranges:
+            for start in range(first, last + 1, MAX_REGISTERS_PER_READ):
+                self._sweep(client, unit, start, min(MAX_REGISTERS_PER_READ, last + 1 - start), values)
+        return values
+
+    def _resample(self, client, unit, values):
+        """Повторные выборки только найденных участков, блоками"""
+        plan = plan_reads({str(address): address for address in values})
+        for block in plan.blocks:
+            result = self._read(client, unit, block.start, block.count)
+            if result is None or result.isError() or len(result.registers) < block.count:
+                continue
+            for address in block.addresses:
+                values[address] |= result.registers[address - block.start]
+
+    def run(self):
+        client = self._make_client()
+        if not client.connect():
+            log.error("❌ %s: не удалось подключиться", self.port)
+            return self
+        try:
+            present = [unit for first, last in self.units for unit in range(first, last + 1)
+                       if self._present(client, unit)]
+            log.info("🔎 %s: ответили unit %s", self.port, ", ".join(map(str, present)) or "нет")
+            for unit in present:
+                self.found[unit] = self._map(client, unit)
+                log.info("🔎 %s unit %d: читаемых регистров %d", self.port, unit, len(self.found[unit]))
+            for _ in range(self.samples - 1):
+                time.sleep(self.sample_interval)
+                for unit, values in self.found.items():
+                    self._resample(client, unit, values)
+        finally:
+            client.close()
+        return self
+
+
+def scan(cfg, units=None, ranges=None, samples=None, timeout=None):
+    """Поиск на всех портах конфига параллельно, возвращает [PortScanner]"""
+    options = cfg.get("scan") or {}
+    units = parse_ranges(units or options.get("units", UNITS))
+    if ranges is None:
+        ranges = options.get("registers", REGISTERS)
+        ranges = [item for text in ([ranges] if isinstance(ranges, str) else ranges)
+                  for item in parse_ranges(text)]
+    else:
+        ranges = parse_ranges(ranges)
+    for first, last in units:
+        if not 1 <= first <= last <= 247:
+            raise ValueError(f"Unit ID вне диапазона 1..247: {first}-{last}")
+    for first, last in ranges:
+        if not 0 <= first <= last <= 0xffff:
+            raise ValueError(f"Адрес вне диапазона Modbus: {first}-{last}")
+
+    scanners = [PortScanner(port_cfg, cfg, units, ranges, samples or options.get("samples", SAMPLES),
+                            timeout or options.get("timeout", TIMEOUT))
+                for port_cfg in port_configs(cfg)]
+    with ThreadPoolExecutor(max_workers=len(scanners), thread_name_prefix="scan") as pool:
+        return list(pool.map(PortScanner.run, scanners))
+
+
+def suggest_points(scanners, guesser=None, include_zero=False):
+    """Таблица точек по результатам поиска: [{key, address, type, unit, port}], альтернативы типов"""
+    guesser = guesser or TypeGuesser()
+    several_units = sum(len(scanner.found) for scanner in scanners) > 1
+    several_ports = len(scanners) > 1
+    points = []
+    alternatives = {}
+    for scanner in scanners:
+        for unit, values in sorted(scanner.found.items()):
+            for address, seen in sorted(values.items()):
+                if not seen and not include_zero:
+                    continue
+                candidates = guesser.candidates(seen)
+                kind = candidates[0] if candidates else "unknown"
+                key = kind if kind != "unknown" else "register"
+                if several_ports:
+                    key += f"_{scanner.port}"
+                if several_units:
+                    key += f"_u{unit}"
+                key += f"_{address}"
+                points.append({"key": key, "address": address, "type": kind, "unit": unit,
+                               "port": scanner.port})
+                alternatives[key] = (seen, candidates[1:])
+    return points, alternatives
+
+
+def write_points(path, points):
+    """Файл для "points_file": CSV (key,address,type,unit,port) или JSON-список"""
+    if path.lower().endswith(".csv"):
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["key", "address", "type", "unit", "port"])
+            writer.writeheader()
+            writer.writerows(points)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(points, f, ensure_ascii=False, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Поиск приборов и регистров на шинах")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--units", help=f"Unit ID, например 1-10,15 (по умолчанию {UNITS})")
+    parser.add_argument("--registers", help=f"Диапазоны адресов (по умолчанию {','.join(REGISTERS)})")
+    parser.add_argument("--samples", type=int, help="Сколько раз читать найденные регистры")
+    parser.add_argument("--timeout", type=float, help="Наибольший таймаут ответа, с")
+    parser.add_argument("--include-zero", action="store_true", help="Включать регистры с нулевым значением")
+    parser.add_argument("--out", default="points.json", help="Таблица точек .json или .csv")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    cfg = load_config(args.config)
+    started = time.perf_counter()
+    scanners = scan(cfg, args.units, args.registers, args.samples, args.timeout)
+    elapsed = time.perf_counter() - started
+
+    decoder = StatusDecoder.from_config(cfg)
+    points, alternatives = suggest_points(scanners, TypeGuesser(decoder), include_zero=args.include_zero)
+    for point in points:
+        seen, others = alternatives[point["key"]]
+        states = decoder.decode(point["type"], seen) if point["type"] != "unknown" else ()
+        print(f"{point['port']} unit {point['unit']} {point['address']}: 0x{seen:04x} -> {point['type']}"
+              + (f" (или {', '.join(others)})" if others else "")
+              + (f": {', '.join(states)}" if states else ""))
+    write_points(args.out, points)
+    requests = sum(scanner.requests for scanner in scanners)
+    print(f"Поиск: {elapsed:.1f} с, запросов {requests}, точек {len(points)} -> {args.out}")
+    print(f'Подключение: "points_file": "{args.out}" в {args.config}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""Планировщик опроса с приоритетами и адаптивной частотой.
+
+У каждого класса точек свой целевой интервал и приоритет (пожарные зоны
+чаще, состояние приборов реже). Очередь упорядочена по ближайшему сроку
+(earliest deadline first), при равных сроках - по приоритету. Точки, срок
+которых наступил, читаются подряд без пауз; пауза возможна только когда
+опрашивать нечего. Точка, значение которой только что изменилось, на
+короткое время опрашивается чаще. Точки в карантине (health.py) уходят из
+основной очереди в очередь проб, которые читаются только в паузах.
+"""
+
+import heapq
+import time
+from collections import OrderedDict
+
+from health import QUARANTINED
+from read_planner import plan_reads, read_plan
+from timing import inter_frame_gap, wire_time
+
+# Интервал (с) и приоритет (меньше - важнее) по умолчанию для классов точек
+DEFAULT_CLASSES = {
+    "fire_zone": {"interval": 0.25, "priority": 0},
+    "security_zone": {"interval": 0.5, "priority": 1},
+    "actuator": {"interval": 1.0, "priority": 2},
+    "device": {"interval": 5.0, "priority": 3},
+}
+# Класс для ключей, не попавших ни в один из известных
+DEFAULT_CLASS = {"interval": 2.0, "priority": 4}
+
+# Ускоренный опрос после изменения значения
+BOOST_INTERVAL = 0.25
+BOOST_DURATION = 10.0
+
+# Время ответа прибора (оборот шины) на один запрос, с
+TURNAROUND = 0.005
+
+# Сколько планов чтения хранить: наборы наступивших точек при разных
+# интервалах почти не повторяются, кэш без предела рос бы всё время работы
+PLAN_CACHE_SIZE = 256
+
+
+def point_class(key, declared=None):
+    """Класс точки: явный тип из таблицы точек или подстрока ключа, как в опросе"""
+    if declared and declared != "unknown":
+        return declared
+    for name in DEFAULT_CLASSES:
+        if name in key:
+            return name
+    return None
+
+
+def frame_time(count, baudrate, bits_per_char=10):
+    """Время одного запроса 0x03 на count регистров в режиме RTU, с.
+
+    Запрос - 8 байт, ответ - 5 + 2*count байт, между кадрами пауза 3.5 символа
+    (выше 19200 бод - 1.75 мс).
+    """
+    return wire_time(count, baudrate, bits_per_char) + 2 * inter_frame_gap(baudrate, bits_per_char) + TURNAROUND
+
+
+class PollScheduler:
+    """EDF-очередь точек опроса"""
+
+    def __init__(self, addresses, classes=None, baudrate=9600, max_gap=0,
+                 boost_interval=BOOST_INTERVAL, boost_duration=BOOST_DURATION, clock=time.monotonic,
+                 units=None, health=None, types=None):
+        self.addresses = {key: address for key, address in addresses.items()
+                          if address and str(address).strip()}
+        # Unit ID точек; для точек без записи используется unit_id цикла опроса
+        self.units = dict(units or {})
+        self.classes = dict(DEFAULT_CLASSES)
+        for name, params in (classes or {}).items():
+            self.classes[name] = dict(self.classes.get(name, DEFAULT_CLASS), **params)
+        # Класс каждой точки определяется один раз: ключ -> имя класса
+        self.point_classes = {}
+        self._classify(types)
+        self.baudrate = baudrate
+        self.max_gap = max_gap
+        self.boost_interval = boost_interval
+        self.boost_duration = boost_duration
+        self.clock = clock
+        # Автомат исправности точек (health.HealthTracker) или None - без карантина
+        self.health = health
+
+        self.last_values = {}
+        self.boost_until = {}
+        self.plans = OrderedDict()
+        self.heap = []
+        self.probes = []
+        self.sequence = 0
+
+        now = clock()
+        for key in self.addresses:
+            self._push(key, now)
+        self._configure_health()
+
+    def _configure_health(self):
+        if self.health is not None:
+            self.health.configure({key: self.units.get(key) for key in self.addresses})
+
+    def _classify(self, types):
+        """Классы точек по типам таблицы точек (types: ключ -> тип) или по ключам"""
+        types = types or {}
+        self.point_classes = {key: point_class(key, types.get(key)) for key in self.addresses}
+
+    def _params(self, key):
+        return self.classes.get(self.point_classes.get(key), DEFAULT_CLASS)
+
+    def interval(self, key, now=None):
+        """Текущий интервал опроса точки с учётом ускорения после изменения"""
+        interval = self._params(key)["interval"]
+        now = self.clock() if now is None else now
+        if self.boost_until.get(key, 0) > now:
+            interval = min(interval, self.boost_interval)
+        return interval
+
+    def _push(self, key, deadline):
+        self.sequence += 1
+        heapq.heappush(self.heap, (deadline, self._params(key)["priority"], self.sequence, key))
+
+    def _push_probe(self, key, deadline):
+        self.sequence += 1
+        heapq.heappush(self.probes, (deadline, self.sequence, key))
+
+    def next_deadline(self):
+        deadlines = [queue[0][0] for queue in (self.heap, self.probes) if queue]
+        return min(deadlines) if deadlines else None
+
+    def pop_due(self, now=None):
+        """Забирает из очереди все точки, срок которых наступил (точки в карантине - в пробы)"""
+        now = self.clock() if now is None else now
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            key = heapq.heappop(self.heap)[3]
+            if self.health is not None and self.health.state(key) == QUARANTINED:
+                self._push_probe(key, now + self.health.probe_delay(key))
+                continue
+            due.append(key)
+        return due
+
+    def pop_probe(self, now=None):
+        """Одна точка в карантине, срок пробы которой наступил, или None"""
+        now = self.clock() if now is None else now
+        if self.probes and self.probes[0][0] <= now:
+            return heapq.heappop(self.probes)[2]
+        return None
+
+    def reload(self, addresses, units=None, types=None):
+        """Подменяет набор точек, сохраняя сроки и историю уже известных"""
+        addresses = {key: address for key, address in addresses.items()
+                     if address and str(address).strip()}
+        kept = [entry for entry in self.heap
+                if entry[3] in addresses and addresses[entry[3]] == self.addresses.get(entry[3])]
+        kept_probes = [entry for entry in self.probes
+                       if entry[2] in addresses and addresses[entry[2]] == self.addresses.get(entry[2])]
+        known = {entry[3] for entry in kept} | {entry[2] for entry in kept_probes}
+
+        self.addresses = addresses
+        self.units = dict(units or {})
+        self._classify(types)
+        self.plans.clear()
+        for values in (self.last_values, self.boost_until):
+            for key in list(values):
+                if key not in known:
+                    del values[key]
+
+        self.heap = kept
+        heapq.heapify(self.heap)
+        self.probes = kept_probes
+        heapq.heapify(self.probes)
+        now = self.clock()
+        for key in addresses:
+            if key not in known:
+                self._push(key, now)
+        self._configure_health()
+
+    def group_by_unit(self, keys, default_unit):
+        """Раскладывает точки по Unit ID: {unit: [ключи]}"""
+        groups = {}
+        for key in keys:
+            groups.setdefault(self.units.get(key, default_unit), []).append(key)
+        return groups
+
+    def plan_for(self, keys):
+        """План блочного чтения для набора точек (последние PLAN_CACHE_SIZE наборов кэшируются)"""
+        keys = tuple(sorted(keys))
+        plan = self.plans.get(keys)
+        if plan is None:
+            plan = self.plans[keys] = plan_reads({key: self.addresses[key] for key in keys},
+                                                 max_gap=self.max_gap)
+            if len(self.plans) > PLAN_CACHE_SIZE:
+                self.plans.popitem(last=False)
+        else:
+            self.plans.move_to_end(keys)
+        return plan
+
+    def complete(self, key, value, now=None):
+        """Отмечает опрос точки и ставит её в очередь снова.
+
+        Возвращает True, если значение новое (первое чтение или изменение).
+        """
+        now = self.clock() if now is None else now
+        known = key in self.last_values
+        changed = not known or self.last_values[key] != value
+        self.last_values[key] = value
+        if known and changed:
+            self.boost_until[key] = now + self.boost_duration
+        if self.health is not None and self.health.observe(key, value, now) == QUARANTINED:
+            self._push_probe(key, now + self.health.probe_delay(key))
+        else:
+            self._push(key, now + self.interval(key, now))
+        return changed
+
+    def bus_load(self):
+        """Доля времени шины, нужная для заданных интервалов (1.0 - шина занята полностью).
+
+        Точки одного класса опрашиваются вместе, поэтому считаются блочными чтениями.
+        """
+        by_class = {}
+        for key, address in self.addresses.items():
+            by_class.setdefault(self.point_classes.get(key), {})[key] = address
+
+        load = 0.0
+        for name, addresses in by_class.items():
+            interval = self.classes.get(name, DEFAULT_CLASS)["interval"]
+            for block in plan_reads(addresses, max_gap=self.max_gap).blocks:
+                load += frame_time(block.count, self.baudrate) / interval
+        return load
+
+    def capacity_warning(self):
+        """Сообщение, если заданные частоты опроса не помещаются в пропускную способность шины"""
+        load = self.bus_load()
+        if load <= 1.0:
+            return None
+        return (f"Заданные интервалы требуют {load:.0%} пропускной способности шины "
+                f"на {self.baudrate} бод: точки будут опрашиваться реже заданного")
+
+
+def run_scheduled(client, scheduler, unit_id, on_values, sleep=time.sleep, on_cycle=None):
+    """Цикл опроса по расписанию: читает точки по мере наступления сроков.
+
+    on_values(values, changed) получает прочитанные значения и множество
+    ключей с новым значением; on_cycle(seconds) - длительность чтения пачки.
+    Пробы точек в карантине читаются по одной, только когда основной опрос ждёт.
+    """
+    while True:
+        due = scheduler.pop_due()
+        if not due:
+            probe = scheduler.pop_probe()
+            if probe is None:
+                deadline = scheduler.next_deadline()
+                sleep(max(0.0, deadline - scheduler.clock()) if deadline is not None else 1.0)
+                continue
+            due = [probe]
+
+        started = scheduler.clock()
+        values = {}
+        for unit, keys in scheduler.group_by_unit(due, unit_id).items():
+            values.update(read_plan(client, scheduler.plan_for(keys), unit))
+        now = scheduler.clock()
+        if on_cycle is not None:
+            on_cycle(now - started)
+        changed = {key for key in due if scheduler.complete(key, values.get(key), now)}
+        on_values(values, changed)
@@ -0,0 +1,267 @@
+"""Образ регистров в разделяемой памяти для многопроцессного режима.
+
+Процесс опроса пишет сырые значения точек и времена их чтения/изменения в
+блок multiprocessing.shared_memory, веб-процессы читают его напрямую, без
+сериализации и передачи через каналы. Согласованность обеспечивает
+seqlock: писатель делает счётчик нечётным на время записи и чётным после,
+читатель копирует массивы и повторяет чтение, если счётчик был нечётным
+или изменился. Копия одна на чтение: байты блока сразу попадают в массивы
+ImageState (согласованный снимок без копии при seqlock невозможен -
+писатель меняет блок в любой момент). Писатель никогда не ждёт читателей,
+поэтому число открытых страниц не влияет на время опроса шины.
+
+Раскладка блока (little-endian):
+    заголовок (64 байта) - сигнатура, счётчик seqlock, поколение таблицы
+                           точек, ёмкость, число точек, длины метаданных и
+                           текста, время последней записи;
+    values   uint16[ёмкость] - сырые значения;
+    read     double[ёмкость] - время последнего успешного чтения (0 - не читали);
+    changed  double[ёмкость] - время последнего изменения значения;
+    health   uint8[ёмкость]  - исправность точки, индекс в health.STATES;
+    seen     uint32[ёмкость] - состояния, увиденные за сессию, по номерам (state_coverage.py;
+                               в образ попадают первые 32 состояния точки);
+    meta     - JSON с ключами, адресами, типами и профилями точек (меняется с поколением);
+    text     - произвольный текст (метрики Prometheus процесса опроса).
+"""
+
+import json
+import struct
+import time
+from array import array
+from multiprocessing import shared_memory
+
+MAGIC = b'R3SM'
+LAYOUT = 3
+# сигнатура, раскладка, seq, поколение, ёмкость, точек, ёмкость/длина meta, ёмкость/длина text, время записи
+HEADER = struct.Struct('<4sHxxQQIIIIIId')
+HEADER_SIZE = 64
+SEQ = struct.Struct('<Q')
+SEQ_OFFSET = 8
+
+# Объём метаданных на точку (ключ, адрес, тип в JSON) и текста метрик
+META_BYTES_PER_POINT = 128
+TEXT_CAPACITY = 1024 * 1024
+# Сколько раз читатель повторяет чтение, пока писатель пишет
+READ_RETRIES = 1000
+
+
+def _layout(capacity, meta_capacity):
+    """Смещения областей: values, read, changed, meta, text, health, seen"""
+    values = HEADER_SIZE
+    read = values + (capacity * 2 + 7) // 8 * 8
+    changed = read + capacity * 8
+    health = changed + capacity * 8
+    seen = health + (capacity + 7) // 8 * 8
+    meta = seen + (capacity * 4 + 7) // 8 * 8
+    text = meta + meta_capacity
+    return values, read, changed, meta, text, health, seen
+
+
+class ImageState:
+    """Согласованная копия образа: значения и времена в порядке точек метаданных"""
+
+    __slots__ = ('seq', 'generation', 'updated', 'values', 'read', 'changed', 'health', 'seen')
+
+    def __init__(self, seq, generation, updated, values, read, changed, health, seen):
+        self.seq = seq
+        self.generation = generation
+        self.updated = updated
+        self.values = values
+        self.read = read
+        self.changed = changed
+        self.health = health
+        self.seen = seen
+
+
+class SharedImageWriter:
+    """Писатель образа (процесс опроса), единственный на блок"""
+
+    def __init__(self, capacity, name=None, text_capacity=TEXT_CAPACITY):
+        self.capacity = capacity
+        self.meta_capacity = capacity * META_BYTES_PER_POINT
+        self.text_capacity = text_capacity
+        offsets = _layout(capacity, self.meta_capacity)
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=offsets[4] + text_capacity)
+        self.name = self.shm.name
+
+        buf = self.shm.buf
+        self._slices = [buf[offsets[0]:offsets[0] + capacity * 2],
+                        buf[offsets[1]:offsets[1] + capacity * 8],
+                        buf[offsets[2]:offsets[2] + capacity * 8],
+                        buf[offsets[5]:offsets[5] + capacity],
+                        buf[offsets[6]:offsets[6] + capacity * 4]]
+        self.values = self._slices[0].cast('H')
+        self.read = self._slices[1].cast('d')
+        self.changed = self._slices[2].cast('d')
+        self.health = self._slices[3]
+        self.seen = self._slices[4].cast('I')
+        self.meta_offset = offsets[3]
+        self.text_offset = offsets[4]
+
+        self.seq = 0
+        self.generation = 0
+        self.count = 0
+        self.meta_len = 0
+        self.text_len = 0
+        self.index = {}
+        self._write_header(time.time())
+
+    def _write_header(self, updated):
+        # Не pack_into: он сначала обнуляет область, и читатель может увидеть нулевой (чётный) seq
+        self.shm.buf[:HEADER.size] = HEADER.pack(MAGIC, LAYOUT, self.seq, self.generation, self.capacity,
+                                                 self.count, self.meta_capacity, self.meta_len,
+                                                 self.text_capacity, self.text_len, updated)
+
+    def _write_seq(self):
+        self.shm.buf[SEQ_OFFSET:SEQ_OFFSET + SEQ.size] = SEQ.pack(self.seq)
+
+    def _begin(self):
+        self.seq += 1
+        self._write_seq()
+
+    def _end(self, updated):
+        # Заголовок пишется при нечётном счётчике, чётный счётчик - последним
+        self._write_header(updated)
+        self.seq += 1
+        self._write_seq()
+
+    @staticmethod
+    def _meta(points):
+        return json.dumps({'keys': [point[0] for point in points],
+                           'addresses': [str(point[1]) for point in points],
+                           'types': [point[2] for point in points],
+                           'profiles': [point[3] if len(point) > 3 else None for point in points]},
+                          ensure_ascii=False).encode('utf-8')
+
+    def configure(self, points):
+        """Новая таблица точек: points - [(ключ, адрес, тип[, профиль])]; значения обнуляются.
+
+        Точки сверх ёмкости блока не публикуются; возвращает число опубликованных.
+        """
+        points = list(points)[:self.capacity]
+        meta = self._meta(points)
+        while len(meta) > self.meta_capacity:
+            points = points[:len(points) * self.meta_capacity // len(meta)]
+            meta = self._meta(points)
+
+        self._begin()
+        self.shm.buf[self.meta_offset:self.meta_offset + len(meta)] = meta
+        for slot in range(self.count):
+            self.values[slot] = 0
+            self.read[slot] = 0.0
+            self.changed[slot] = 0.0
+            self.health[slot] = 0
+            self.seen[slot] = 0
+        self.index = {point[0]: slot for slot, point in enumerate(points)}
+        self.count = len(points)
+        self.meta_len = len(meta)
+        self.generation += 1
+        self._end(time.time())
+        return self.count
+
+    def write(self, values, now=None, health=None, coverage=None):
+        """Записывает прочитанные значения точек (None - нет ответа, не записывается).
+
+        health - изменившиеся состояния исправности: ключ -> индекс в health.STATES,
+        coverage - изменившиеся маски покрытия: ключ -> маска.
+        """
+        now = time.time() if now is None else now
+        self._begin()
+        for key, state in (health or {}).items():
+            slot = self.index.get(key)
+            if slot is not None:
+                self.health[slot] = state
+        for key, seen in (coverage or {}).items():
+            slot = self.index.get(key)
+            if slot is not None:
+                self.seen[slot] = seen & 0xffffffff
+        for key, raw in values.items():
+            slot = self.index.get(key)
+            if slot is None or raw is None:
+                continue
+            if self.values[slot] != raw or not self.read[slot]:
+                self.values[slot] = raw
+                self.changed[slot] = now
+            self.read[slot] = now
+        self._end(now)
+
+    def write_text(self, text):
+        """Заменяет текстовую область (обрезается по ёмкости)"""
+        data = text.encode('utf-8')[:self.text_capacity]
+        self._begin()
+        self.shm.buf[self.text_offset:self.text_offset + len(data)] = data
+        self.text_len = len(data)
+        self._end(time.time())
+
+    def close(self):
+        for view in (self.values, self.read, self.changed, self.seen, *self._slices):
+            view.release()
+        self.shm.close()
+        self.shm.unlink()
+
+
+class SharedImageReader:
+    """Читатель образа (веб-процесс); писателя не блокирует"""
+
+    def __init__(self, name):
+        self.shm = shared_memory.SharedMemory(name=name)
+        magic, layout, _, _, capacity, _, meta_capacity, _, text_capacity, _, _ = HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC or layout != LAYOUT:
+            self.shm.close()
+            raise ValueError(f"Блок {name} не является образом регистров")
+        self.capacity = capacity
+        self.offsets = _layout(capacity, meta_capacity)
+
+    def sequence(self):
+        """Текущее значение счётчика: дешёвая проверка, изменилось ли что-то"""
+        return SEQ.unpack_from(self.shm.buf, SEQ_OFFSET)[0]
+
+    def _consistent(self, copy):
+        """Выполняет copy(заголовок) под seqlock и возвращает (заголовок, результат)"""
+        buf = self.shm.buf
+        for _ in range(READ_RETRIES):
+            seq = SEQ.unpack_from(buf, SEQ_OFFSET)[0]
+            if seq % 2:
+                time.sleep(0)
+                continue
+            header = HEADER.unpack_from(buf, 0)
+            result = copy(header)
+            if SEQ.unpack_from(buf, SEQ_OFFSET)[0] == seq and header[2] == seq:
+                return header, result
+        raise TimeoutError("Образ регистров непрерывно изменяется")
+
+    def read(self):
+        """Согласованная копия значений и времён"""
+        values_offset, read_offset, changed_offset, _, _, health_offset, seen_offset = self.offsets
+        buf = self.shm.buf
+
+        def copy(header):
+            # Из блока прямо в массивы, без промежуточных bytes
+            count = header[5]
+            areas = []
+            for typecode, offset, size in (('H', values_offset, 2), ('d', read_offset, 8),
+                                           ('d', changed_offset, 8), ('B', health_offset, 1),
+                                           ('I', seen_offset, 4)):
+                area = array(typecode)
+                area.frombytes(buf[offset:offset + count * size])
+                areas.append(area)
+            return areas
+
+        header, (values, read, changed, health, seen) = self._consistent(copy)
+        return ImageState(header[2], header[3], header[10], values, read, changed, health, seen)
+
+    def meta(self):
+        """(поколение, метаданные точек)"""
+        meta_offset = self.offsets[3]
+        buf = self.shm.buf
+        header, data = self._consistent(lambda header: bytes(buf[meta_offset:meta_offset + header[7]]))
+        return header[3], json.loads(data) if data else {'keys': [], 'addresses': [], 'types': []}
+
+    def text(self):
+        text_offset = self.offsets[4]
+        buf = self.shm.buf
+        _, data = self._consistent(lambda header: bytes(buf[text_offset:text_offset + header[9]]))
+        return data.decode('utf-8', errors='replace')
+
+    def close(self):
+        self.shm.close()
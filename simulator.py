@@ -0,0 +1,109 @@
+"""Локальный имитатор прибора Modbus (вместо R3-МС-КП на COM-порту).
+
+Поднимает pymodbus TCP-сервер с заданной картой регистров, задержкой
+ответа и внесением ошибок. Используется бенчмарком и для отладки опроса
+без реального оборудования:
+
+    python simulator.py --port 5020 --delay 0.005 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import random
+
+from pymodbus.constants import ExcCodes
+from pymodbus.datastore import ModbusServerContext
+from pymodbus.datastore.context import ModbusBaseDeviceContext
+from pymodbus.framer import FramerType
+from pymodbus.server import ModbusTcpServer
+
+
+class SimulatedDevice(ModbusBaseDeviceContext):
+    """Прибор с картой holding-регистров, задержкой и случайными ошибками"""
+
+    def __init__(self, registers=None, delay=0.0, error_rate=0.0, change_rate=0.0, seed=None):
+        self.registers = dict(registers or {})
+        self.delay = delay
+        self.error_rate = error_rate
+        self.change_rate = change_rate
+        self.random = random.Random(seed)
+
+    def reset(self):
+        self.registers.clear()
+
+    def _maybe_change(self, address, count):
+        """Случайно меняет биты в читаемых регистрах (имитация событий)"""
+        if self.change_rate and self.random.random() < self.change_rate:
+            target = address + self.random.randrange(count)
+            self.registers[target] = self.registers.get(target, 0) ^ (1 << self.random.randrange(16))
+
+    async def async_getValues(self, func_code, address, count=1):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.error_rate and self.random.random() < self.error_rate:
+            return ExcCodes.DEVICE_FAILURE
+        self._maybe_change(address, count)
+        return self.getValues(func_code, address, count)
+
+    def getValues(self, func_code, address, count=1):
+        return [self.registers.get(register, 0) for register in range(address, address + count)]
+
+    def setValues(self, func_code, address, values):
+        for offset, value in enumerate(values):
+            self.registers[address + offset] = value
+        return None
+
+
+def make_context(units):
+    """Контекст сервера из словаря unit_id -> SimulatedDevice"""
+    return ModbusServerContext(devices=units, single=False)
+
+
+async def serve(units, host="127.0.0.1", port=5020, framer=FramerType.SOCKET):
+    """Запускает TCP-сервер имитатора и работает до отмены задачи"""
+    server = ModbusTcpServer(make_context(units), framer=framer, address=(host, port))
+    try:
+        await server.serve_forever()
+    finally:
+        await server.shutdown()
+
+
+def run_process(register_map, host, port, delay, error_rate, change_rate, unit_ids=(1,), framer="socket"):
+    """Точка входа для запуска имитатора в отдельном процессе"""
+    units = {unit_id: SimulatedDevice(register_map, delay, error_rate, change_rate, seed=unit_id)
+             for unit_id in unit_ids}
+    framer = FramerType.RTU if framer == "rtu" else FramerType.SOCKET
+    try:
+        asyncio.run(serve(units, host, port, framer))
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Имитатор прибора Modbus")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5020)
+    parser.add_argument("--map", help="JSON-файл с картой регистров {адрес: значение}")
+    parser.add_argument("--units", default="1", help="Unit ID через запятую")
+    parser.add_argument("--delay", type=float, default=0.0, help="Задержка ответа, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов с ошибкой")
+    parser.add_argument("--change-rate", type=float, default=0.0, help="Доля чтений, меняющих бит")
+    parser.add_argument("--framer", choices=["socket", "rtu"], default="socket",
+                        help="socket - Modbus TCP, rtu - RTU поверх TCP")
+    args = parser.parse_args(argv)
+
+    register_map = {}
+    if args.map:
+        with open(args.map, "r", encoding="utf-8") as f:
+            register_map = {int(address): int(value, 0) if isinstance(value, str) else value
+                            for address, value in json.load(f).items()}
+
+    unit_ids = [int(unit_id) for unit_id in args.units.split(",")]
+    print(f"Имитатор: {args.host}:{args.port}, unit {unit_ids}, регистров в карте: {len(register_map)}")
+    run_process(register_map, args.host, args.port, args.delay, args.error_rate,
+                args.change_rate, unit_ids, args.framer)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Неизменяемые снимки состояния чек-листа для веб-потоков.
+
+Поток опроса меняет только свой рабочий буфер строк (ChecklistIndex) и раз
+в цикл собирает из него новый снимок: кортеж строк, разбивку по секциям и
+статистику. Публикация - одно присваивание ссылки, поэтому обработчик
+запроса берёт текущий снимок одним чтением и работает с согласованными
+данными без блокировок и копирования. Строки, которые не менялись, новый
+снимок разделяет с предыдущим.
+
+Кроме строк чек-листа снимок несёт состояние каждой точки (PointState):
+сырое значение, декодированные состояния, время последнего изменения и
+исправность (health.py).
+Версия снимка меняется при любом изменении сырых значений, поэтому по ней
+строятся ETag ответов API.
+"""
+
+from collections import namedtuple
+
+# Строка чек-листа; изменение строки - замена через _replace()
+ChecklistRow = namedtuple('ChecklistRow', 'id section state expected actual result key mask')
+# Секция страницы: заголовок и её строки
+Section = namedtuple('Section', 'name rows')
+# Состояние точки: raw равно None, пока точку не прочитали; health - healthy / suspect / quarantined
+PointState = namedtuple('PointState', 'key address type section raw states changed health')
+
+
+class Snapshot:
+    """Согласованное состояние чек-листа на момент публикации"""
+
+    __slots__ = ('version', 'time', 'updated', 'rows', 'sections', 'points',
+                 'total_states', 'active_states', 'inactive_states', 'cache')
+
+    def __init__(self, version, time, rows, active_states, sections=None, points=(), updated=None):
+        self.version = version
+        self.time = time
+        # Время публикации версии; time обновляется каждый цикл, updated - только при изменениях
+        self.updated = time if updated is None else updated
+        self.rows = tuple(rows)
+        self.points = tuple(points)
+        self.sections = sections if sections is not None else self._group(self.rows)
+        self.total_states = len(self.rows)
+        self.active_states = active_states
+        self.inactive_states = self.total_states - active_states
+        # Ответы, уже построенные по этому снимку (заполняют веб-потоки)
+        self.cache = {}
+
+    @staticmethod
+    def _group(rows):
+        """Секции в порядке первого появления строк"""
+        sections = {}
+        for row in rows:
+            sections.setdefault(row.section, []).append(row)
+        return tuple(Section(name, tuple(section_rows)) for name, section_rows in sections.items())
+
+    def retimed(self, time):
+        """Тот же снимок с новым временем опроса (строки и секции общие)"""
+        retimed = Snapshot(self.version, time, self.rows, self.active_states, self.sections,
+                           self.points, self.updated)
+        retimed.cache = self.cache
+        return retimed
+
+    def __repr__(self):
+        return (f"Snapshot(version={self.version}, time={self.time!r}, "
+                f"rows={self.total_states}, active={self.active_states})")
+
+
+class PointBuffer:
+    """Рабочий буфер состояний точек потока опроса"""
+
+    def __init__(self, points, decoders):
+        # points - PointState в порядке вывода, decoders - ключ -> CompiledDecoder
+        self.points = list(points)
+        self.decoders = decoders
+        self.index = {point.key: position for position, point in enumerate(self.points)}
+
+    def update(self, values, changed_at, health=None):
+        """Учитывает прочитанные значения и исправность точек (ключ -> состояние).
+
+        Возвращает True, если какое-то значение или состояние изменилось.
+        """
+        changed = False
+        for key, state in (health or {}).items():
+            position = self.index.get(key)
+            if position is not None and self.points[position].health != state:
+                self.points[position] = self.points[position]._replace(health=state)
+                changed = True
+        for key, raw in values.items():
+            position = self.index.get(key)
+            if position is None or raw is None:
+                continue
+            point = self.points[position]
+            if point.raw == raw:
+                continue
+            self.points[position] = point._replace(raw=raw, states=self.decoders[key][raw], changed=changed_at)
+            changed = True
+        return changed
+
+
+def health_counts(points):
+    """Число точек в каждом состоянии исправности"""
+    counts = {}
+    for point in points:
+        counts[point.health] = counts.get(point.health, 0) + 1
+    return counts
+
+
+EMPTY = Snapshot(0, "", (), 0)
@@ -0,0 +1,296 @@
+"""Накопленное покрытие состояний точек за сессию пусконаладки.
+
+Для каждой точки хранятся её состояния (маски строк чек-листа) и для
+каждого состояния - увидено ли оно и время первого и последнего
+появления. Кратковременный "Пожар" или "Вскрытие" остаётся отмеченным в
+чек-листе, даже если состояние уже снято. Состояние с маской mask
+считается увиденным, когда в прочитанном значении стоят все его биты
+(value & mask == mask), состояние с маской 0x00 (норма) - при значении 0;
+нет ответа и 0xffff (нет связи) не отмечают ничего. Многобитовые маски
+профилей (profiles.py) поэтому не отмечаются частично совпавшим значением,
+а счётчики считают строки, а не биты.
+
+Увиденные состояния точки - битовая маска по номерам её состояний. Пишет
+только поток опроса; веб-потоки получают копию через snapshot() - запись
+и копирование идут под блокировкой, поэтому перестройка таблицы точек
+не даёт веб-потоку несогласованных массивов. Покрытие сохраняется в файл
+(раз в SAVE_INTERVAL секунд и при остановке) и восстанавливается при
+запуске: многодневная сессия переживает перезапуски. Новая сессия - сброс
+через API или удаление файла.
+
+    "coverage_file": "history/coverage.r3v"     # по умолчанию - в history_dir; "" - не сохранять
+
+Формат файла (little-endian): заголовок - сигнатура b'R3CV', версия
+(uint16), число точек (uint32); точка - длина ключа (uint16), число
+увиденных состояний (uint16), ключ в UTF-8; состояние - маска (uint16),
+времена первого и последнего появления (double).
+"""
+
+import logging
+import os
+import struct
+import threading
+import time
+from array import array
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+NO_LINK = 0xffff
+
+MAGIC = b'R3CV'
+VERSION = 2
+HEADER = struct.Struct('<4sHI')
+POINT = struct.Struct('<HH')
+STATE = struct.Struct('<Hdd')
+SAVE_INTERVAL = 10.0
+
+
+def coverage_path(cfg):
+    """Файл покрытия по конфигу или None, если сохранение отключено"""
+    path = cfg.get("coverage_file")
+    if path is None:
+        path = os.path.join(cfg.get("history_dir", "history"), "coverage.r3v")
+    return path or None
+
+
+def state_matches(raw, mask):
+    """Отмечает ли прочитанное значение raw состояние с маской mask"""
+    if raw is None or raw == NO_LINK:
+        return False
+    return raw & mask == mask if mask else raw == 0
+
+
+def _time(ts):
+    return datetime.fromtimestamp(ts).isoformat(timespec='milliseconds')
+
+
+class CoverageView:
+    """Копия покрытия для веб-потоков: не меняется после snapshot()"""
+
+    def __init__(self, keys, index, states, seen, first, last):
+        self.keys = keys
+        self.index = index
+        self.states = states
+        self.seen = seen
+        self.first = first
+        self.last = last
+
+    def active_count(self):
+        """Число увиденных состояний (строк чек-листа)"""
+        return sum(seen.bit_count() for seen in self.seen)
+
+    def total_count(self):
+        return sum(len(states) for states in self.states)
+
+    def record(self, key):
+        """Покрытие точки для JSON: увиденные состояния и их времена"""
+        slot = self.index.get(key)
+        if slot is None:
+            return None
+        seen = self.seen[slot]
+        first = self.first[slot]
+        last = self.last[slot]
+        states = []
+        union = 0
+        for number, mask in enumerate(self.states[slot]):
+            if seen >> number & 1:
+                union |= mask
+                states.append({'mask': mask, 'first': _time(first[number]), 'last': _time(last[number])})
+        return {'key': key, 'seen': f"0x{union:04x}",
+                'normal': any(not state['mask'] for state in states), 'states': states}
+
+
+class CoverageTracker(CoverageView):
+    """Покрытие по состояниям точек; пишет только поток опроса"""
+
+    def __init__(self, path=None, clock=time.time):
+        super().__init__([], {}, [], [], [], [])
+        self.path = path
+        self.clock = clock
+        self.lock = threading.Lock()
+        # Последнее значение точки и отмеченные им состояния: повторное чтение без перебора масок
+        self.matched = []
+        # Покрытие точек и состояний, которых нет в текущей таблице: ключ -> {маска: (первое, последнее)}
+        self.detached = {}
+        self.dirty = False
+        self.saved = clock()
+        # Сброс, запрошенный веб-потоком; выполняет поток опроса
+        self.reset_requested = False
+        if path and os.path.exists(path):
+            self._load()
+
+    def _records(self):
+        """Покрытие всех известных точек: ключ -> {маска: (первое, последнее)}"""
+        records = {key: dict(states) for key, states in self.detached.items()}
+        for slot, key in enumerate(self.keys):
+            seen = self.seen[slot]
+            for number, mask in enumerate(self.states[slot]):
+                if seen >> number & 1:
+                    records.setdefault(key, {})[mask] = (self.first[slot][number], self.last[slot][number])
+        return records
+
+    def configure(self, wanted):
+        """Точки чек-листа: ключ -> маски его строк по порядку; покрытие прежних точек сохраняется"""
+        records = self._records()
+        keys = list(wanted)
+        states = [tuple(wanted[key]) for key in keys]
+        seen = [0] * len(keys)
+        first = [array('d', bytes(8 * len(masks))) for masks in states]
+        last = [array('d', bytes(8 * len(masks))) for masks in states]
+        for slot, key in enumerate(keys):
+            record = records.get(key)
+            if not record:
+                continue
+            for number, mask in enumerate(states[slot]):
+                times = record.pop(mask, None)
+                if times is not None:
+                    seen[slot] |= 1 << number
+                    first[slot][number], last[slot][number] = times
+            if not record:
+                del records[key]
+        with self.lock:
+            self.keys = keys
+            self.index = {key: slot for slot, key in enumerate(keys)}
+            self.states = states
+            self.seen = seen
+            self.first = first
+            self.last = last
+            self.matched = [(None, 0)] * len(keys)
+            self.detached = records
+
+    def matches(self, key, raw):
+        """Номера состояний точки (битовая маска), которые отмечает значение raw"""
+        slot = self.index.get(key)
+        if slot is None:
+            return 0
+        return self._matches(slot, raw)
+
+    def _matches(self, slot, raw):
+        last_raw, bits = self.matched[slot]
+        if raw != last_raw:
+            bits = 0
+            for number, mask in enumerate(self.states[slot]):
+                if state_matches(raw, mask):
+                    bits |= 1 << number
+            self.matched[slot] = (raw, bits)
+        return bits
+
+    def _mark(self, slot, bits, now):
+        first = self.first[slot]
+        last = self.last[slot]
+        while bits:
+            low = bits & -bits
+            number = low.bit_length() - 1
+            if not first[number]:
+                first[number] = now
+            last[number] = now
+            bits ^= low
+
+    def observe(self, key, raw, now=None):
+        """Учитывает прочитанное значение, возвращает впервые увиденные состояния"""
+        slot = self.index.get(key)
+        if slot is None:
+            return 0
+        bits = self._matches(slot, raw)
+        if not bits:
+            return 0
+        with self.lock:
+            self._mark(slot, bits, self.clock() if now is None else now)
+            new = bits & ~self.seen[slot]
+            if new:
+                self.seen[slot] |= new
+        self.dirty = True
+        return new
+
+    def merge(self, key, seen, now=None):
+        """Добавляет увиденные состояния, накопленные другим процессом; возвращает новые"""
+        slot = self.index.get(key)
+        if slot is None:
+            return 0
+        new = seen & ~self.seen[slot] & ((1 << len(self.states[slot])) - 1)
+        if new:
+            with self.lock:
+                self._mark(slot, new, self.clock() if now is None else now)
+                self.seen[slot] |= new
+        return new
+
+    def mask(self, key):
+        """Увиденные состояния точки: битовая маска по номерам состояний"""
+        slot = self.index.get(key)
+        return self.seen[slot] if slot is not None else 0
+
+    def masks(self):
+        """Увиденные состояния всех точек: ключ -> маска"""
+        return dict(zip(self.keys, self.seen))
+
+    def snapshot(self):
+        """Согласованная копия для веб-потока"""
+        with self.lock:
+            return CoverageView(list(self.keys), dict(self.index), list(self.states), list(self.seen),
+                                [array('d', times) for times in self.first],
+                                [array('d', times) for times in self.last])
+
+    def reset(self):
+        """Новая сессия: всё покрытие, включая отсутствующие в таблице точки, обнуляется"""
+        wanted = dict(zip(self.keys, self.states))
+        with self.lock:
+            self.keys = []
+            self.detached = {}
+        self.configure(wanted)
+        self.reset_requested = False
+        self.dirty = True
+        self.save()
+
+    # --- файл ---
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            magic, version, count = HEADER.unpack_from(data, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("неизвестный формат")
+            offset = HEADER.size
+            records = {}
+            for _ in range(count):
+                length, states = POINT.unpack_from(data, offset)
+                offset += POINT.size
+                key = data[offset:offset + length].decode('utf-8')
+                offset += length
+                record = records[key] = {}
+                for _ in range(states):
+                    mask, first, last = STATE.unpack_from(data, offset)
+                    offset += STATE.size
+                    record[mask] = (first, last)
+        except (OSError, ValueError, struct.error) as e:
+            log.error("❌ Покрытие %s не загружено, начата новая сессия: %s", self.path, e)
+            return
+        self.detached = records
+        log.info("📋 Покрытие восстановлено: %d точек из %s", len(records), self.path)
+
+    def save(self):
+        """Записывает покрытие атомарно (временный файл и замена)"""
+        if not self.path:
+            return
+        records = self._records()
+        parts = [HEADER.pack(MAGIC, VERSION, len(records))]
+        for key, states in records.items():
+            encoded = key.encode('utf-8')
+            parts.append(POINT.pack(len(encoded), len(states)) + encoded)
+            parts.extend(STATE.pack(mask, first, last) for mask, (first, last) in states.items())
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = self.path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(b''.join(parts))
+        os.replace(temporary, self.path)
+        self.dirty = False
+        self.saved = self.clock()
+
+    def maybe_save(self, now=None):
+        """Сохраняет изменённое покрытие не чаще раза в SAVE_INTERVAL"""
+        now = self.clock() if now is None else now
+        if self.dirty and now - self.saved >= SAVE_INTERVAL:
+            self.save()
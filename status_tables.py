@@ -0,0 +1,169 @@
+"""Скомпилированные таблицы декодирования статусов.
+
+Регистр статуса 16-битный, поэтому для каждого класса устройств один раз
+строится неизменяемая таблица на 65536 значений: декодирование сводится к
+обращению по индексу без выделения памяти. Одинаковые наборы состояний
+хранятся одним общим кортежем.
+
+StatusDecoder - маски состояний и таблицы из профилей приборов
+(profiles.py): профиль по умолчанию и профили отдельных точек.
+"""
+
+from point_table import DECODERS, TYPES, point_type
+from profiles import NO_LINK, NO_LINK_TEXT, ProfileLibrary, build_table
+
+
+class CompiledDecoder:
+    """Таблица значение регистра -> кортеж активных состояний для одного набора масок"""
+
+    def __init__(self, masks, fields=(), table=None):
+        # Маска 0x00 никогда не даёт (value & mask), поэтому в таблицу не входит
+        self.masks = tuple((mask, description) for mask, description in masks.items() if mask)
+        self.labels = tuple(description for _, description in self.masks) + (NO_LINK_TEXT,)
+        # table - (наборы состояний, индексы), готовые из кэша профиля
+        self.combos, self.index = table or build_table(self.masks, fields)
+
+    def __getitem__(self, value):
+        return self.combos[self.index[value]]
+
+    def decode_many(self, values):
+        """Матрица активных битов для массива сырых слов.
+
+        Столбцы соответствуют self.labels (последний - нет связи). Для
+        numpy-массивов возвращается bool-матрица numpy, иначе список кортежей.
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+
+        if np is None:
+            rows = {}
+            for value in set(values):
+                active = self[value]
+                rows[value] = tuple(label in active for label in self.labels)
+            return [rows[value] for value in values]
+
+        words = np.asarray(values, dtype=np.uint16)
+        masks = np.array([mask for mask, _ in self.masks], dtype=np.uint16)
+        no_link = words == NO_LINK
+        matrix = (words[:, None] & masks[None, :]) != 0
+        matrix[no_link] = False
+        return np.column_stack([matrix, no_link])
+
+
+class StatusDecoder:
+    """Маски состояний приборов по профилям, скомпилированные таблицы и чек-лист по конфигу"""
+
+    def __init__(self, profile=None, library=None):
+        self.library = library or ProfileLibrary()
+        self.profile = self.library.get(profile)
+        # Декодеры других профилей: имя -> StatusDecoder
+        self.variants = {self.profile.name: self}
+
+        # Таблицы декодирования строятся (или загружаются из кэша) один раз на профиль
+        self.compiled = {}
+        for kind, ptype in self.profile.types.items():
+            name = DECODERS[kind]
+            setattr(self, 'status_masks_' + name, ptype.states)
+            self.compiled[name] = CompiledDecoder(ptype.states, table=(ptype.combos, ptype.index))
+
+        # Обратное соответствие название -> код
+        self.state_to_code = {}
+        self._build_reverse_mapping()
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Декодер профиля объекта ("profile", "profiles_dir", "profile_cache")"""
+        return cls(library=ProfileLibrary.from_config(cfg))
+
+    def _build_reverse_mapping(self):
+        """Строит обратное соответствие название состояния -> код"""
+        for ptype in self.profile.types.values():
+            for code, name in ptype.states.items():
+                self.state_to_code[name] = hex(code)
+
+    def for_profile(self, profile=None):
+        """Декодер профиля profile (None - профиль этого декодера)"""
+        if not profile:
+            return self
+        decoder = self.variants.get(profile)
+        if decoder is None:
+            decoder = self.variants[profile] = StatusDecoder(profile, self.library)
+        return decoder
+
+    def type(self, kind, profile=None):
+        """Описание типа точки в профиле (profiles.ProfileType)"""
+        return self.for_profile(profile).profile.type(kind)
+
+    def table(self, kind, profile=None):
+        """Скомпилированная таблица для типа точки"""
+        decoder = self.for_profile(profile)
+        decoder.profile.type(kind)
+        return decoder.compiled[DECODERS[kind]]
+
+    def masks(self, kind, profile=None):
+        """Маски состояний типа точки: маска -> название"""
+        return self.type(kind, profile).states
+
+    def role_map(self, role, addresses, types=None, profiles=None):
+        """Адреса регистров роли role (например, "command") для точек, в профиле которых она есть"""
+        profiles = profiles or {}
+        result = {}
+        for key, address in addresses.items():
+            if not address or not str(address).strip():
+                continue
+            ptype = self.type(point_type(key, types.get(key) if types else None), profiles.get(key))
+            register = ptype.register(role, int(address))
+            if register is not None:
+                result[key] = register
+        return result
+
+    def _keys_of_type(self, addresses, name, types):
+        """Ключи точек типа name: по явному типу из таблицы точек или по подстроке ключа"""
+        return [key for key in addresses.keys()
+                if addresses[key] and str(addresses[key]).strip()
+                and (types[key] == name if types and key in types else name in key)]
+
+    def create_checklist_from_config(self, addresses, types=None, profiles=None):
+        """Создает чек-лист на основе конфигурации; profiles - ключ -> профиль точки"""
+        checklist = []
+        profiles = profiles or {}
+        # Приборы, исполнительные устройства, охранные и пожарные зоны
+        for kind in TYPES[:-1]:
+            for key in self._keys_of_type(addresses, kind, types):
+                ptype = self.type(kind, profiles.get(key))
+                section_name = f'{ptype.section} "{key}"'
+                for code, description in ptype.states.items():
+                    checklist.append((section_name, description, hex(code), key, code))
+        return checklist
+
+    def hex_int(self, status_value):
+        if isinstance(status_value, str):
+            if status_value.startswith('0x'):
+                status_value = int(status_value, 16)
+            else:
+                status_value = int(status_value)
+        return status_value
+
+    def decode(self, kind, status_value, profile=None):
+        """Активные состояния точки типа kind по значению регистра статуса"""
+        return self.table(kind, profile)[self.hex_int(status_value)]
+
+    def decode_many(self, kind, values, profile=None):
+        """Декодирует массив сырых слов (numpy или array('H')) точек типа kind за один проход"""
+        return self.table(kind, profile).decode_many(values)
+
+
+def describe_point(decoder, key, address, code, kind=None, profile=None):
+    """Строка вывода для точки: тип, ключ, адрес, декодированные состояния и числовые поля"""
+    kind = point_type(key, kind)
+    ptype = decoder.type(kind, profile)
+    codes = decoder.decode(kind, code, profile) if code is not None else None
+    line = f"{ptype.label} ({key} - {address}): {codes}"
+    values = ptype.values({"status": code}) if code is not None else None
+    if values:
+        units = {field.name: field.unit for field in ptype.fields}
+        line += " " + ", ".join(f"{name}: {value:g}{units[name] and ' ' + units[name]}"
+                                for name, value in values.items())
+    return line
@@ -0,0 +1,66 @@
+import asyncio
+
+import async_poller
+from async_poller import PortPoller, port_configs
+
+
+class Result:
+    def __init__(self, registers):
+        self.registers = registers
+
+    def isError(self):
+        return False
+
+
+class FakeClient:
+    def __init__(self, connects):
+        self.connects = connects
+        self.closed = 0
+
+    async def connect(self):
+        return self.connects.pop(0)
+
+    async def read_holding_registers(self, address, count=1, device_id=1):
+        return Result([address & 0xff] * count)
+
+    def close(self):
+        self.closed += 1
+
+
+def test_table_ports_keep_port_settings():
+    cfg = {
+        "baudrate": 9600,
+        "points": [{"key": "device_1", "address": 100, "unit": 2, "port": "COM4"},
+                   {"key": "device_2", "address": 101, "unit": 1, "port": "COM3"}],
+        "ports": [{"com_port": "COM4", "baudrate": 19200, "transport": {"type": "tcp", "host": "gw"}}],
+    }
+    ports = {port["com_port"]: port for port in port_configs(cfg)}
+    assert ports["COM4"]["baudrate"] == 19200
+    assert ports["COM4"]["transport"] == {"type": "tcp", "host": "gw"}
+    assert ports["COM4"]["units"] == [(2, {"device_1": "100"})]
+    assert ports["COM3"]["baudrate"] == 9600
+
+
+def test_reconnects_and_survives_failing_callback(monkeypatch):
+    monkeypatch.setattr(async_poller, "RECONNECT_DELAY", 0)
+    clients = [FakeClient([False]), FakeClient([True])]
+    received = []
+
+    def on_values(port, unit_id, values):
+        received.append(values)
+        if len(received) == 1:
+            raise RuntimeError("обработчик упал")
+
+    port = {"com_port": "COM3", "baudrate": 9600, "max_gap": 0, "transport": None,
+            "units": [(1, {"device_1": "100"})]}
+    poller = PortPoller(port, on_values, interval=0.01)
+    monkeypatch.setattr(poller, "_make_client", lambda: clients.pop(0))
+
+    async def main():
+        task = asyncio.create_task(poller.run())
+        while len(received) < 3:
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(asyncio.wait_for(main(), 5))
+    assert received[-1] == {"device_1": 100}
@@ -0,0 +1,149 @@
+import pytest
+
+from commands import CONFIRMED, FAILED, QUEUED, TIMEOUT, CommandClient
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Result:
+    def __init__(self, registers=None, error=False):
+        self.registers = registers or []
+        self.error = error
+
+    def isError(self):
+        return self.error
+
+
+class FakeClient:
+    """Прибор с одним регистром состояния; запись сразу меняет состояние на state_after"""
+
+    def __init__(self, state=0, state_after=None):
+        self.state = state
+        self.state_after = state_after
+        self.writes = []
+
+    def write_register(self, address, value, device_id=1):
+        self.writes.append((address, value, device_id))
+        if self.state_after is not None:
+            self.state = self.state_after
+        return Result()
+
+    def read_holding_registers(self, address, count=1, device_id=1):
+        return Result([self.state])
+
+
+ACTIONS = {"open": {"value": 1, "mask": 0x0400, "expect": 0x0400}}
+
+
+def make(client, **kwargs):
+    clock = Clock()
+    commands = CommandClient(client, ACTIONS, {"actuator_1": 42600}, confirm_timeout=1.0,
+                             check_interval=0.1, clock=clock, **kwargs)
+    commands.configure({"actuator_1": 102, "device_1": 100}, {"actuator_1": 3})
+    return commands, clock
+
+
+def test_confirm():
+    client = FakeClient(state_after=0x0401)
+    commands, clock = make(client)
+    command = commands.submit("actuator_1", "open")
+    assert command.state == QUEUED
+
+    clock.now = 0.05
+    commands.serve()
+    assert client.writes == [(42600, 1, 3)]
+    clock.now = 0.2
+    commands.serve()
+    assert command.state == CONFIRMED
+    assert command.raw == 0x0401
+    assert command.wait(0)
+    assert commands.totals[CONFIRMED] == 1
+    assert not commands.sent
+
+
+def test_timeout():
+    client = FakeClient(state=0)
+    commands, clock = make(client)
+    command = commands.submit("device_1", value=5, expect=5)
+    commands.serve()
+    for step in range(1, 12):
+        clock.now = step * 0.1
+        commands.serve()
+    assert command.state == TIMEOUT
+    assert "0x0000" in command.error
+    assert not commands.sent
+
+
+def test_expect_without_mask_compares_whole_register():
+    client = FakeClient(state_after=0x0105)
+    commands, clock = make(client)
+    command = commands.submit("device_1", value=5, expect=5)
+    assert (command.mask, command.expect) == (0xffff, 5)
+    commands.serve()
+    clock.now = 0.1
+    commands.serve()
+    assert command.state != CONFIRMED
+
+    command = commands.submit("device_1", value=5, mask="4")
+    assert (command.mask, command.expect) == (4, 4)
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"key": "nope", "value": 1},
+    {"key": "device_1"},
+    {"key": "device_1", "action": "nope"},
+    {"key": "device_1", "value": "abc"},
+    {"key": "device_1", "value": 0x10000},
+    {"key": "device_1", "value": 1, "mask": -1},
+    {"key": "device_1", "value": 1, "mask": [1]},
+    {"key": "device_1", "value": 1, "expect": "x"},
+    {"key": "device_1", "value": 1, "mask": 1, "expect": 2},
+    {"key": "device_1", "value": 1, "priority": "high"},
+])
+def test_invalid_input(kwargs):
+    commands, _ = make(FakeClient())
+    with pytest.raises(ValueError):
+        commands.submit(**kwargs)
+    assert not commands.queue
+    assert not commands.commands()
+
+
+def test_failing_command_does_not_wedge_the_loop():
+    class BrokenClient(FakeClient):
+        def read_holding_registers(self, address, count=1, device_id=1):
+            return Result(["not a number"])
+
+    commands, clock = make(BrokenClient())
+    command = commands.submit("actuator_1", "open")
+    commands.serve()
+    clock.now = 0.1
+    commands.serve()
+    assert command.state == FAILED
+    assert not commands.sent
+    commands.serve()
+
+
+def test_writes_only_from_local_host_by_default():
+    commands, _ = make(FakeClient())
+    assert commands.allows("127.0.0.1")
+    assert commands.allows("::1")
+    assert not commands.allows("10.0.5.7")
+    assert not commands.allows(None)
+
+
+def test_token_and_allowed_hosts():
+    commands = CommandClient(FakeClient(), token="secret")
+    assert commands.allows("10.0.5.7", "secret")
+    assert not commands.allows("10.0.5.7", "wrong")
+    assert not commands.allows("127.0.0.1")
+
+    commands = CommandClient(FakeClient(), token="secret", allowed_hosts=["10.0.5.0/24"])
+    assert commands.allows("10.0.5.7", "secret")
+    assert not commands.allows("10.0.6.7", "secret")
+    assert not commands.allows("10.0.5.7")
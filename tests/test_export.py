@@ -0,0 +1,19 @@
+from export import first_detected
+from history import HistoryStore
+from snapshot import ChecklistRow
+
+
+def row(row_id, key, mask):
+    return ChecklistRow(row_id, "Прибор", f"state {mask}", hex(mask), '', '❌', key, mask)
+
+
+def test_first_detected_matches_checklist_rule(tmp_path):
+    history = HistoryStore(str(tmp_path))
+    for ts, value in ((100.0, 0x0001), (101.0, 0x0100), (102.0, 0xffff), (103.0, 0), (104.0, 0x0301)):
+        history.append("device_1", value, ts=ts)
+
+    rows = [row(0, "device_1", 0), row(1, "device_1", 0x0001), row(2, "device_1", 0x0300),
+            row(3, "device_1", 0x0004)]
+    detected = first_detected(HistoryStore(str(tmp_path)), rows, 0, 200.0)
+    # Норма видна по нулю, многобитовая маска - только когда стоят все её биты
+    assert detected == {0: 103.0, 1: 100.0, 2: 104.0}
@@ -0,0 +1,86 @@
+import os
+
+from history import HEADER, INDEX_ENTRY, INDEX_STRIDE, RECORD, HistoryStore
+
+
+def test_round_trip(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    assert store.append("fire_zone_1", 0, ts=1000.0)
+    assert not store.append("fire_zone_1", 0, ts=1001.0)
+    assert store.append("fire_zone_1", 0x80, ts=1002.5)
+    assert store.append("fire_zone_1", 0, ts=1004.0)
+
+    reader = HistoryStore(str(tmp_path))
+    assert reader.value_at("fire_zone_1", 999.0) is None
+    assert reader.value_at("fire_zone_1", 1003.0) == 0x80
+    assert reader.changes("fire_zone_1", 1000.0, 1004.0) == [(1000.0, 0), (1002.5, 0x80), (1004.0, 0)]
+
+
+def test_segments_rotate_and_index(tmp_path):
+    store = HistoryStore(str(tmp_path), segment_records=INDEX_STRIDE * 2 + 10)
+    for number in range(INDEX_STRIDE * 5):
+        store.append("device_1", number % 2, ts=2000.0 + number)
+
+    reader = HistoryStore(str(tmp_path))
+    assert len(reader._segment_paths("device_1")) == 3
+    assert reader.value_at("device_1", 2000.0 + 777) == 777 % 2
+    assert len(reader.changes("device_1", 0, 1e10)) == INDEX_STRIDE * 5
+
+
+def test_resume_after_partial_record(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    for number in range(INDEX_STRIDE + 3):
+        store.append("actuator_1", number, ts=3000.0 + number)
+    path = store.segments["actuator_1"].path
+    store.segments["actuator_1"].close()
+    # Аварийная остановка посреди записи: в конце файла половина записи, индекс потерян
+    with open(path, 'ab') as f:
+        f.write(RECORD.pack(999999, 7)[:3])
+    os.remove(path[:-4] + '.idx')
+
+    resumed = HistoryStore(str(tmp_path))
+    assert resumed.append("actuator_1", 5000, ts=4000.0)
+    assert resumed.append("actuator_1", 5001, ts=4001.0)
+    resumed.segments["actuator_1"].close()
+
+    count = INDEX_STRIDE + 5
+    assert os.path.getsize(path) == HEADER.size + count * RECORD.size
+    assert os.path.getsize(path[:-4] + '.idx') == 2 * INDEX_ENTRY.size
+    reader = HistoryStore(str(tmp_path))
+    assert reader.value_at("actuator_1", 3000.0 + INDEX_STRIDE + 2) == INDEX_STRIDE + 2
+    assert reader.changes("actuator_1", 3999.0, 4001.0) == [(4000.0, 5000), (4001.0, 5001)]
+
+
+def test_resume_keeps_last_value(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    store.append("fire_zone_1", 0x80, ts=1000.0)
+    store.segments["fire_zone_1"].close()
+
+    resumed = HistoryStore(str(tmp_path))
+    assert not resumed.append("fire_zone_1", 0x80, ts=1001.0)
+    assert resumed.append("fire_zone_1", 0, ts=1002.0)
+
+
+def test_new_segment_does_not_overwrite_same_millisecond(tmp_path):
+    store = HistoryStore(str(tmp_path), segment_records=1)
+    store.append("device_1", 1, ts=5000.0)
+    store.append("device_1", 2, ts=5000.0)
+    store.append("device_1", 3, ts=5000.0)
+
+    reader = HistoryStore(str(tmp_path))
+    assert len(reader._segment_paths("device_1")) == 3
+    assert [value for _, value in reader.changes("device_1", 0, 1e10)] == [1, 2, 3]
+
+
+def test_clock_stepping_back_keeps_order(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    store.append("device_1", 1, ts=5000.0)
+    store.append("device_1", 2, ts=5001.0)
+    # Часы перевели на час назад, затем перезапуск
+    store.append("device_1", 3, ts=1400.0)
+    HistoryStore(str(tmp_path)).append("device_1", 4, ts=1401.0)
+
+    reader = HistoryStore(str(tmp_path))
+    assert len(reader._segment_paths("device_1")) == 1
+    assert reader.changes("device_1", 0, 1e10) == [(5000.0, 1), (5001.0, 2), (5001.0, 3), (5001.0, 4)]
+    assert reader.value_at("device_1", 6000.0) == 4
@@ -0,0 +1,28 @@
+import pytest
+
+from profiles import NO_LINK, NO_LINK_TEXT, ProfileError, _fields, _status_enums, build_table, validate_profile
+
+
+def profile(states, fields):
+    return {"profile": "test", "types": {"device": {"states": states, "fields": fields}}}
+
+
+@pytest.mark.parametrize("states, fields", [
+    ({"0x01": "A"}, [{"name": "Mode", "enum": {"0": "Off", "1": "On"}}]),
+    ({"0x8000": "A"}, [{"name": "Mode", "bits": "0x7fff", "enum": {"0": "Off"}}]),
+    ({hex(1 << bit): f"bit {bit}" for bit in range(16)}, []),
+])
+def test_too_many_combinations_rejected(states, fields):
+    with pytest.raises(ProfileError, match="наборов состояний"):
+        validate_profile(profile(states, fields))
+
+
+def test_enum_field_in_table():
+    spec = validate_profile(profile({"0x0001": "Пожар"},
+                                    [{"name": "Mode", "bits": "0x0300", "enum": {"0": "Off", "1": "On"}}]))
+    kind = spec["types"]["device"]
+    combos, index = build_table([(mask, label) for mask, label in kind["states"] if mask],
+                                _status_enums(_fields(kind)))
+    assert combos[index[0x0101]] == ("Пожар", "Mode: On")
+    assert combos[index[0x0300]] == ("Mode: 3",)
+    assert combos[index[NO_LINK]] == (NO_LINK_TEXT,)
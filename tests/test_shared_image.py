@@ -0,0 +1,91 @@
+import pytest
+
+import shared_image
+from shared_image import SharedImageReader, SharedImageWriter
+
+
+@pytest.fixture
+def image():
+    writer = SharedImageWriter(8, text_capacity=256)
+    reader = SharedImageReader(writer.name)
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def test_round_trip(image):
+    writer, reader = image
+    assert writer.configure([("device_1", 100, "device"), ("fire_zone_1", 101, "fire_zone", "zone")]) == 2
+    writer.write({"device_1": 0x0101, "fire_zone_1": None}, now=10.0, health={"device_1": 1}, coverage={"device_1": 5})
+
+    state = reader.read()
+    assert state.seq % 2 == 0
+    assert list(state.values) == [0x0101, 0]
+    assert list(state.read) == [10.0, 0.0]
+    assert list(state.changed) == [10.0, 0.0]
+    assert list(state.health) == [1, 0]
+    assert list(state.seen) == [5, 0]
+    assert state.updated == 10.0
+
+    writer.write({"device_1": 0x0101}, now=11.0)
+    state = reader.read()
+    assert (state.read[0], state.changed[0]) == (11.0, 10.0)
+
+
+def test_meta_and_text(image):
+    writer, reader = image
+    writer.configure([("device_1", 100, "device"), ("fire_zone_1", 101, "fire_zone", "zone")])
+    generation, meta = reader.meta()
+    assert generation == reader.read().generation
+    assert meta["keys"] == ["device_1", "fire_zone_1"]
+    assert meta["addresses"] == ["100", "101"]
+    assert meta["profiles"] == [None, "zone"]
+
+    writer.write_text("метрика 1\n")
+    assert reader.text() == "метрика 1\n"
+
+
+def test_reconfigure_resets_values(image):
+    writer, reader = image
+    writer.configure([("device_1", 100, "device")])
+    writer.write({"device_1": 7}, now=1.0)
+    generation = reader.read().generation
+    writer.configure([("actuator_1", 102, "actuator")])
+    state = reader.read()
+    assert state.generation == generation + 1
+    assert list(state.values) == [0]
+
+
+def test_reader_retries_while_writer_is_writing(image, monkeypatch):
+    writer, reader = image
+    writer.configure([("device_1", 100, "device")])
+    monkeypatch.setattr(shared_image, "READ_RETRIES", 5)
+
+    writer._begin()
+    # Запись не завершена - читатель не отдаёт половину, а сдаётся после повторов
+    with pytest.raises(TimeoutError):
+        reader.read()
+    writer._end(2.0)
+    assert reader.read().seq == writer.seq
+
+
+def test_reader_discards_torn_copy(image, monkeypatch):
+    writer, reader = image
+    writer.configure([("device_1", 100, "device")])
+    writer.write({"device_1": 1}, now=1.0)
+
+    # Писатель успевает записать во время копирования: первая копия отбрасывается
+    writes = []
+    original = shared_image.array
+
+    def array(typecode):
+        area = original(typecode)
+        if typecode == 'H' and not writes:
+            writes.append(True)
+            writer.write({"device_1": 2}, now=2.0)
+        return area
+
+    monkeypatch.setattr(shared_image, "array", array)
+    state = reader.read()
+    assert list(state.values) == [2]
+    assert state.updated == 2.0
@@ -0,0 +1,76 @@
+import threading
+
+from state_coverage import CoverageTracker, state_matches
+
+
+def test_state_matches():
+    assert state_matches(0, 0)
+    assert not state_matches(0x0001, 0)
+    assert state_matches(0x0301, 0x0300)
+    # Многобитовая маска: частичное совпадение не считается
+    assert not state_matches(0x0100, 0x0300)
+    assert not state_matches(None, 0)
+    assert not state_matches(0xffff, 0x0001)
+
+
+def test_counts_per_state():
+    tracker = CoverageTracker(clock=lambda: 1.0)
+    tracker.configure({"device_1": [0, 0x0001, 0x0300], "actuator_1": [0, 0x0002]})
+    assert tracker.total_count() == 5
+    assert tracker.observe("device_1", 0x0100) == 0
+    assert tracker.observe("device_1", 0x0301, now=2.0) == 0b110
+    assert tracker.observe("device_1", 0x0300) == 0
+    assert tracker.observe("actuator_1", 0, now=3.0) == 0b01
+    assert tracker.active_count() == 3
+
+    record = tracker.snapshot().record("device_1")
+    assert [state['mask'] for state in record['states']] == [0x0001, 0x0300]
+    assert record['seen'] == "0x0301"
+    assert not record['normal']
+
+
+def test_save_load_and_reconfigure(tmp_path):
+    path = str(tmp_path / "coverage.r3v")
+    tracker = CoverageTracker(path)
+    tracker.configure({"device_1": [0, 0x0001], "fire_zone_1": [0x0080]})
+    tracker.observe("device_1", 0x0001, now=10.0)
+    tracker.observe("fire_zone_1", 0x0080, now=11.0)
+    tracker.save()
+
+    restored = CoverageTracker(path)
+    # Порядок строк изменился, пожарной зоны в таблице нет - покрытие сохраняется по маскам
+    restored.configure({"device_1": [0x0001, 0]})
+    assert restored.mask("device_1") == 0b01
+    restored.configure({"device_1": [0x0001, 0], "fire_zone_1": [0x0080]})
+    assert restored.mask("fire_zone_1") == 0b1
+    assert restored.snapshot().record("fire_zone_1")['states'][0]['mask'] == 0x0080
+
+    restored.reset()
+    assert restored.active_count() == 0
+    assert CoverageTracker(path).detached == {}
+
+
+def test_snapshot_is_consistent_while_reconfiguring():
+    tracker = CoverageTracker()
+    tables = [{f"point_{number}": [0, 0x0001] for number in range(size)} for size in (1, 500)]
+    stop = threading.Event()
+    errors = []
+
+    def web():
+        while not stop.is_set():
+            view = tracker.snapshot()
+            try:
+                for key in view.keys:
+                    view.record(key)
+                assert view.active_count() <= view.total_count()
+            except Exception as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=web)
+    thread.start()
+    for number in range(200):
+        tracker.configure(tables[number % 2])
+        tracker.observe("point_0", 1)
+    stop.set()
+    thread.join()
+    assert not errors
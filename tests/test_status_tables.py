@@ -0,0 +1,27 @@
+from array import array
+
+import pytest
+
+from profiles import NO_LINK, ProfileError
+from status_tables import StatusDecoder
+
+
+@pytest.fixture(scope="module")
+def decoder():
+    return StatusDecoder()
+
+
+@pytest.mark.parametrize("kind", ["device", "actuator", "security_zone", "fire_zone", "unknown"])
+def test_decode_many_by_point_type(decoder, kind):
+    table = decoder.table(kind)
+    values = array('H', [0, 0x0001, 0x0300, NO_LINK, 0x0001])
+    rows = decoder.decode_many(kind, values)
+    assert len(rows) == len(values)
+    for value, row in zip(values, rows):
+        active = decoder.decode(kind, value)
+        assert tuple(label for label, hit in zip(table.labels, row) if hit) == active
+
+
+def test_decode_many_unknown_kind(decoder):
+    with pytest.raises(ProfileError):
+        decoder.decode_many("pump", [0])
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from transport import MBAP, ModbusFrameError, TcpConnection
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def gateway(reply):
+    """Шлюз, который на любой запрос отвечает байтами reply(запрос)"""
+    async def handle(reader, writer):
+        try:
+            while True:
+                header = await reader.readexactly(MBAP.size)
+                tid, _, length, unit = MBAP.unpack(header)
+                pdu = await reader.readexactly(length - 1)
+                writer.write(reply(tid, unit, pdu))
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_request_round_trip():
+    async def main():
+        server, port = await gateway(lambda tid, unit, pdu: MBAP.pack(tid, 0, 5, unit) + b'\x03\x02\x12\x34')
+        connection = TcpConnection('127.0.0.1', port)
+        await connection.connect()
+        assert await connection.request(1, b'\x03\x00\x64\x00\x01') == b'\x03\x02\x12\x34'
+        connection.close()
+        server.close()
+
+    run(main())
+
+
+@pytest.mark.parametrize("length, protocol", [(0, 0), (1, 0), (300, 0), (6, 7)])
+def test_bad_header_fails_pending_and_drops_connection(length, protocol):
+    async def main():
+        server, port = await gateway(lambda tid, unit, pdu: MBAP.pack(tid, protocol, length, unit))
+        connection = TcpConnection('127.0.0.1', port)
+        await connection.connect()
+        with pytest.raises(ModbusFrameError):
+            await connection.request(1, b'\x03\x00\x64\x00\x01')
+        await asyncio.sleep(0)
+        assert not connection.connected
+        assert not connection.pending
+        server.close()
+
+    run(main())
@@ -0,0 +1,25 @@
+from web_push import ChangeFeed
+
+
+def test_changes_since():
+    feed = ChangeFeed(history_size=2)
+    assert feed.changes_since(0) == (0, [], None)
+    feed.publish([{'id': 'a', 'value': 1}])
+    feed.publish([{'id': 'a', 'value': 2}, {'id': 'b', 'value': 1}], stats={'ok': 1})
+    assert feed.changes_since(0) == (2, [{'id': 'a', 'value': 2}, {'id': 'b', 'value': 1}], {'ok': 1})
+    assert feed.changes_since(2) == (2, [], None)
+
+    feed.publish([{'id': 'c', 'value': 1}])
+    # Отставший дальше истории клиент перезагружает страницу
+    assert feed.changes_since(0) == (3, None, None)
+
+
+def test_client_ahead_of_restarted_server_reloads():
+    feed = ChangeFeed()
+    feed.publish([{'id': 'a', 'value': 1}])
+    assert feed.changes_since(40) == (1, None, None)
+    assert feed.wait(40, timeout=0) == (1, None, None)
+
+    stream = feed.stream(40)
+    next(stream)
+    assert '"reload": true' in next(stream)
@@ -0,0 +1,367 @@
+"""Транспорт Modbus TCP и RTU поверх TCP для шлюзов serial-Ethernet.
+
+На каждый шлюз держится пул постоянных соединений. По Modbus TCP в одном
+соединении одновременно находятся несколько транзакций, ответы
+сопоставляются по transaction ID, поэтому сетевая задержка перекрывается,
+а не оплачивается на каждый регистр. В RTU поверх TCP идентификатора
+транзакции нет, поэтому в каждом соединении один запрос за раз, а
+параллельность даёт число соединений в пуле.
+
+GatewayClient повторяет интерфейс AsyncModbus*Client, который использует
+read_planner (read_holding_registers(address, count=, device_id=)), а
+SyncGatewayClient - интерфейс ModbusSerialClient для синхронных скриптов.
+"""
+
+import asyncio
+import itertools
+import logging
+import struct
+import threading
+
+from read_planner import read_plan_pipelined
+
+log = logging.getLogger(__name__)
+
+MBAP = struct.Struct('>HHHB')   # transaction id, protocol id, длина, unit
+# Длина в MBAP считает unit и PDU: код функции и до 252 байт данных
+MBAP_LENGTH = range(2, 255)
+READ_HOLDING = 0x03
+WRITE_REGISTER = 0x06
+
+
+def crc16(data):
+    """CRC-16/Modbus"""
+    crc = 0xffff
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xa001
+            else:
+                crc >>= 1
+    return crc
+
+
+class ModbusTransportError(Exception):
+    """Ошибка обмена со шлюзом (обрыв, таймаут, повреждённый кадр)"""
+
+    # Счётчик PollMetrics.counters, в который попадает ошибка
+    counter = "exceptions"
+
+
+class ModbusTimeoutError(ModbusTransportError):
+    """Шлюз или прибор не ответил за таймаут"""
+
+    counter = "timeouts"
+
+
+class ModbusFrameError(ModbusTransportError):
+    """Ответ пришёл, но кадр не принят (CRC, чужой unit)"""
+
+    counter = "crc_errors"
+
+
+class RegistersResult:
+    """Ответ в духе pymodbus: registers и isError()"""
+
+    def __init__(self, function_code, registers=None, exception_code=None):
+        self.function_code = function_code
+        self.registers = registers or []
+        self.exception_code = exception_code
+
+    def isError(self):
+        return self.exception_code is not None
+
+    def __repr__(self):
+        if self.isError():
+            return f"ExceptionResponse(fc={self.function_code:#x}, code={self.exception_code})"
+        return f"RegistersResult(registers={self.registers})"
+
+
+def _parse_pdu(pdu):
+    """Разбирает PDU ответа на 0x03/0x06"""
+    function_code = pdu[0]
+    if function_code & 0x80:
+        return RegistersResult(function_code & 0x7f, exception_code=pdu[1])
+    if function_code == READ_HOLDING:
+        count = pdu[1] // 2
+        return RegistersResult(function_code, list(struct.unpack_from(f'>{count}H', pdu, 2)))
+    if function_code == WRITE_REGISTER:
+        return RegistersResult(function_code, [struct.unpack_from('>H', pdu, 3)[0]])
+    raise ModbusTransportError(f"Неожиданная функция в ответе: {function_code:#x}")
+
+
+class TcpConnection:
+    """Соединение Modbus TCP с несколькими транзакциями в полёте"""
+
+    def __init__(self, host, port, timeout=1.0, max_in_flight=8):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.pending = {}
+        self.tids = itertools.cycle(range(1, 0x10000))
+        self.reader = self.writer = self.reader_task = None
+        self.in_flight = 0      # запросы, отданные этому соединению, включая ждущие слота
+
+    @property
+    def connected(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        self.reader_task = asyncio.create_task(self._read_responses())
+
+    async def _read_responses(self):
+        try:
+            while True:
+                header = await self.reader.readexactly(MBAP.size)
+                tid, protocol, length, _ = MBAP.unpack(header)
+                if protocol != 0 or length not in MBAP_LENGTH:
+                    # Границы кадров в потоке потеряны - только переподключение
+                    self._fail(ModbusFrameError(f"Повреждённый заголовок MBAP от {self.host}:{self.port}: "
+                                                f"protocol {protocol}, длина {length}"))
+                    return
+                pdu = await self.reader.readexactly(length - 1)
+                future = self.pending.pop(tid, None)
+                if future is None:
+                    log.debug("Ответ с неизвестным transaction id %d от %s:%d", tid, self.host, self.port)
+                elif not future.done():
+                    future.set_result(pdu)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+            self._fail(ModbusTransportError(f"Соединение с {self.host}:{self.port} разорвано: {e}"))
+
+    def _fail(self, error):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self.pending.clear()
+        self.close()
+
+    async def request(self, unit_id, pdu):
+        self.in_flight += 1
+        try:
+            async with self.slots:
+                if not self.connected:
+                    raise ModbusTransportError(f"Нет соединения с {self.host}:{self.port}")
+                tid = next(self.tids)
+                future = asyncio.get_running_loop().create_future()
+                self.pending[tid] = future
+                self.writer.write(MBAP.pack(tid, 0, len(pdu) + 1, unit_id) + pdu)
+                try:
+                    return await asyncio.wait_for(future, self.timeout)
+                except asyncio.TimeoutError:
+                    raise ModbusTimeoutError(f"Нет ответа от {self.host}:{self.port} (unit {unit_id})")
+                finally:
+                    self.pending.pop(tid, None)
+        finally:
+            self.in_flight -= 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.reader_task is not None and self.reader_task is not asyncio.current_task():
+            self.reader_task.cancel()
+
+
+class RtuOverTcpConnection:
+    """Соединение RTU поверх TCP: кадры с CRC, один запрос за раз"""
+
+    def __init__(self, host, port, timeout=1.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.lock = asyncio.Lock()
+        self.reader = self.writer = None
+        self.in_flight = 0
+
+    @property
+    def connected(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+
+    async def _read_frame(self, unit_id):
+        head = await self.reader.readexactly(3)
+        if head[1] & 0x80:
+            rest = await self.reader.readexactly(2)
+        elif head[1] == READ_HOLDING:
+            rest = await self.reader.readexactly(head[2] + 2)
+        else:
+            rest = await self.reader.readexactly(5)
+        frame = head + rest
+        if crc16(frame[:-2]) != struct.unpack('<H', frame[-2:])[0]:
+            raise ModbusFrameError("Ошибка CRC в ответе")
+        if frame[0] != unit_id:
+            raise ModbusFrameError(f"Ответ от unit {frame[0]} вместо {unit_id}")
+        return frame[1:-2]
+
+    async def request(self, unit_id, pdu):
+        self.in_flight += 1
+        try:
+            async with self.lock:
+                if not self.connected:
+                    raise ModbusTransportError(f"Нет соединения с {self.host}:{self.port}")
+                frame = bytes([unit_id]) + pdu
+                self.writer.write(frame + struct.pack('<H', crc16(frame)))
+                try:
+                    return await asyncio.wait_for(self._read_frame(unit_id), self.timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ModbusTransportError, OSError) as e:
+                    # Поток байтов мог рассинхронизироваться - соединение пересоздаётся
+                    self.close()
+                    if isinstance(e, ModbusTransportError):
+                        raise
+                    raise ModbusTimeoutError(f"Нет ответа от {self.host}:{self.port} (unit {unit_id}): {e!r}")
+        finally:
+            self.in_flight -= 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ConnectionPool:
+    """Пул постоянных соединений к одному шлюзу"""
+
+    def __init__(self, host, port, framer="tcp", size=2, timeout=1.0, max_in_flight=8):
+        self.host = host
+        self.port = port
+        self.framer = framer
+        self.size = size
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.connections = []
+        self.lock = asyncio.Lock()
+
+    def _new_connection(self):
+        if self.framer == "rtu":
+            return RtuOverTcpConnection(self.host, self.port, self.timeout)
+        return TcpConnection(self.host, self.port, self.timeout, self.max_in_flight)
+
+    async def acquire(self):
+        """Наименее загруженное живое соединение; недостающие открываются по требованию"""
+        async with self.lock:
+            self.connections = [connection for connection in self.connections if connection.connected]
+            idle = [connection for connection in self.connections if connection.in_flight == 0]
+            if idle:
+                return idle[0]
+            if len(self.connections) < self.size:
+                connection = self._new_connection()
+                await connection.connect()
+                self.connections.append(connection)
+                return connection
+            if not self.connections:
+                raise ModbusTransportError(f"Нет соединения с {self.host}:{self.port}")
+            return min(self.connections, key=lambda connection: connection.in_flight)
+
+    async def request(self, unit_id, pdu):
+        connection = await self.acquire()
+        return await connection.request(unit_id, pdu)
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+        self.connections.clear()
+
+
+class GatewayClient:
+    """Асинхронный клиент шлюза с интерфейсом AsyncModbus*Client"""
+
+    def __init__(self, host, port=502, framer="tcp", pool_size=2, timeout=1.0, max_in_flight=8):
+        self.pool = ConnectionPool(host, port, framer, pool_size, timeout, max_in_flight)
+
+    @property
+    def connected(self):
+        return any(connection.connected for connection in self.pool.connections)
+
+    async def connect(self):
+        try:
+            await self.pool.acquire()
+        except (OSError, asyncio.TimeoutError, ModbusTransportError) as e:
+            log.error("Не удалось подключиться к шлюзу %s:%d: %s", self.pool.host, self.pool.port, e)
+            return False
+        return True
+
+    async def read_holding_registers(self, address, count=1, device_id=1):
+        pdu = await self.pool.request(device_id, struct.pack('>BHH', READ_HOLDING, address, count))
+        return _parse_pdu(pdu)
+
+    async def write_register(self, address, value, device_id=1):
+        pdu = await self.pool.request(device_id, struct.pack('>BHH', WRITE_REGISTER, address, value))
+        return _parse_pdu(pdu)
+
+    async def read_plan(self, plan, unit_id=1, observe=None):
+        """Все блоки плана отправляются сразу и перекрываются по времени.
+
+        observe(адрес, длительность, ответ, исключение) вызывается после каждого блока.
+        """
+        return await read_plan_pipelined(self, plan, unit_id, observe)
+
+    def close(self):
+        self.pool.close()
+
+
+class SyncGatewayClient:
+    """Синхронная обёртка GatewayClient: цикл asyncio в фоновом потоке"""
+
+    def __init__(self, host, port=502, framer="tcp", pool_size=2, timeout=1.0, max_in_flight=8):
+        self.timeout = timeout
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="gateway-io", daemon=True)
+        self.thread.start()
+        self.client = self._call(self._create(host, port, framer, pool_size, timeout, max_in_flight))
+
+    @staticmethod
+    async def _create(*args):
+        # Примитивы asyncio создаются внутри своего цикла
+        return GatewayClient(*args)
+
+    def _call(self, coroutine, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def connect(self):
+        return self._call(self.client.connect())
+
+    def read_holding_registers(self, address, count=1, device_id=1):
+        return self._call(self.client.read_holding_registers(address, count=count, device_id=device_id))
+
+    def write_register(self, address, value, device_id=1):
+        return self._call(self.client.write_register(address, value, device_id=device_id))
+
+    def read_plan(self, plan, unit_id=1, observe=None):
+        return self._call(self.client.read_plan(plan, unit_id, observe))
+
+    async def _close(self):
+        self.client.close()
+        # Даёт отменённым задачам чтения завершиться до остановки цикла
+        await asyncio.sleep(0)
+
+    def close(self):
+        if self.loop.is_running():
+            self._call(self._close(), self.timeout)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(self.timeout)
+
+
+def make_client(cfg, port_cfg=None, sync=True):
+    """Клиент по настройкам "transport" конфига или None для последовательного порта.
+
+        "transport": {"type": "tcp" | "rtu_over_tcp", "host": "192.168.0.10", "port": 502,
+                      "pool_size": 2, "max_in_flight": 8, "timeout": 1}
+    """
+    transport = (port_cfg or {}).get("transport") or cfg.get("transport")
+    if not transport or transport.get("type", "serial") == "serial":
+        return None
+    framer = "rtu" if transport["type"] == "rtu_over_tcp" else "tcp"
+    client_class = SyncGatewayClient if sync else GatewayClient
+    return client_class(
+        transport["host"],
+        transport.get("port", 502),
+        framer,
+        transport.get("pool_size", 2),
+        transport.get("timeout", 1.0),
+        transport.get("max_in_flight", 8),
+    )
@@ -0,0 +1,92 @@
+"""Потоковая отправка изменений чек-листа в браузер (Server-Sent Events).
+
+Опрашивающий поток публикует только изменившиеся строки с номером версии,
+каждый открытый браузер получает эти изменения и применяет их на месте.
+Нагрузка зависит от числа изменений, а не от числа зрителей и строк.
+"""
+
+import json
+import threading
+from collections import deque
+
+# Сколько последних версий хранится для догоняющих клиентов
+HISTORY_SIZE = 256
+# Интервал комментария-пинга, чтобы прокси не закрывали соединение
+KEEPALIVE_SECONDS = 15
+
+
+class ChangeFeed:
+    """Лента изменений: версия, история последних изменений и ожидание новых"""
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        self.version = 0
+        self.history = deque(maxlen=history_size)
+        self.condition = threading.Condition()
+
+    def publish(self, rows, stats=None):
+        """Публикует изменившиеся строки, возвращает новую версию"""
+        with self.condition:
+            self.version += 1
+            self.history.append((self.version, rows, stats))
+            self.condition.notify_all()
+            return self.version
+
+    def reset(self):
+        """Сообщает клиентам, что чек-лист перестроен и страницу нужно перезагрузить"""
+        with self.condition:
+            self.version += 1
+            self.history.clear()
+            self.condition.notify_all()
+            return self.version
+
+    def changes_since(self, version):
+        """Изменения после version: (текущая версия, строки, статистика).
+
+        Если клиент отстал больше, чем хранится в истории, или его версия новее
+        текущей (браузер переподключился со старым Last-Event-ID после
+        перезапуска сервера), строки равны None - клиенту нужно перезагрузить
+        страницу целиком.
+        """
+        with self.condition:
+            return self._collect(version)
+
+    def _collect(self, version):
+        if version == self.version:
+            return self.version, [], None
+        if version > self.version:
+            return self.version, None, None
+        if not self.history or self.history[0][0] > version + 1:
+            return self.version, None, None
+
+        merged = {}
+        stats = None
+        for item_version, rows, item_stats in self.history:
+            if item_version <= version:
+                continue
+            for row in rows:
+                merged[row['id']] = row
+            if item_stats is not None:
+                stats = item_stats
+        return self.version, list(merged.values()), stats
+
+    def wait(self, version, timeout=KEEPALIVE_SECONDS):
+        """Ждёт версию, отличную от version, не дольше timeout секунд"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != version, timeout)
+            return self._collect(version)
+
+    def stream(self, version):
+        """Генератор SSE-сообщений, начиная с версии version"""
+        yield "retry: 2000\n\n"
+        while True:
+            new_version, rows, stats = self.wait(version)
+            if new_version == version:
+                yield ": keepalive\n\n"
+                continue
+
+            if rows is None:
+                payload = {'version': new_version, 'reload': True}
+            else:
+                payload = {'version': new_version, 'rows': rows, 'stats': stats}
+            version = new_version
+            yield f"id: {new_version}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"